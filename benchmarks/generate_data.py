@@ -0,0 +1,286 @@
+"""
+Generate participants, conversations and messages for benchmarks.
+
+The rows are built by PostgreSQL with INSERT ... SELECT over generate_series,
+so millions of messages take minutes rather than hours. The distributions
+follow the traffic of a business messaging service:
+
+- 1% of the participants are the hubs (the numbers and addresses of the
+  business) and are in 90% of the conversations, the busiest hubs the most.
+- The other participants are contacts, in one or a few conversations each.
+- Messages are spread over the conversations with a long tail: the busiest
+  1% of the conversations get about a fifth of the messages.
+- Messages arrive in time order over --days days, half of them inbound.
+  80% are SMS, 10% MMS with an attachment and 10% email.
+
+Ids are UUIDv7 built from the timestamp of each row, like messaging.ids.uuid7.
+The conversation summaries and memberships are filled in afterwards with
+the backfills of migration 0010.
+
+Uses the database configured in the Django settings, and refuses to add rows
+to a database with messages unless --reset empties the messaging tables:
+
+    python benchmarks/generate_data.py --messages 1000000 --reset
+"""
+
+import argparse
+import importlib
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "hatch_messaging.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.db import connection, transaction  # noqa: E402
+
+from messaging.models import (  # noqa: E402
+    Conversation,
+    ConversationParticipant,
+    Message,
+    Participant,
+    ProviderMessageKey,
+)
+
+MODELS = [Participant, Conversation, ConversationParticipant, Message]
+# Average number of messages per conversation and conversations per contact
+MESSAGES_PER_CONVERSATION = 20
+CONVERSATIONS_PER_CONTACT = 1.5
+BODY = (
+    "Hi! Your order has shipped and should arrive within 3-5 business days. "
+    "Reply STOP to unsubscribe, or reply HELP for help. Thanks for shopping "
+    "with us, we hope to see you again soon."
+)
+
+
+def uuid7_sql(timestamp):
+    """
+    SQL expression of a UUIDv7 for a timestamp expression: its milliseconds
+    replace the first 48 bits of a random UUID, and the version bits are set
+    from 4 to 7.
+    """
+    return (
+        "encode(set_bit(set_bit(overlay(uuid_send(gen_random_uuid()) placing "
+        f"substring(int8send(floor(extract(epoch FROM {timestamp}) * 1000)::bigint) "
+        "FROM 3) FROM 1 FOR 6), 52, 1), 53, 1), 'hex')::uuid"
+    )
+
+
+def reset():
+    """
+    Delete every participant, conversation and message.
+    """
+    tables = [model._meta.db_table for model in [*MODELS, ProviderMessageKey]]
+    with connection.cursor() as cursor:
+        cursor.execute(f"TRUNCATE {', '.join(tables)} CASCADE")
+
+
+def insert_participants(cursor, participants, start):
+    cursor.execute(
+        f"""
+        INSERT INTO messaging_participant (id, phone, email)
+        SELECT {uuid7_sql("%(start)s::timestamptz")},
+            '+1555' || lpad(n::text, 7, '0'), 'user' || n || '@example.com'
+        FROM generate_series(0, %(participants)s - 1) AS n
+        """,
+        {"participants": participants, "start": start},
+    )
+    cursor.execute("""
+        CREATE TEMPORARY TABLE benchmark_participant ON COMMIT DROP AS
+        SELECT (row_number() OVER (ORDER BY phone) - 1)::integer AS n, id
+        FROM messaging_participant
+        """)
+    cursor.execute("ALTER TABLE benchmark_participant ADD PRIMARY KEY (n)")
+
+
+def insert_conversations(cursor, conversations, hubs, participants, start):
+    # Participants of a conversation are sorted like in resolve_conversation,
+    # pairs drawn twice are skipped
+    cursor.execute(
+        f"""
+        INSERT INTO messaging_conversation
+            (id, participant_1_id, participant_2_id, last_activity, message_count)
+        SELECT {uuid7_sql("%(start)s::timestamptz")},
+            LEAST(a.id, b.id), GREATEST(a.id, b.id), %(start)s, 0
+        FROM (
+            SELECT
+                CASE WHEN random() < 0.9
+                    THEN floor(%(hubs)s * random() ^ 2)
+                    ELSE %(hubs)s + floor((%(participants)s - %(hubs)s) * random())
+                END AS a_n,
+                %(hubs)s + floor((%(participants)s - %(hubs)s) * random()) AS b_n
+            FROM generate_series(1, %(conversations)s)
+        ) AS pairs
+        JOIN benchmark_participant AS a ON a.n = pairs.a_n
+        JOIN benchmark_participant AS b ON b.n = pairs.b_n
+        WHERE a.id <> b.id
+        ON CONFLICT DO NOTHING
+        """,
+        {
+            "conversations": conversations,
+            "hubs": hubs,
+            "participants": participants,
+            "start": start,
+        },
+    )
+    cursor.execute("""
+        CREATE TEMPORARY TABLE benchmark_conversation ON COMMIT DROP AS
+        SELECT (row_number() OVER (ORDER BY id) - 1)::integer AS n,
+            id, participant_1_id, participant_2_id
+        FROM messaging_conversation
+        """)
+    cursor.execute("ALTER TABLE benchmark_conversation ADD PRIMARY KEY (n)")
+    cursor.execute("SELECT count(*) FROM benchmark_conversation")
+    return cursor.fetchone()[0]
+
+
+def insert_messages(cursor, first, last, messages, conversations, start, days):
+    """
+    Insert the messages numbered first to last - 1 of messages.
+    """
+    cursor.execute(
+        f"""
+        INSERT INTO messaging_message (
+            id, conversation_id, sender_id, recipient_id, message_type,
+            direction, provider_message_id, body, attachments, status,
+            "timestamp", created_at
+        )
+        SELECT {uuid7_sql("m.ts")}, c.id,
+            CASE WHEN m.inbound THEN c.participant_2_id ELSE c.participant_1_id END,
+            CASE WHEN m.inbound THEN c.participant_1_id ELSE c.participant_2_id END,
+            m.message_type,
+            CASE WHEN m.inbound THEN 'INCOMING' ELSE 'OUTGOING' END,
+            CASE WHEN m.inbound THEN 'benchmark-' || m.i END,
+            left(%(body)s, 20 + floor(m.r_length * 140)::integer),
+            CASE WHEN m.message_type = 'mms'
+                THEN '["https://example.com/image.png"]'::jsonb END,
+            CASE WHEN m.inbound THEN 'RECIEVED'
+                WHEN m.r_status < 0.01 THEN 'FAILED' ELSE 'SENT' END,
+            m.ts, m.ts
+        FROM (
+            SELECT i,
+                floor(%(conversations)s * random() ^ 3)::integer AS conversation_n,
+                random() < 0.5 AS inbound,
+                CASE WHEN r_type < 0.8 THEN 'sms'
+                    WHEN r_type < 0.9 THEN 'mms' ELSE 'email' END AS message_type,
+                random() AS r_length,
+                random() AS r_status,
+                %(start)s::timestamptz
+                    + (i + random()) / %(messages)s * %(days)s * interval '1 day'
+                    AS ts
+            FROM generate_series(%(first)s, %(last)s - 1) AS i,
+                LATERAL (SELECT random() + 0 * i AS r_type) AS r
+        ) AS m
+        JOIN benchmark_conversation AS c ON c.n = m.conversation_n
+        """,
+        {
+            "body": BODY,
+            "conversations": conversations,
+            "days": days,
+            "first": first,
+            "last": last,
+            "messages": messages,
+            "start": start,
+        },
+    )
+
+
+def generate(messages, days=90, batch_size=1000000, seed=0.5, log=None):
+    """
+    Fill the messaging tables with about `messages` messages, and as many
+    conversations and participants as their averages give.
+
+    :param days: The messages are spread over the last `days` days.
+    :param batch_size: Messages inserted per statement.
+    :param seed: Seed of random(), between -1 and 1, so runs draw the same
+        distribution.
+    :param log: Called with a progress message, if given.
+    :return: A dict with the number of rows of each table and the elapsed
+        seconds.
+    """
+    log = log or (lambda message: None)
+    conversations = max(messages // MESSAGES_PER_CONVERSATION, 1)
+    contacts = max(round(conversations / CONVERSATIONS_PER_CONTACT), 2)
+    hubs = max(contacts // 99, 1)
+    participants = hubs + contacts
+
+    started = time.perf_counter()
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT now() - %s * interval '1 day'", [days])
+        (start,) = cursor.fetchone()
+        # The temporary tables live until the end of the transaction
+        with transaction.atomic():
+            cursor.execute("SELECT setseed(%s)", [seed])
+            log(f"Inserting {participants} participants")
+            insert_participants(cursor, participants, start)
+            log(f"Inserting {conversations} conversations")
+            conversations = insert_conversations(
+                cursor, conversations, hubs, participants, start
+            )
+            for first in range(0, messages, batch_size):
+                last = min(first + batch_size, messages)
+                log(f"Inserting messages {first} to {last}")
+                insert_messages(
+                    cursor, first, last, messages, conversations, start, days
+                )
+
+        log("Filling conversation summaries and memberships")
+        migration = importlib.import_module(
+            "messaging.migrations.0010_backfill_conversations"
+        )
+        # Memberships copy the last_activity of the summaries
+        for sql in [migration.SUMMARIES_SQL, migration.MEMBERSHIPS_SQL]:
+            migration.backfill(connection, sql)
+        if settings.MESSAGING_PARTITIONED_MESSAGES:
+            cursor.execute("""
+                INSERT INTO messaging_providermessagekey
+                    (provider_message_id, message_id, created_at)
+                SELECT provider_message_id, id, created_at
+                FROM messaging_message WHERE provider_message_id IS NOT NULL
+                """)
+
+        log("Vacuuming")
+        counts = {}
+        for model in MODELS:
+            table = model._meta.db_table
+            cursor.execute(f"VACUUM ANALYZE {table}")
+            cursor.execute(f"SELECT count(*) FROM {table}")
+            counts[table] = cursor.fetchone()[0]
+    return {"rows": counts, "seconds": round(time.perf_counter() - started, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--batch-size", type=int, default=1000000)
+    parser.add_argument("--seed", type=float, default=0.5)
+    parser.add_argument(
+        "--reset",
+        action="store_true",
+        help="Delete every participant, conversation and message first.",
+    )
+    args = parser.parse_args()
+
+    if args.reset:
+        reset()
+    elif Message.objects.exists():
+        parser.error("the database already has messages, use --reset")
+    report = generate(
+        args.messages,
+        days=args.days,
+        batch_size=args.batch_size,
+        seed=args.seed,
+        log=lambda message: print(message, file=sys.stderr),
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
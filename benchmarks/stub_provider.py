@@ -0,0 +1,293 @@
+"""
+Stub of the text and email provider APIs, to load test outbound delivery.
+
+A plain ASGI application served by uvicorn. It answers
+POST /api/messages (text provider) and POST /api/email (email provider)
+like the real providers, with:
+
+- a latency drawn from --latency, e.g. "fixed:20", "uniform:10,50",
+  "exponential:30" or "lognormal:40,0.6" (median and sigma), in
+  milliseconds,
+- --error-rate of the requests failing with --error-status,
+- 429 responses with a Retry-After header of --retry-after seconds once
+  more than --rate-limit requests per second are received (per worker),
+- with --inbound-url, --reply-rate of the messages answered by the
+  recipient after --reply-delay seconds, posted to the inbound webhooks.
+
+GET /stats returns the number of responses per status of the worker.
+Point the service at it with the provider URL settings, e.g.:
+
+    python benchmarks/stub_provider.py --port 9000 --latency lognormal:40,0.6 \\
+        --error-rate 0.01 --rate-limit 2000 \\
+        --inbound-url http://localhost:8000/messaging/ --reply-rate 0.1
+    MESSAGING_TEXT_PROVIDER_URL=http://localhost:9000/api/messages \\
+    MESSAGING_EMAIL_PROVIDER_URL=http://localhost:9000/api/email ...
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timezone
+
+import httpx
+import uvicorn
+
+# Options of the workers, set by main
+OPTIONS_VARIABLE = "STUB_PROVIDER_OPTIONS"
+
+DISTRIBUTIONS = {
+    "fixed": lambda value: lambda: value,
+    "uniform": lambda low, high: lambda: random.uniform(low, high),
+    "exponential": lambda mean: lambda: random.expovariate(1 / mean) if mean else 0,
+    # The median of a log-normal distribution is exp(mu)
+    "lognormal": lambda median, sigma: lambda: random.lognormvariate(
+        math.log(median), sigma
+    ),
+}
+
+# Inbound webhook of each API, and the payload field of the provider id
+WEBHOOKS = {
+    "/api/messages": ("webhook/text/inbound/", "messaging_provider_id"),
+    "/api/email": ("webhook/email/inbound", "xillio_id"),
+}
+
+
+def parse_latency(value):
+    """
+    Parse a latency distribution, "<name>:<parameter>[,<parameter>]".
+
+    :return: A function returning a latency in seconds.
+    :raises ValueError: If the distribution is unknown or its parameters
+        invalid.
+    """
+    name, _, parameters = value.partition(":")
+    if name not in DISTRIBUTIONS:
+        raise ValueError(f"Unknown distribution {name!r}")
+    sample = DISTRIBUTIONS[name](
+        *[float(parameter) for parameter in parameters.split(",") if parameter]
+    )
+    return lambda: max(sample(), 0) / 1000
+
+
+class RateLimiter:
+    """
+    Token bucket of `rate` requests per second, with a burst of one second.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+
+    def allow(self):
+        now = time.monotonic()
+        self.tokens = min(self.tokens + (now - self.updated) * self.rate, self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class StubProvider:
+    """
+    ASGI application of the stub provider, see the module docstring.
+    """
+
+    def __init__(
+        self,
+        latency="fixed:0",
+        error_rate=0,
+        error_status=500,
+        rate_limit=None,
+        retry_after=1,
+        inbound_url=None,
+        reply_rate=0,
+        reply_delay=1,
+        seed=None,
+    ):
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.rate_limiter = RateLimiter(rate_limit) if rate_limit else None
+        self.retry_after = retry_after
+        self.inbound_url = inbound_url
+        self.reply_rate = reply_rate
+        self.reply_delay = reply_delay
+        self.stats = {}
+        self.client = None
+        self.replies = set()
+        if seed is not None:
+            random.seed(seed)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self.handle(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                if self.inbound_url:
+                    self.client = httpx.AsyncClient(base_url=self.inbound_url)
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self.client is not None:
+                    await self.client.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def handle(self, scope, receive, send):
+        body = b""
+        more = True
+        while more:
+            message = await receive()
+            body += message.get("body", b"")
+            more = message.get("more_body", False)
+
+        path, method = scope["path"].rstrip("/"), scope["method"]
+        if path == "/stats" and method == "GET":
+            return await self.respond(send, 200, self.stats)
+        if path not in WEBHOOKS:
+            return await self.respond(send, 404, {"error": "Not found"})
+        if method != "POST":
+            return await self.respond(send, 405, {"error": "Method not allowed"})
+        status, content, headers = await self.answer(path, body)
+        self.count(str(status))
+        await self.respond(send, status, content, headers)
+
+    async def answer(self, path, body):
+        """
+        Answer a request to a provider API.
+
+        :return: The status, content and extra headers of the response.
+        """
+        if self.rate_limiter is not None and not self.rate_limiter.allow():
+            return (
+                429,
+                {"error": "Too many requests"},
+                [(b"retry-after", str(self.retry_after).encode())],
+            )
+        await asyncio.sleep(self.latency())
+        if random.random() < self.error_rate:
+            return self.error_status, {"error": "Provider error"}, []
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return 400, {"error": "Invalid JSON"}, []
+
+        if self.client is not None and random.random() < self.reply_rate:
+            reply = asyncio.create_task(self.reply(path, payload))
+            # Keep a reference until the task is done
+            self.replies.add(reply)
+            reply.add_done_callback(self.replies.discard)
+        return 200, {"id": str(uuid.uuid4()), "status": "queued"}, []
+
+    async def reply(self, path, payload):
+        """
+        Post the answer of the recipient of a message to the inbound webhook
+        of its API.
+        """
+        await asyncio.sleep(self.reply_delay)
+        webhook, id_field = WEBHOOKS[path]
+        reply = {
+            "to": payload.get("from"),
+            "from": payload.get("to"),
+            "type": payload.get("type", "email"),
+            "body": f"Re: {payload.get('body', '')}"[:1000],
+            id_field: f"stub-{uuid.uuid4()}",
+            "attachments": None,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+        }
+        try:
+            response = await self.client.post(webhook, json=reply)
+            self.count(f"reply_{response.status_code}")
+        except httpx.HTTPError:
+            self.count("reply_error")
+
+    async def respond(self, send, status, content, headers=()):
+        body = json.dumps(content).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    *headers,
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+    def count(self, key):
+        self.stats[key] = self.stats.get(key, 0) + 1
+
+
+def create_app():
+    """
+    Application factory of the uvicorn workers, configured by main through
+    the STUB_PROVIDER_OPTIONS environment variable.
+    """
+    return StubProvider(**json.loads(os.environ.get(OPTIONS_VARIABLE, "{}")))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--latency", default="fixed:0")
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        help="Requests per second per worker before answering 429.",
+    )
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument(
+        "--inbound-url",
+        help="Base URL of the messaging API, e.g. http://localhost:8000/messaging/",
+    )
+    parser.add_argument("--reply-rate", type=float, default=0)
+    parser.add_argument("--reply-delay", type=float, default=1)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    try:
+        parse_latency(args.latency)
+    except (TypeError, ValueError) as e:
+        parser.error(f"invalid --latency: {e}")
+    options = {
+        "latency": args.latency,
+        "error_rate": args.error_rate,
+        "error_status": args.error_status,
+        "rate_limit": args.rate_limit,
+        "retry_after": args.retry_after,
+        "inbound_url": args.inbound_url,
+        "reply_rate": args.reply_rate,
+        "reply_delay": args.reply_delay,
+        "seed": args.seed,
+    }
+    os.environ[OPTIONS_VARIABLE] = json.dumps(options)
+    uvicorn.run(
+        "stub_provider:create_app",
+        factory=True,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        access_log=False,
+        log_level="warning",
+    )
+
+
+if __name__ == "__main__":
+    main()
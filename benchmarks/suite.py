@@ -0,0 +1,408 @@
+"""
+Benchmark suite for inbound webhooks, sends and conversation timelines.
+
+For each scale (number of messages), fills a dedicated database with
+generate_data.py and measures, in process:
+
+- inbound: messages per second and latency of the inbound text webhook,
+  from known and new contacts.
+- send: messages per second of the send_message task, end to end (claim,
+  provider request, status update), and of the delivery engine used by
+  send_message_batch. Providers are replaced by an in-process stub
+  answering after --provider-latency milliseconds, or with --provider-url
+  by a benchmarks/stub_provider.py server with its latencies, errors and
+  rate limits.
+- timeline: latency of ConversationMessagesView for the first page and a
+  deep page of the busiest conversation, and for random conversations.
+
+The database is the configured one with a "_benchmark" suffix, created and
+migrated if needed and kept between runs: a scale whose data is already
+there is not generated again unless --regenerate is given. The report is
+written as JSON, to compare runs:
+
+    python benchmarks/suite.py --scales 10000 1000000 10000000 \\
+        --output results.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "hatch_messaging.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+import httpx  # noqa: E402
+from django.conf import settings  # noqa: E402
+from django.db import connection, transaction  # noqa: E402
+from django.db.models import Count  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import override_settings, setup_test_environment  # noqa: E402
+from django.urls import reverse  # noqa: E402
+
+from generate_data import generate, reset  # noqa: E402
+from messaging import summaries  # noqa: E402
+from messaging.delivery import DeliveryEngine  # noqa: E402
+from messaging.models import Conversation, Message, Participant  # noqa: E402
+from messaging.pagination import TimelinePagination  # noqa: E402
+from messaging.tasks import send_message  # noqa: E402
+
+
+def summarize(latencies, elapsed):
+    """
+    :param latencies: Latency of each operation, in seconds.
+    :param elapsed: Total duration of the operations, in seconds.
+    :return: A dict with the count, throughput and latency percentiles in
+        milliseconds.
+    """
+    percentiles = (
+        statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    )
+    return {
+        "count": len(latencies),
+        "seconds": round(elapsed, 3),
+        "per_second": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "latency_ms": {
+            "p50": round(percentiles[49] * 1000, 2) if latencies else None,
+            "p95": round(percentiles[94] * 1000, 2) if latencies else None,
+            "p99": round(percentiles[98] * 1000, 2) if latencies else None,
+        },
+    }
+
+
+def timed(operation, count):
+    """
+    Run operation count times.
+
+    :return: The summary of the latencies, see summarize.
+    """
+    latencies = []
+    started = time.perf_counter()
+    for i in range(count):
+        start = time.perf_counter()
+        operation(i)
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def use_benchmark_database():
+    """
+    Switch the default connection to the benchmark database, creating and
+    migrating it if needed. Existing rows are kept.
+    """
+    connection.settings_dict["TEST"]["NAME"] = (
+        connection.settings_dict["NAME"] + "_benchmark"
+    )
+    connection.creation.create_test_db(verbosity=0, keepdb=True, serialize=False)
+
+
+def participant_phone(n):
+    # Phone numbers of generate_data
+    return f"+1555{n:07d}"
+
+
+def bench_inbound(client, count):
+    """
+    Post inbound texts from random participants to the hubs, a quarter of
+    them from new contacts.
+    """
+    participants = Participant.objects.count()
+    hubs = max(participants // 100, 1)
+    statuses = {}
+
+    def post(i):
+        sender = (
+            f"+1556{i:07d}"
+            if i % 4 == 0
+            else participant_phone(random.randrange(participants))
+        )
+        response = client.post(
+            reverse("text_inbound_webhook"),
+            {
+                "to": participant_phone(random.randrange(hubs)),
+                "from": sender,
+                "type": "sms",
+                "body": "Benchmark message",
+                "messaging_provider_id": f"benchmark-inbound-{uuid.uuid4()}",
+            },
+            content_type="application/json",
+        )
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    result = timed(post, count)
+    result["status_codes"] = {str(code): n for code, n in sorted(statuses.items())}
+    return result
+
+
+def queue_messages(count):
+    """
+    Create count QUEUED outbound texts in random conversations.
+
+    :return: Their ids.
+    """
+    conversations = list(
+        Conversation.objects.order_by("?")
+        .select_related("participant_1", "participant_2")
+        .filter(participant_1__phone__isnull=False, participant_2__phone__isnull=False)[
+            : min(count, 1000)
+        ]
+    )
+    with transaction.atomic():
+        messages = Message.objects.bulk_create(
+            [
+                Message(
+                    conversation=conversation,
+                    sender=conversation.participant_1,
+                    recipient=conversation.participant_2,
+                    message_type="sms",
+                    direction="OUTGOING",
+                    body="Benchmark message",
+                    status="QUEUED",
+                    timestamp=datetime.now(timezone.utc),
+                )
+                for conversation in random.choices(conversations, k=count)
+            ]
+        )
+        summaries.add_messages(messages)
+    return [message.id for message in messages]
+
+
+def delete_messages(queryset):
+    """
+    Delete the messages added by a benchmark, so the next runs of the scale
+    find the generated data only.
+    """
+    with transaction.atomic():
+        pairs = list(queryset.select_for_update().values_list("conversation_id", "id"))
+        queryset.filter(id__in=[message_id for _, message_id in pairs]).delete()
+        summaries.remove_messages(pairs)
+
+
+def stub_response(request):
+    return httpx.Response(200, json={"id": str(uuid.uuid4()), "status": "queued"})
+
+
+@contextmanager
+def stub_providers(provider_latency, provider_url):
+    """
+    Send the provider requests to the server of benchmarks/stub_provider.py
+    at provider_url, or to an in-process stub answering after
+    provider_latency milliseconds.
+    """
+    if provider_url:
+        base_url = provider_url.rstrip("/")
+        with override_settings(
+            MESSAGING_TEXT_PROVIDER_URL=f"{base_url}/api/messages",
+            MESSAGING_EMAIL_PROVIDER_URL=f"{base_url}/api/email",
+        ):
+            yield
+        return
+
+    delay = provider_latency / 1000
+
+    def handler(request):
+        time.sleep(delay)
+        return stub_response(request)
+
+    async def async_handler(request):
+        await asyncio.sleep(delay)
+        return stub_response(request)
+
+    with httpx.Client(transport=httpx.MockTransport(handler)) as client:
+        with mock.patch(
+            "messaging.providers.base.get_client", lambda base_url, timeout: client
+        ), mock.patch(
+            "messaging.delivery.create_async_client",
+            lambda max_connections, timeout: httpx.AsyncClient(
+                transport=httpx.MockTransport(async_handler)
+            ),
+        ):
+            yield
+
+
+def bench_send(count, concurrency):
+    """
+    Send count messages with the send_message task, run eagerly, then count
+    messages with the delivery engine. Retries of the task run at once, those
+    of the engine are left RETRYING.
+    """
+    results = {}
+    message_ids = queue_messages(count)
+    results["send_message"] = timed(
+        lambda i: send_message.apply(args=[str(message_ids[i])]), count
+    )
+
+    message_ids = queue_messages(count)
+    with DeliveryEngine(concurrency=concurrency) as engine:
+        started = time.perf_counter()
+        batch_size = settings.MESSAGING_DELIVERY_BATCH_SIZE
+        for start in range(0, count, batch_size):
+            engine.deliver(message_ids[start : start + batch_size])
+        elapsed = time.perf_counter() - started
+    results["delivery_engine"] = {
+        "count": count,
+        "seconds": round(elapsed, 3),
+        "per_second": round(count / elapsed, 1),
+    }
+    messages = Message.objects.filter(body="Benchmark message")
+    results["statuses"] = dict(
+        messages.values_list("status").annotate(Count("id")).order_by("status")
+    )
+    delete_messages(messages)
+    return results
+
+
+def bench_timeline(client, count, page_size):
+    """
+    Read pages of conversation timelines: the first and a deep page of the
+    busiest conversation, and the first page of random conversations.
+    """
+    busiest = Conversation.objects.order_by("-message_count").first()
+    conversation_ids = list(
+        Conversation.objects.filter(message_count__gt=0)
+        .order_by("?")
+        .values_list("id", flat=True)[:count]
+    )
+
+    def url(conversation_id):
+        return reverse("conversation-messages", args=[conversation_id])
+
+    query = {"page_size": page_size}
+    # A cursor half way through the busiest conversation
+    middle = (
+        Message.objects.filter(conversation=busiest)
+        .order_by("timestamp", "id")
+        .values_list("timestamp", "id")[busiest.message_count // 2]
+    )
+    deep = dict(query, cursor=TimelinePagination().encode_cursor(list(middle)))
+
+    def get(path, params):
+        response = client.get(path, params)
+        assert response.status_code == 200, response.status_code
+
+    return {
+        "busiest_conversation_messages": busiest.message_count,
+        "first_page": timed(lambda i: get(url(busiest.id), query), count),
+        "deep_page": timed(lambda i: get(url(busiest.id), deep), count),
+        "random_conversations": timed(
+            lambda i: get(url(conversation_ids[i % len(conversation_ids)]), query),
+            count,
+        ),
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    with connection.cursor() as cursor:
+        cursor.execute("SHOW server_version")
+        (server_version,) = cursor.fetchone()
+    return {
+        "date": datetime.now(timezone.utc).isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "postgresql": server_version,
+        "partitioned_messages": settings.MESSAGING_PARTITIONED_MESSAGES,
+        "inbound_buffer": settings.MESSAGING_INBOUND_BUFFER,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--scales", type=int, nargs="+", default=[10000, 1000000, 10000000]
+    )
+    parser.add_argument(
+        "--benchmarks",
+        nargs="+",
+        choices=["inbound", "send", "timeline"],
+        default=["inbound", "send", "timeline"],
+    )
+    parser.add_argument("--inbound-requests", type=int, default=2000)
+    parser.add_argument("--sends", type=int, default=2000)
+    parser.add_argument("--timeline-requests", type=int, default=500)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument(
+        "--provider-latency",
+        type=float,
+        default=0,
+        help="Milliseconds the in-process stub provider waits before answering.",
+    )
+    parser.add_argument(
+        "--provider-url",
+        help="URL of a benchmarks/stub_provider.py server to send to instead, "
+        "e.g. http://localhost:9000",
+    )
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--regenerate",
+        action="store_true",
+        help="Generate the data of every scale, even if already there.",
+    )
+    parser.add_argument("--output", help="File to write the report to.")
+    args = parser.parse_args()
+
+    setup_test_environment()
+    use_benchmark_database()
+    client = Client()
+    report = {"environment": environment(), "arguments": vars(args), "scales": {}}
+
+    for scale in args.scales:
+        random.seed(args.seed)
+        results = {}
+        if args.regenerate or Message.objects.count() != scale:
+            print(f"Generating {scale} messages", file=sys.stderr)
+            reset()
+            results["data"] = generate(
+                scale, log=lambda message: print(message, file=sys.stderr)
+            )
+        if "timeline" in args.benchmarks:
+            print("Timeline", file=sys.stderr)
+            results["timeline"] = bench_timeline(
+                client, args.timeline_requests, args.page_size
+            )
+        if "send" in args.benchmarks:
+            print("Send", file=sys.stderr)
+            with stub_providers(args.provider_latency, args.provider_url):
+                results["send"] = bench_send(args.sends, args.concurrency)
+        # Last, as it adds messages to the scale
+        if "inbound" in args.benchmarks:
+            print("Inbound", file=sys.stderr)
+            results["inbound"] = bench_inbound(client, args.inbound_requests)
+            delete_messages(
+                Message.objects.filter(
+                    provider_message_id__startswith="benchmark-inbound-"
+                )
+            )
+            Participant.objects.filter(phone__startswith="+1556").delete()
+        report["scales"][str(scale)] = results
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
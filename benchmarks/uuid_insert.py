@@ -0,0 +1,92 @@
+"""
+Insert benchmark of uuid4 against uuid7 primary keys on PostgreSQL.
+
+Creates a scratch table per generator, with a UUID primary key and a body
+column like messaging_message, inserts the same number of rows in batches
+and reports the throughput, the size of the primary key index and the WAL
+written, as JSON. The tables are dropped afterwards.
+
+Uses the database configured in the Django settings:
+
+    python benchmarks/uuid_insert.py --rows 500000 --batch-size 1000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "hatch_messaging.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+
+from messaging.ids import uuid7  # noqa: E402
+
+GENERATORS = {"uuid4": uuid.uuid4, "uuid7": uuid7}
+
+
+def run(name, generate, rows, batch_size):
+    """
+    Insert rows into a fresh table with ids from generate.
+
+    :return: A dict with the elapsed time, the rows per second, the size of
+        the primary key index and the WAL written, in bytes.
+    """
+    table = f"benchmark_{name}"
+    body = "x" * 200
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {table}")
+        cursor.execute(f"CREATE TABLE {table} (id uuid PRIMARY KEY, body text)")
+        # Needs the pg_checkpoint role or a superuser
+        cursor.execute("CHECKPOINT")
+        cursor.execute("SELECT pg_current_wal_lsn()")
+        (start_lsn,) = cursor.fetchone()
+
+        values = ", ".join(["(%s, %s)"] * batch_size)
+        start = time.perf_counter()
+        for _ in range(rows // batch_size):
+            params = []
+            for _ in range(batch_size):
+                params += [generate(), body]
+            cursor.execute(f"INSERT INTO {table} (id, body) VALUES {values}", params)
+        elapsed = time.perf_counter() - start
+
+        cursor.execute(
+            "SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), %s), pg_relation_size(%s)",
+            [start_lsn, f"{table}_pkey"],
+        )
+        wal_bytes, index_bytes = cursor.fetchone()
+        cursor.execute(f"DROP TABLE {table}")
+
+    inserted = rows // batch_size * batch_size
+    return {
+        "rows": inserted,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(inserted / elapsed),
+        "index_bytes": index_bytes,
+        "wal_bytes": int(wal_bytes),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    report = {
+        name: run(name, generate, args.rows, args.batch_size)
+        for name, generate in GENERATORS.items()
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Load test comparing the sync and async inbound text webhooks.
+
+Posts unique messages to each webhook path at a fixed concurrency and reports
+throughput and latency percentiles as JSON. With --upload-delay the body is
+sent in chunks spaced by that many seconds, like a slow provider connection,
+which is where the async path should hold up better than the sync one.
+
+Run it against a server started with gunicorn.conf.py, e.g.:
+
+    python benchmarks/webhook_load.py --base-url http://localhost:8000 \\
+        --requests 5000 --concurrency 500 --upload-delay 0.5
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+
+import httpx
+
+PATHS = {
+    "sync": "/messaging/webhook/text/inbound/",
+    "async": "/messaging/webhook/text/inbound/async/",
+}
+
+
+def build_payload():
+    return {
+        "to": "+15550000000",
+        "from": f"+1555{uuid.uuid4().int % 10**7:07d}",
+        "type": "sms",
+        "body": "Load test message",
+        "messaging_provider_id": f"load-{uuid.uuid4()}",
+        "attachments": None,
+    }
+
+
+async def slow_body(content, chunks, delay):
+    size = -(-len(content) // chunks)
+    for start in range(0, len(content), size):
+        if start:
+            await asyncio.sleep(delay)
+        yield content[start : start + size]
+
+
+async def post_message(client, url, upload_delay):
+    content = json.dumps(build_payload()).encode()
+    headers = {"Content-Type": "application/json"}
+    if upload_delay:
+        headers["Content-Length"] = str(len(content))
+        content = slow_body(content, 2, upload_delay)
+    start = time.perf_counter()
+    try:
+        response = await client.post(url, content=content, headers=headers)
+        ok = response.status_code in (200, 201)
+    except httpx.HTTPError:
+        ok = False
+    return ok, time.perf_counter() - start
+
+
+async def run(url, requests, concurrency, upload_delay, timeout):
+    """
+    Send `requests` messages to url, with at most `concurrency` in flight.
+
+    :return: A dict with the number of requests and errors, the throughput and
+        the latency percentiles in milliseconds.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(
+        max_connections=concurrency, max_keepalive_connections=concurrency
+    )
+
+    async def bounded(client):
+        async with semaphore:
+            return await post_message(client, url, upload_delay)
+
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        start = time.perf_counter()
+        results = await asyncio.gather(*(bounded(client) for _ in range(requests)))
+        elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for ok, latency in results if ok)
+    percentiles = (
+        statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    )
+    return {
+        "requests": requests,
+        "errors": sum(not ok for ok, _ in results),
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(requests / elapsed, 1),
+        "latency_ms": {
+            "p50": round(percentiles[49] * 1000, 1) if latencies else None,
+            "p95": round(percentiles[94] * 1000, 1) if latencies else None,
+            "p99": round(percentiles[98] * 1000, 1) if latencies else None,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument(
+        "--upload-delay",
+        type=float,
+        default=0,
+        help="Seconds between the two halves of each request body.",
+    )
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument(
+        "--paths",
+        nargs="+",
+        choices=sorted(PATHS),
+        default=["sync", "async"],
+        help="Webhook paths to compare.",
+    )
+    args = parser.parse_args()
+
+    report = {}
+    for name in args.paths:
+        report[name] = asyncio.run(
+            run(
+                args.base_url.rstrip("/") + PATHS[name],
+                args.requests,
+                args.concurrency,
+                args.upload_delay,
+                args.timeout,
+            )
+        )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Gunicorn configuration serving the ASGI application with Uvicorn workers:
+
+    gunicorn hatch_messaging.asgi:application -c gunicorn.conf.py
+
+Each worker process runs one event loop. The async webhook views hold their
+connections on that loop, so worker_connections (not the number of threads)
+bounds how many slow provider requests a worker serves at once.
+
+With PROMETHEUS_MULTIPROC_DIR set, the workers write their metrics there and
+/metrics adds them up, see messaging.metrics.
+"""
+
+import os
+
+from messaging import metrics
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+worker_class = "uvicorn_worker.UvicornWorker"
+workers = int(os.getenv("GUNICORN_WORKERS", "4"))
+# Uvicorn's limit_concurrency, connections above it get a 503
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "4000"))
+# Longer than the idle timeout of the load balancer in front of the service
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "75"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+# Restart workers from time to time, spread so they don't all restart at once
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "100000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "10000"))
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-")
+
+
+def on_starting(server):
+    # Samples of the previous run of the service
+    metrics.reset_multiprocess_dir()
+
+
+def child_exit(server, worker):
+    metrics.mark_process_dead(worker.pid)
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
 from pathlib import Path
+from celery.schedules import crontab
 import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -132,6 +133,228 @@ STATIC_URL = "/static/"
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# Django REST framework
+# List endpoints use keyset (cursor) pagination, see messaging.pagination
+REST_FRAMEWORK = {
+    "DEFAULT_PAGINATION_CLASS": "messaging.pagination.KeysetPagination",
+    "PAGE_SIZE": 50,
+}
+
 # celery broker
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER")
 CELERY_RESULT_BACKEND = os.getenv("CELERY_BACKEND")
+# Periodic tasks, run by `celery -A hatch_messaging beat`
+CELERY_BEAT_SCHEDULE = {
+    "archive-old-messages": {
+        "task": "messaging.tasks.archive_old_messages",
+        "schedule": crontab(hour=3, minute=0),
+    },
+    "reclaim-stalled-messages": {
+        "task": "messaging.tasks.reclaim_stalled_messages",
+        "schedule": crontab(),
+    },
+}
+
+# Redis instance used by the messaging app, the Celery broker by default
+MESSAGING_REDIS_URL = os.getenv("MESSAGING_REDIS_URL", CELERY_BROKER_URL)
+
+# Caches
+# "resolution" is the shared tier of the participant/conversation resolution
+# cache, see messaging.cache
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "resolution": (
+        {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": MESSAGING_REDIS_URL,
+            "KEY_PREFIX": "resolution",
+            "TIMEOUT": 24 * 60 * 60,
+        }
+        if MESSAGING_REDIS_URL
+        else {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}
+    ),
+}
+
+# messaging
+# Maximum number of messages accepted by the batch inbound webhooks
+MESSAGING_INBOUND_BATCH_MAX_SIZE = int(
+    os.getenv("MESSAGING_INBOUND_BATCH_MAX_SIZE", "1000")
+)
+
+# Endpoints of the provider APIs, e.g. benchmarks/stub_provider.py for load tests
+MESSAGING_TEXT_PROVIDER_URL = os.getenv(
+    "MESSAGING_TEXT_PROVIDER_URL", "https://www.provider.app/api/messages"
+)
+MESSAGING_EMAIL_PROVIDER_URL = os.getenv(
+    "MESSAGING_EMAIL_PROVIDER_URL", "https://www.mailplus.app/api/email"
+)
+
+# Connection pool of the provider HTTP clients, shared per process
+MESSAGING_HTTP_MAX_CONNECTIONS = int(os.getenv("MESSAGING_HTTP_MAX_CONNECTIONS", "100"))
+MESSAGING_HTTP_MAX_KEEPALIVE_CONNECTIONS = int(
+    os.getenv("MESSAGING_HTTP_MAX_KEEPALIVE_CONNECTIONS", "20")
+)
+MESSAGING_HTTP_KEEPALIVE_EXPIRY = float(
+    os.getenv("MESSAGING_HTTP_KEEPALIVE_EXPIRY", "30")
+)
+MESSAGING_HTTP2 = os.getenv("MESSAGING_HTTP2", "false").lower() in ("1", "true", "yes")
+
+# Asyncio delivery engine, see messaging.delivery
+MESSAGING_DELIVERY_CONCURRENCY = int(os.getenv("MESSAGING_DELIVERY_CONCURRENCY", "200"))
+MESSAGING_DELIVERY_BATCH_SIZE = int(os.getenv("MESSAGING_DELIVERY_BATCH_SIZE", "500"))
+# Longest wait for a rate limit slot on the event loop, in seconds, later
+# slots are sent by send_message tasks
+MESSAGING_DELIVERY_MAX_WAIT = float(os.getenv("MESSAGING_DELIVERY_MAX_WAIT", "1"))
+# Seconds after which a message still SENDING is sent again, longer than any
+# delivery batch takes, see messaging.tasks.reclaim_stalled_messages
+MESSAGING_SENDING_TIMEOUT = float(os.getenv("MESSAGING_SENDING_TIMEOUT", "900"))
+
+# Retries of failed sends, see messaging.retry
+MESSAGING_RETRY_MAX_RETRIES = int(os.getenv("MESSAGING_RETRY_MAX_RETRIES", "5"))
+MESSAGING_RETRY_BASE_DELAY = float(os.getenv("MESSAGING_RETRY_BASE_DELAY", "2"))
+MESSAGING_RETRY_MAX_DELAY = float(os.getenv("MESSAGING_RETRY_MAX_DELAY", "300"))
+
+# In-process tier of the resolution cache, see messaging.cache
+MESSAGING_RESOLUTION_CACHE_ALIAS = "resolution"
+MESSAGING_RESOLUTION_CACHE_SIZE = int(
+    os.getenv("MESSAGING_RESOLUTION_CACHE_SIZE", "10000")
+)
+MESSAGING_RESOLUTION_CACHE_TTL = float(
+    os.getenv("MESSAGING_RESOLUTION_CACHE_TTL", "60")
+)
+
+# Bulk sends, see MessageBulkCreateView
+MESSAGING_BULK_SEND_MAX_SIZE = int(os.getenv("MESSAGING_BULK_SEND_MAX_SIZE", "50000"))
+# Number of messages created per set of bulk statements and per transaction
+MESSAGING_BULK_SEND_CHUNK_SIZE = int(
+    os.getenv("MESSAGING_BULK_SEND_CHUNK_SIZE", "1000")
+)
+
+# Number of messages fetched and encoded at a time by MessageExportView
+MESSAGING_EXPORT_CHUNK_SIZE = int(os.getenv("MESSAGING_EXPORT_CHUNK_SIZE", "2000"))
+
+# Maximum number of async webhook requests using the database at once, per
+# ASGI worker process. Each of them holds a database connection.
+MESSAGING_ASYNC_DB_CONCURRENCY = int(os.getenv("MESSAGING_ASYNC_DB_CONCURRENCY", "20"))
+
+# Inbound write-behind buffer, see messaging.buffer. When enabled, the inbound
+# webhooks append messages to a Redis Stream and answer 202, and the
+# consume_inbound_messages command stores them. Redis must persist the stream
+# with the append-only file (appendonly yes, appendfsync everysec, as in
+# docker-compose.yml), the provider won't send a message again after its 202.
+MESSAGING_INBOUND_BUFFER = os.getenv("MESSAGING_INBOUND_BUFFER", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+MESSAGING_INBOUND_STREAM = os.getenv("MESSAGING_INBOUND_STREAM", "messaging:inbound")
+# Number of buffered messages stored per batch by a consumer
+MESSAGING_INBOUND_CONSUMER_BATCH_SIZE = int(
+    os.getenv("MESSAGING_INBOUND_CONSUMER_BATCH_SIZE", "500")
+)
+# Seconds after which messages read by a consumer that did not store them are
+# claimed by another consumer
+MESSAGING_INBOUND_CLAIM_IDLE = float(os.getenv("MESSAGING_INBOUND_CLAIM_IDLE", "60"))
+
+# Monthly partitioning of the message table, see messaging.partitions and the
+# message_partitions command. Enable before converting the table: inbound
+# messages are then deduplicated with ProviderMessageKey.
+MESSAGING_PARTITIONED_MESSAGES = os.getenv(
+    "MESSAGING_PARTITIONED_MESSAGES", "false"
+).lower() in ("1", "true", "yes")
+MESSAGING_PARTITION_MONTHS_AHEAD = int(
+    os.getenv("MESSAGING_PARTITION_MONTHS_AHEAD", "3")
+)
+# Months of messages kept in the table, unlimited when empty
+MESSAGING_PARTITION_RETENTION_MONTHS = (
+    int(os.getenv("MESSAGING_PARTITION_RETENTION_MONTHS"))
+    if os.getenv("MESSAGING_PARTITION_RETENTION_MONTHS")
+    else None
+)
+
+# Archival of old messages, see messaging.archive. The archive_old_messages
+# task moves the messages older than MESSAGING_ARCHIVE_AFTER_DAYS days to
+# compressed files in MESSAGING_ARCHIVE_DIR every day, disabled when empty.
+MESSAGING_ARCHIVE_AFTER_DAYS = (
+    int(os.getenv("MESSAGING_ARCHIVE_AFTER_DAYS"))
+    if os.getenv("MESSAGING_ARCHIVE_AFTER_DAYS")
+    else None
+)
+MESSAGING_ARCHIVE_DIR = os.getenv("MESSAGING_ARCHIVE_DIR", str(BASE_DIR / "archive"))
+# Number of messages fetched, deleted or restored per statement
+MESSAGING_ARCHIVE_BATCH_SIZE = int(os.getenv("MESSAGING_ARCHIVE_BATCH_SIZE", "1000"))
+
+# Prometheus metrics, see messaging.metrics. The web service serves them at
+# /metrics, the Celery workers on MESSAGING_METRICS_WORKER_PORT when it is
+# set. Multi-process services need PROMETHEUS_MULTIPROC_DIR.
+MESSAGING_METRICS_WORKER_PORT = (
+    int(os.getenv("MESSAGING_METRICS_WORKER_PORT"))
+    if os.getenv("MESSAGING_METRICS_WORKER_PORT")
+    else None
+)
+
+# Distributed tracing with OpenTelemetry, see messaging.tracing. Disabled when
+# MESSAGING_TRACING_EXPORTER is empty, else "console" or "file" (JSON lines
+# appended to MESSAGING_TRACING_FILE). Share of the traces kept, between 0
+# and 1, decided where each trace starts.
+MESSAGING_TRACING_EXPORTER = os.getenv("MESSAGING_TRACING_EXPORTER", "")
+MESSAGING_TRACING_FILE = os.getenv(
+    "MESSAGING_TRACING_FILE", str(BASE_DIR / "traces" / "spans.jsonl")
+)
+MESSAGING_TRACING_SAMPLE_RATE = float(
+    os.getenv("MESSAGING_TRACING_SAMPLE_RATE", "0.01")
+)
+MESSAGING_TRACING_SERVICE_NAME = os.getenv(
+    "MESSAGING_TRACING_SERVICE_NAME", "hatch-messaging"
+)
+
+# Rate limits of the provider requests, shared by every worker through Redis,
+# see messaging.ratelimit. Requests per second of each provider, unlimited
+# when empty, with bursts of up to *_RATE_BURST requests. With
+# MESSAGING_SENDER_RATE_LIMIT, each sender address is limited as well. Sends
+# over the limits are deferred to their slot, reserved at most
+# MESSAGING_RATE_LIMIT_MAX_DELAY seconds ahead.
+MESSAGING_TEXT_RATE_LIMIT = (
+    float(os.getenv("MESSAGING_TEXT_RATE_LIMIT"))
+    if os.getenv("MESSAGING_TEXT_RATE_LIMIT")
+    else None
+)
+MESSAGING_TEXT_RATE_BURST = int(os.getenv("MESSAGING_TEXT_RATE_BURST", "1"))
+MESSAGING_EMAIL_RATE_LIMIT = (
+    float(os.getenv("MESSAGING_EMAIL_RATE_LIMIT"))
+    if os.getenv("MESSAGING_EMAIL_RATE_LIMIT")
+    else None
+)
+MESSAGING_EMAIL_RATE_BURST = int(os.getenv("MESSAGING_EMAIL_RATE_BURST", "1"))
+MESSAGING_SENDER_RATE_LIMIT = (
+    float(os.getenv("MESSAGING_SENDER_RATE_LIMIT"))
+    if os.getenv("MESSAGING_SENDER_RATE_LIMIT")
+    else None
+)
+MESSAGING_SENDER_RATE_BURST = int(os.getenv("MESSAGING_SENDER_RATE_BURST", "1"))
+MESSAGING_RATE_LIMIT_MAX_DELAY = float(
+    os.getenv("MESSAGING_RATE_LIMIT_MAX_DELAY", "60")
+)
+
+# Circuit breakers of the providers, shared by every worker through Redis,
+# see messaging.providers.circuit. A circuit opens when, over the last
+# MESSAGING_CIRCUIT_WINDOW seconds and at least MESSAGING_CIRCUIT_MIN_REQUESTS
+# requests, the share of failed requests reaches MESSAGING_CIRCUIT_ERROR_RATE
+# or the share of requests slower than MESSAGING_CIRCUIT_SLOW_CALL seconds
+# reaches MESSAGING_CIRCUIT_SLOW_RATE. Sends are then deferred, and a probe
+# request is let through after MESSAGING_CIRCUIT_OPEN_SECONDS seconds.
+MESSAGING_CIRCUIT_BREAKER = os.getenv("MESSAGING_CIRCUIT_BREAKER", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+MESSAGING_CIRCUIT_WINDOW = float(os.getenv("MESSAGING_CIRCUIT_WINDOW", "60"))
+MESSAGING_CIRCUIT_MIN_REQUESTS = int(os.getenv("MESSAGING_CIRCUIT_MIN_REQUESTS", "20"))
+MESSAGING_CIRCUIT_ERROR_RATE = float(os.getenv("MESSAGING_CIRCUIT_ERROR_RATE", "0.5"))
+MESSAGING_CIRCUIT_SLOW_CALL = float(os.getenv("MESSAGING_CIRCUIT_SLOW_CALL", "5"))
+MESSAGING_CIRCUIT_SLOW_RATE = float(os.getenv("MESSAGING_CIRCUIT_SLOW_RATE", "0.5"))
+MESSAGING_CIRCUIT_OPEN_SECONDS = float(
+    os.getenv("MESSAGING_CIRCUIT_OPEN_SECONDS", "30")
+)
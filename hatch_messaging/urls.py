@@ -17,8 +17,10 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import include, path
 
+from messaging.views import MetricsView
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("messaging/", include("messaging.urls")),
+    path("metrics", MetricsView.as_view(), name="metrics"),
 ]
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class MessagingConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "messaging"
+
+    def ready(self):
+        # Register the signal receivers
+        from . import signals  # noqa: F401
+        from .tracing import configure_tracing
+
+        configure_tracing()
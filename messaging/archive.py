@@ -0,0 +1,224 @@
+import gzip
+import json
+import os
+import uuid
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+
+from . import summaries
+from .ids import uuid7
+from .models import Conversation, Message, Participant, ProviderMessageKey
+from .utils import insert_ignore_conflicts
+
+# Statuses of the messages that won't change anymore, the others are still
+# being sent and are never archived
+FINAL_STATUSES = ["SENT", "FAILED", "RECIEVED"]
+
+FIELDS = [field.attname for field in Message._meta.concrete_fields]
+
+
+def _encode(value):
+    # Unlike DjangoJSONEncoder, keeps the microseconds of datetimes
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    raise TypeError(f"Can't archive a value of type {type(value).__name__}")
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def archive_messages(before, directory=None, batch_size=None):
+    """
+    Move the sent, failed and received messages with a timestamp before
+    `before` to an archive file, then delete them from the table.
+
+    The archive is a gzip-compressed file of one JSON object per message, in
+    directory (MESSAGING_ARCHIVE_DIR by default), see read_archive. Messages
+    are read with a server-side cursor, batch_size at a time, so memory use
+    doesn't depend on their number. The cursor is read in one transaction,
+    like in export_messages, as PostgreSQL computes the whole result of a
+    cursor declared in autocommit mode first. The file is written under a
+    temporary name and renamed once complete and flushed to disk, so a crash
+    leaves no partial archive and deletes nothing.
+
+    The messages are then deleted by id, reading them back from the archive,
+    batch_size per transaction, so no statement holds locks on many rows for
+    long. Their ProviderMessageKey rows are deleted with them, and they are
+    removed from the summaries of their conversations. A message
+    archived by a run that crashed before deleting it is archived again by
+    the next run, restore_messages skips the duplicate.
+
+    :param before: Aware datetime, older messages are archived.
+    :param batch_size: Number of messages per fetch and delete,
+        MESSAGING_ARCHIVE_BATCH_SIZE by default.
+    :return: Dict with the "path" of the archive, None if there was nothing to
+        archive, and the number of "archived" and "deleted" messages.
+    """
+    directory = directory or settings.MESSAGING_ARCHIVE_DIR
+    batch_size = batch_size or settings.MESSAGING_ARCHIVE_BATCH_SIZE
+    rows = (
+        Message.objects.filter(timestamp__lt=before, status__in=FINAL_STATUSES)
+        .order_by()
+        .values(*FIELDS)
+        .iterator(chunk_size=batch_size)
+    )
+
+    os.makedirs(directory, exist_ok=True)
+    # uuid7 names sort in the order the archives were written
+    path = os.path.join(directory, f"messages-{before:%Y%m%d}-{uuid7()}.ndjson.gz")
+    partial = f"{path}.part"
+    archived = 0
+    with open(partial, "wb") as file:
+        with gzip.GzipFile(fileobj=file, mode="wb") as archive:
+            with transaction.atomic():
+                for row in rows:
+                    archive.write(json.dumps(row, default=_encode).encode() + b"\n")
+                    archived += 1
+        file.flush()
+        os.fsync(file.fileno())
+    if not archived:
+        os.remove(partial)
+        return {"path": None, "archived": 0, "deleted": 0}
+    os.replace(partial, path)
+
+    deleted = 0
+    for batch in _batches(read_archive(path), batch_size):
+        with transaction.atomic():
+            messages = Message.objects.filter(
+                id__in=[row["id"] for row in batch],
+                timestamp__lt=before,
+                status__in=FINAL_STATUSES,
+            )
+            removed = list(
+                messages.select_for_update().values_list("conversation_id", "id")
+            )
+            messages.filter(id__in=[message_id for _, message_id in removed]).delete()
+            summaries.remove_messages(removed)
+            deleted += len(removed)
+            ProviderMessageKey.objects.filter(
+                pk__in=[
+                    row["provider_message_id"]
+                    for row in batch
+                    if row["provider_message_id"]
+                ]
+            ).delete()
+    return {"path": path, "archived": archived, "deleted": deleted}
+
+
+def read_archive(path):
+    """
+    Read an archive written by archive_messages.
+
+    :return: Iterator of dicts of the Message field values, keyed by attname
+        (conversation_id, sender_id...).
+    """
+    fields = [Message._meta.get_field(name) for name in FIELDS]
+    with gzip.open(path, "rt") as archive:
+        for line in archive:
+            row = json.loads(line)
+            # Fields added since the archive was written are empty
+            yield {
+                field.attname: field.to_python(row.get(field.attname))
+                for field in fields
+            }
+
+
+def restore_messages(path, since=None, until=None, batch_size=None):
+    """
+    Insert the messages of an archive back into the table, with their
+    original ids and dates.
+
+    Messages already in the table are skipped, and so are the messages whose
+    conversation, sender or recipient was deleted since they were archived.
+    With MESSAGING_PARTITIONED_MESSAGES, inbound messages whose
+    provider_message_id was stored again by another message are skipped too.
+    On a partitioned table, messages of a detached month go to the default
+    partition. Restored messages are added to the summaries of their
+    conversations.
+
+    :param since: Only restore the messages with a timestamp from this one.
+    :param until: Only restore the messages with a timestamp before this one.
+    :param batch_size: Number of messages per insert,
+        MESSAGING_ARCHIVE_BATCH_SIZE by default.
+    :return: Dict with the number of "restored" and "skipped" messages.
+    """
+    batch_size = batch_size or settings.MESSAGING_ARCHIVE_BATCH_SIZE
+    rows = (
+        row
+        for row in read_archive(path)
+        if (since is None or row["timestamp"] >= since)
+        and (until is None or row["timestamp"] < until)
+    )
+    restored = skipped = 0
+    for batch in _batches(rows, batch_size):
+        messages = [Message(**row) for row in batch]
+        conversations = set(
+            Conversation.objects.filter(
+                id__in={message.conversation_id for message in messages}
+            ).values_list("id", flat=True)
+        )
+        participants = set(
+            Participant.objects.filter(
+                id__in={message.sender_id for message in messages}
+                | {message.recipient_id for message in messages}
+            ).values_list("id", flat=True)
+        )
+        messages = [
+            message
+            for message in messages
+            if message.conversation_id in conversations
+            and message.sender_id in participants
+            and message.recipient_id in participants
+        ]
+        with transaction.atomic():
+            inserted = _restore_batch(messages)
+            summaries.add_messages(
+                [message for message in messages if message.id in inserted]
+            )
+        restored += len(inserted)
+        skipped += len(batch) - len(inserted)
+    return {"restored": restored, "skipped": skipped}
+
+
+def _restore_batch(messages):
+    """
+    Insert messages, skipping those that conflict with a row of the table.
+
+    :return: Set of the ids of the inserted messages.
+    """
+    if not settings.MESSAGING_PARTITIONED_MESSAGES:
+        # Conflicts on the id or the provider_message_id
+        return insert_ignore_conflicts(messages, None, raw=True)
+
+    keys = [message.provider_message_id for message in messages]
+    with transaction.atomic():
+        insert_ignore_conflicts(
+            [
+                ProviderMessageKey(provider_message_id=key, message_id=message.id)
+                for key, message in zip(keys, messages)
+                if key
+            ],
+            ["provider_message_id"],
+        )
+        owners = dict(
+            ProviderMessageKey.objects.filter(
+                pk__in=[key for key in keys if key]
+            ).values_list("provider_message_id", "message_id")
+        )
+        return insert_ignore_conflicts(
+            [
+                message
+                for message in messages
+                if not message.provider_message_id
+                or owners[message.provider_message_id] == message.id
+            ],
+            None,
+            raw=True,
+        )
@@ -0,0 +1,179 @@
+import json
+import logging
+from collections import defaultdict
+
+import redis
+from django.conf import settings
+from django.db import DataError, IntegrityError
+from django.utils.dateparse import parse_datetime
+
+from .redis_client import get_redis
+from .utils import ingest_inbound_messages
+
+logger = logging.getLogger(__name__)
+
+
+class InboundBuffer:
+    """
+    Write-behind buffer of inbound messages in a Redis Stream.
+
+    With MESSAGING_INBOUND_BUFFER enabled, the inbound webhooks append the
+    validated entries to the stream and answer right away, and consumer
+    processes (see the consume_inbound_messages command) store them in
+    batches with ingest_inbound_messages.
+
+    Consumers read through a consumer group and acknowledge entries only once
+    they are stored, so an entry read by a consumer that crashed stays pending
+    and is claimed by another one after MESSAGING_INBOUND_CLAIM_IDLE seconds.
+    An entry can therefore be stored twice, the second insert is skipped by
+    the deduplication on provider_message_id.
+
+    Entries the database rejects (invalid data, not a temporary error) are
+    moved to the "<stream>:dead" stream instead of blocking the others.
+
+    The webhooks answer once an entry is in Redis, so the at-least-once
+    guarantee only holds if Redis persists the stream: run it with the
+    append-only file enabled (appendonly yes). With appendfsync everysec, a
+    crash of the Redis server loses at most the last second of entries.
+    """
+
+    group = "ingest"
+
+    @property
+    def redis(self):
+        return get_redis()
+
+    @property
+    def stream(self):
+        return settings.MESSAGING_INBOUND_STREAM
+
+    @property
+    def dead_letter_stream(self):
+        return f"{self.stream}:dead"
+
+    @staticmethod
+    def dumps(entry):
+        return json.dumps(dict(entry, timestamp=entry["timestamp"].isoformat()))
+
+    @staticmethod
+    def loads(data):
+        entry = json.loads(data)
+        entry["timestamp"] = parse_datetime(entry["timestamp"])
+        return entry
+
+    def append(self, field, entries):
+        """
+        Append entries to the stream.
+
+        :param field: Participant field the addresses refer to, "phone" or "email".
+        :param entries: Entries as passed to ingest_inbound_messages.
+        :raises redis.RedisError: If the entries could not be stored.
+        """
+        pipeline = self.redis.pipeline(transaction=False)
+        for entry in entries:
+            pipeline.xadd(self.stream, {"field": field, "entry": self.dumps(entry)})
+        pipeline.execute()
+
+    def ensure_group(self):
+        """
+        Create the stream and its consumer group if they don't exist.
+        """
+        try:
+            self.redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except redis.ResponseError as exc:
+            if "BUSYGROUP" not in str(exc):
+                raise
+
+    def read(self, consumer, count, block=None):
+        """
+        Read entries for a consumer: first the entries left pending by another
+        consumer for too long, then new entries.
+
+        :param consumer: Name of the consumer, unique per process.
+        :param count: Maximum number of entries to read.
+        :param block: Milliseconds to wait for new entries, None to not wait.
+        :return: List of (entry id, fields) tuples.
+        """
+        claimed = self.redis.xautoclaim(
+            self.stream,
+            self.group,
+            consumer,
+            min_idle_time=int(settings.MESSAGING_INBOUND_CLAIM_IDLE * 1000),
+            start_id="0-0",
+            count=count,
+        )[1]
+        if claimed:
+            return claimed
+        streams = self.redis.xreadgroup(
+            self.group, consumer, {self.stream: ">"}, count=count, block=block
+        )
+        return streams[0][1] if streams else []
+
+    def consume(self, consumer, count, block=None):
+        """
+        Read a batch of entries, store them and acknowledge them.
+
+        :param consumer: Name of the consumer, unique per process.
+        :param count: Maximum number of entries to read.
+        :param block: Milliseconds to wait for new entries, None to not wait.
+        :return: A dict with the number of entries "read", and of messages
+            "created", "duplicates" and "dead" (moved to the dead letter stream).
+        :raises django.db.Error: On a temporary database error, the entries
+            are not acknowledged and will be read again.
+        """
+        result = {"read": 0, "created": 0, "duplicates": 0, "dead": 0}
+        read = self.read(consumer, count, block)
+        if not read:
+            return result
+        result["read"] = len(read)
+
+        entries = defaultdict(list)
+        for entry_id, fields in read:
+            # Entries deleted while pending are claimed without their fields
+            if fields:
+                entries[fields[b"field"].decode()].append((entry_id, fields))
+
+        dead = []
+        for field, items in entries.items():
+            statuses = self.store(field, items, dead)
+            result["created"] += statuses.count("created")
+            result["duplicates"] += statuses.count("duplicate")
+        result["dead"] = len(dead)
+
+        pipeline = self.redis.pipeline(transaction=False)
+        for entry_id, fields in dead:
+            pipeline.xadd(self.dead_letter_stream, fields)
+        entry_ids = [entry_id for entry_id, _ in read]
+        pipeline.xack(self.stream, self.group, *entry_ids)
+        pipeline.xdel(self.stream, *entry_ids)
+        pipeline.execute()
+        return result
+
+    def store(self, field, items, dead):
+        """
+        Store entries with ingest_inbound_messages. If the database rejects the
+        batch, entries are stored one by one and those rejected are added to
+        dead.
+
+        This runs in autocommit mode, not in a transaction: the participants
+        and conversations resolved before a failure are committed, so the ids
+        kept by the resolution cache stay valid.
+
+        :return: The statuses returned by ingest_inbound_messages.
+        """
+        try:
+            return ingest_inbound_messages(
+                [self.loads(fields[b"entry"]) for _, fields in items], field
+            )
+        except (DataError, IntegrityError, ValueError, KeyError, TypeError):
+            if len(items) == 1:
+                logger.exception("Inbound message rejected: %s", items[0][0])
+                dead.append(items[0])
+                return []
+        statuses = []
+        for item in items:
+            statuses += self.store(field, [item], dead)
+        return statuses
+
+
+inbound_buffer = InboundBuffer()
@@ -0,0 +1,182 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """
+    Thread-safe, bounded least-recently-used cache whose entries expire after ttl seconds.
+    """
+
+    def __init__(self, maxsize, ttl):
+        """
+        :param maxsize: Maximum number of entries, the least recently used are evicted first.
+        :param ttl: Lifetime of an entry in seconds.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        :return: The value stored for key, or None if missing or expired.
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ResolutionCache:
+    """
+    Two-tier cache of the participant and conversation lookups of messaging.utils.
+
+    Maps a phone number or email to a participant id, and a sorted pair of
+    participant ids to a conversation id. The first tier is an LRUCache in the
+    process, the second tier is the Django cache named by
+    MESSAGING_RESOLUTION_CACHE_ALIAS (Redis in production), shared by every
+    process. Errors of the second tier are logged and treated as misses.
+
+    Entries are removed from both tiers when a Participant or Conversation is
+    deleted (see messaging.signals). Other processes keep their own first-tier
+    entry until it expires, so MESSAGING_RESOLUTION_CACHE_TTL bounds how long a
+    deleted row can still be returned there.
+    """
+
+    def __init__(self):
+        self._local = None
+        self._lock = threading.Lock()
+        self.hits = {"local": 0, "shared": 0}
+        self.misses = 0
+
+    @property
+    def local(self):
+        if self._local is None:
+            self._local = LRUCache(
+                settings.MESSAGING_RESOLUTION_CACHE_SIZE,
+                settings.MESSAGING_RESOLUTION_CACHE_TTL,
+            )
+        return self._local
+
+    @property
+    def shared(self):
+        return caches[settings.MESSAGING_RESOLUTION_CACHE_ALIAS]
+
+    @staticmethod
+    def participant_key(field, value):
+        return f"participant:{field}:{value}"
+
+    @staticmethod
+    def conversation_key(participant_1_id, participant_2_id):
+        return f"conversation:{participant_1_id}:{participant_2_id}"
+
+    def get_many(self, keys):
+        """
+        Look keys up in the local tier, then the missing ones in the shared tier.
+
+        :param keys: Iterable of cache keys.
+        :return: Dict of the keys found, mapped to their value.
+        """
+        found = {}
+        for key in keys:
+            value = self.local.get(key)
+            if value is not None:
+                found[key] = value
+        local_hits = len(found)
+
+        missing = [key for key in keys if key not in found]
+        shared_found = {}
+        if missing:
+            try:
+                shared_found = self.shared.get_many(missing)
+            except Exception:
+                logger.exception("Resolution cache lookup failed")
+            for key, value in shared_found.items():
+                self.local.set(key, value)
+            found.update(shared_found)
+
+        with self._lock:
+            self.hits["local"] += local_hits
+            self.hits["shared"] += len(shared_found)
+            self.misses += len(missing) - len(shared_found)
+        return found
+
+    def set_many(self, mapping):
+        """
+        Store values in both tiers.
+
+        :param mapping: Dict of cache keys to values.
+        """
+        for key, value in mapping.items():
+            self.local.set(key, value)
+        try:
+            self.shared.set_many(mapping)
+        except Exception:
+            logger.exception("Resolution cache update failed")
+
+    def delete_many(self, keys):
+        """
+        Remove keys from both tiers.
+
+        :param keys: List of cache keys.
+        """
+        for key in keys:
+            self.local.delete(key)
+        try:
+            self.shared.delete_many(keys)
+        except Exception:
+            logger.exception("Resolution cache invalidation failed")
+
+    def clear(self):
+        """
+        Empty the local tier and reset the counters.
+        """
+        self.local.clear()
+        with self._lock:
+            self.hits = {"local": 0, "shared": 0}
+            self.misses = 0
+
+    def stats(self):
+        """
+        :return: Dict with the number of local and shared hits, and of misses.
+        """
+        with self._lock:
+            return {
+                "local_hits": self.hits["local"],
+                "shared_hits": self.hits["shared"],
+                "misses": self.misses,
+            }
+
+
+resolution_cache = ResolutionCache()
@@ -0,0 +1,337 @@
+import asyncio
+import os
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import metrics
+from .models import Message
+from .providers.base import CircuitOpenError
+from .providers.clients import create_async_client
+from .providers.email import EmailProvider
+from .providers.text import TextProvider
+from .ratelimit import rate_limiter
+from .retry import RetryPolicy
+
+
+def build_provider(message):
+    """
+    Build the provider that delivers a message, based on its message type.
+
+    :param message: The Message to deliver, with sender and recipient loaded.
+    :return: An EmailProvider or TextProvider.
+    :raises ValueError: If the message type is not supported.
+    """
+    if message.message_type == "email":
+        return EmailProvider(
+            to=message.recipient.email,
+            _from=message.sender.email,
+            body=message.body,
+            attachments=message.attachments or [],
+        )
+    if message.message_type in ["sms", "mms"]:
+        return TextProvider(
+            to=message.recipient.phone,
+            _from=message.sender.phone,
+            _type=message.message_type,
+            body=message.body,
+            attachments=message.attachments or None,
+        )
+    raise ValueError("Unsupported message type")
+
+
+class DeliveryEngine:
+    """
+    Delivers batches of messages with many provider requests in flight at once.
+
+    All requests share one httpx.AsyncClient, and the engine keeps its event
+    loop between batches so pooled connections are reused. Database access
+    happens outside the event loop: a batch is claimed with one
+    SELECT ... FOR UPDATE SKIP LOCKED and one UPDATE to SENDING, and the
+    results are written back in bulk. Rows locked by another engine are
+    skipped, so several processes can deliver from the same queue without
+    sending a message twice.
+
+    Sends are paced by the RateLimiter: the slots of a batch are reserved
+    with one round trip to Redis, and requests with a slot at most
+    MESSAGING_DELIVERY_MAX_WAIT seconds away wait for it on the event loop.
+    Messages with a later slot go back to their previous status and are sent
+    by a send_message task at their slot. Messages without a slot within
+    MESSAGING_RATE_LIMIT_MAX_DELAY seconds go back to their previous status
+    and are deferred, and so are the messages to a provider whose circuit is
+    open. A batch therefore holds its messages in SENDING for at most
+    MESSAGING_DELIVERY_MAX_WAIT seconds more than its requests take.
+    """
+
+    def __init__(self, concurrency=None, timeout=10):
+        """
+        :param concurrency: Maximum number of provider requests in flight.
+        :param timeout: The timeout for HTTP requests in seconds.
+        """
+        self.concurrency = concurrency or settings.MESSAGING_DELIVERY_CONCURRENCY
+        self.timeout = timeout
+        self._runner = asyncio.Runner()
+        self._client = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def deliver(self, message_ids, retries=0):
+        """
+        Send the messages among message_ids that are waiting to be sent and
+        record the outcome. Messages that failed temporarily are marked as
+        RETRYING and returned, the caller reschedules them (see
+        tasks.schedule_batch_retry), so the engine never sleeps between
+        attempts. So are the messages deferred by the rate limits or an open
+        circuit, and the messages whose slot is too far to wait for (see
+        tasks.schedule_reserved).
+
+        :param message_ids: IDs of the messages to send.
+        :param retries: Number of retries already done for these messages.
+        :return: A dict with the number of "sent" and "failed" messages, the
+            "retry" list of message IDs to send again and the "countdown"
+            before doing so, the "deferred" list of message IDs to send
+            after "deferred_countdown" seconds, and the "reserved" list of
+            (message ID, delay) pairs to send after their delay, in the slot
+            they reserved. Neither deferring nor reserving counts as a retry.
+        """
+        messages = self.claim(
+            Message.objects.filter(
+                id__in=message_ids,
+                status__in=["RETRYING"] if retries else ["QUEUED"],
+            )
+        )
+        return self.send(messages, retries)
+
+    def deliver_queued(self, batch_size=None):
+        """
+        Claim the oldest QUEUED messages, send them and record the outcome.
+        Used by dispatcher processes polling the queue, see the
+        send_queued_messages command.
+
+        :param batch_size: Maximum number of messages to claim.
+        :return: The same dict as deliver, with "claimed" the number of
+            messages claimed.
+        """
+        batch_size = batch_size or settings.MESSAGING_DELIVERY_BATCH_SIZE
+        messages = self.claim(
+            Message.objects.filter(status="QUEUED").order_by("created_at"), batch_size
+        )
+        result = self.send(messages)
+        result["claimed"] = len(messages)
+        return result
+
+    def claim(self, queryset, limit=None):
+        """
+        Lock the messages of queryset, skipping those locked by another
+        process, and mark them as SENDING.
+
+        :param queryset: Messages to claim, already filtered on their status.
+        :param limit: Maximum number of messages to claim.
+        :return: The list of claimed messages, with sender and recipient loaded.
+        """
+        queryset = queryset.select_related("sender", "recipient").select_for_update(
+            skip_locked=True, of=("self",)
+        )
+        if limit is not None:
+            queryset = queryset[:limit]
+        with transaction.atomic():
+            messages = list(queryset)
+            if messages:
+                Message.objects.filter(
+                    id__in=[message.id for message in messages]
+                ).update(status="SENDING", claimed_at=timezone.now())
+        return messages
+
+    def send(self, messages, retries=0):
+        """
+        Send claimed messages and write their new status back in bulk.
+
+        :param messages: Messages claimed with claim.
+        :param retries: Number of retries already done for these messages.
+        :return: The dict described in deliver.
+        """
+        result = {
+            "sent": 0,
+            "failed": 0,
+            "retry": [],
+            "countdown": None,
+            "deferred": [],
+            "deferred_countdown": None,
+            "reserved": [],
+        }
+        if not messages:
+            return result
+
+        slots = rate_limiter.reserve_many(messages)
+        deferred = [
+            (message, delay)
+            for message, (delay, reserved) in zip(messages, slots)
+            if not reserved
+        ]
+        self._defer(result, deferred, retries)
+        max_wait = settings.MESSAGING_DELIVERY_MAX_WAIT
+        later = [
+            (message, delay)
+            for message, (delay, reserved) in zip(messages, slots)
+            if reserved and delay > max_wait
+        ]
+        if later:
+            # Their slot is too far to hold the batch for it
+            result["reserved"] = [(message.id, delay) for message, delay in later]
+            Message.objects.filter(id__in=[message.id for message, _ in later]).update(
+                status="RETRYING" if retries else "QUEUED"
+            )
+            metrics.count_sends(
+                (message.message_type, "deferred") for message, _ in later
+            )
+        scheduled = [
+            (message, delay)
+            for message, (delay, reserved) in zip(messages, slots)
+            if reserved and delay <= max_wait
+        ]
+        if not scheduled:
+            return result
+
+        messages = [message for message, _ in scheduled]
+        errors = self._runner.run(
+            self._send_all(messages, [delay for _, delay in scheduled])
+        )
+
+        # Messages to providers with an open circuit were not sent
+        self._defer(
+            result,
+            [
+                (message, error.retry_after)
+                for message, error in zip(messages, errors)
+                if isinstance(error, CircuitOpenError)
+            ],
+            retries,
+        )
+        retry_policy = RetryPolicy()
+        sent = []
+        unsent = []
+        countdowns = []
+        outcomes = []
+        for message, error in zip(messages, errors):
+            if error is None:
+                sent.append(message.id)
+                outcomes.append((message.message_type, "sent"))
+                continue
+            if isinstance(error, CircuitOpenError):
+                continue
+            message.last_error = str(error)
+            if retry_policy.should_retry(error, retries):
+                message.status = "RETRYING"
+                result["retry"].append(message.id)
+                countdowns.append(retry_policy.countdown(retries, error))
+            else:
+                message.status = "FAILED"
+                result["failed"] += 1
+            unsent.append(message)
+            outcomes.append((message.message_type, message.status.lower()))
+        if sent:
+            Message.objects.filter(id__in=sent).update(status="SENT", last_error=None)
+        if unsent:
+            Message.objects.bulk_update(unsent, ["status", "last_error"])
+        result["sent"] = len(sent)
+        metrics.count_sends(outcomes)
+        if countdowns:
+            # The batch is retried as a whole, after the longest delay asked for
+            result["countdown"] = max(countdowns)
+        return result
+
+    def _defer(self, result, deferred, retries):
+        """
+        Put deferred messages back to their previous status and add them to
+        the "deferred" messages of result.
+
+        :param deferred: (message, delay) pairs, the message being sent again
+            after delay seconds at the earliest.
+        """
+        if not deferred:
+            return
+        message_ids = [message.id for message, _ in deferred]
+        countdowns = [delay for _, delay in deferred]
+        if result["deferred_countdown"] is not None:
+            countdowns.append(result["deferred_countdown"])
+        result["deferred"].extend(message_ids)
+        result["deferred_countdown"] = min(countdowns)
+        Message.objects.filter(id__in=message_ids).update(
+            status="RETRYING" if retries else "QUEUED"
+        )
+        metrics.count_sends(
+            (message.message_type, "deferred") for message, _ in deferred
+        )
+
+    def close(self):
+        """
+        Close the HTTP client and the event loop of the engine.
+        """
+        if self._client is not None:
+            self._runner.run(self._client.aclose())
+            self._client = None
+        self._runner.close()
+
+    async def _send_all(self, messages, delays):
+        if self._client is None:
+            self._client = create_async_client(self.concurrency, self.timeout)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        return await asyncio.gather(
+            *(
+                self._send_one(message, semaphore, delay)
+                for message, delay in zip(messages, delays)
+            )
+        )
+
+    async def _send_one(self, message, semaphore, delay=0):
+        """
+        Send a single message, after waiting delay seconds for its slot.
+
+        :return: None on success, otherwise the exception raised.
+        """
+        try:
+            provider = build_provider(message)
+            if delay:
+                await asyncio.sleep(delay)
+            async with semaphore:
+                await provider.asend_message(self._client)
+        except Exception as exc:
+            return exc
+        return None
+
+
+_engine = None
+
+
+def _reset_after_fork():
+    # The event loop and connections of the parent can't be used in a child
+    global _engine
+    _engine = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_engine():
+    """
+    Get the delivery engine of the current process, creating it on first use.
+    """
+    global _engine
+    if _engine is None:
+        _engine = DeliveryEngine()
+    return _engine
+
+
+def close_engine():
+    """
+    Close the delivery engine of the current process, if there is one.
+    """
+    global _engine
+    if _engine is not None:
+        _engine.close()
+        _engine = None
@@ -0,0 +1,96 @@
+import csv
+import io
+import json
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from rest_framework.utils.encoders import JSONEncoder
+
+# Columns of an export, the foreign keys are ids like in MessageSerializer
+COLUMNS = [
+    "id",
+    "conversation",
+    "sender",
+    "recipient",
+    "message_type",
+    "direction",
+    "provider_message_id",
+    "body",
+    "attachments",
+    "status",
+    "last_error",
+    "timestamp",
+    "created_at",
+]
+
+CONTENT_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+def export_messages(queryset, export_format, chunk_size):
+    """
+    Encode the messages of queryset, for a StreamingHttpResponse.
+
+    Rows are fetched with a server-side cursor, chunk_size at a time, and
+    encoded chunk_size per yielded chunk, so memory use doesn't depend on the
+    number of messages. The cursor is read in one transaction: a cursor
+    declared in autocommit mode is WITH HOLD, and PostgreSQL would compute
+    the whole result before returning the first row. The export is therefore
+    a consistent snapshot of the messages.
+
+    :param export_format: "ndjson" for one JSON object per message, or "csv"
+        for a header row and one row per message.
+    :return: Iterator of bytes.
+    """
+    buffer = io.StringIO()
+    if export_format == "csv":
+        writer = csv.writer(buffer)
+        writer.writerow(COLUMNS)
+
+        def write(row):
+            writer.writerow([_csv_value(value) for value in row])
+
+    else:
+
+        def write(row):
+            buffer.write(json.dumps(dict(zip(COLUMNS, row)), cls=JSONEncoder))
+            buffer.write("\n")
+
+    with transaction.atomic():
+        rows = queryset.values_list(*COLUMNS).iterator(chunk_size=chunk_size)
+        for count, row in enumerate(rows, 1):
+            write(row)
+            if count % chunk_size == 0:
+                yield buffer.getvalue().encode()
+                buffer.seek(0)
+                buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+async def aiterate(iterator):
+    """
+    Async iterator over a sync iterator, to stream its content from an ASGI
+    server. Given a sync iterator, StreamingHttpResponse would read it whole
+    into memory before sending it.
+
+    Each step runs in the thread of the request, which owns the database
+    connection of a server-side cursor, and so does closing the iterator when
+    the client disconnects.
+    """
+    step = sync_to_async(next, thread_sensitive=True)
+    done = object()
+    try:
+        while (chunk := await step(iterator, done)) is not done:
+            yield chunk
+    finally:
+        await sync_to_async(iterator.close, thread_sensitive=True)()
@@ -0,0 +1,39 @@
+import os
+import time
+import uuid
+
+_MASK_48 = (1 << 48) - 1
+_MASK_62 = (1 << 62) - 1
+
+
+def uuid7():
+    """
+    Generate a time-ordered UUID, version 7 of RFC 9562.
+
+    The first 48 bits are the Unix time in milliseconds, followed by the
+    fraction of the millisecond in the 12 bits usually left random, then 62
+    random bits. New primary keys are therefore appended at the right end of
+    B-tree indexes instead of scattered across them like uuid4 values, which
+    keeps recently inserted rows on a few hot pages.
+
+    :return: A uuid.UUID, valid wherever a uuid4 is.
+    """
+    nanoseconds = time.time_ns()
+    milliseconds, remainder = divmod(nanoseconds, 1_000_000)
+    fraction = remainder * 4096 // 1_000_000
+    value = (
+        (milliseconds & _MASK_48) << 80
+        | 0x7 << 76
+        | fraction << 64
+        | 0b10 << 62
+        | int.from_bytes(os.urandom(8), "big") & _MASK_62
+    )
+    return uuid.UUID(int=value)
+
+
+def uuid7_timestamp(value):
+    """
+    :param value: A UUID generated by uuid7.
+    :return: The Unix time of its generation, in seconds with millisecond precision.
+    """
+    return (value.int >> 80) / 1000
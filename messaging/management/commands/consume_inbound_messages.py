@@ -0,0 +1,68 @@
+import logging
+import os
+import socket
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import Error, close_old_connections
+
+from messaging.buffer import inbound_buffer
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Store the inbound messages buffered by the webhooks in batches. "
+        "Several processes can consume the same buffer."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.MESSAGING_INBOUND_CONSUMER_BATCH_SIZE,
+            help="Number of messages read and stored per batch.",
+        )
+        parser.add_argument(
+            "--consumer",
+            default=f"{socket.gethostname()}-{os.getpid()}",
+            help="Name of the consumer in the consumer group, unique per process.",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep waiting for new messages instead of exiting when the buffer is empty.",
+        )
+        parser.add_argument(
+            "--block",
+            type=float,
+            default=5.0,
+            help="Seconds to wait for new messages in a loop.",
+        )
+
+    def handle(self, *args, **options):
+        inbound_buffer.ensure_group()
+        block = int(options["block"] * 1000) if options["loop"] else None
+        while True:
+            close_old_connections()
+            try:
+                result = inbound_buffer.consume(
+                    options["consumer"], options["batch_size"], block
+                )
+            except Error:
+                if not options["loop"]:
+                    raise
+                # The messages stay pending and are read again later
+                logger.exception("Failed to store inbound messages")
+                time.sleep(options["block"])
+                continue
+            if not result["read"]:
+                if not options["loop"]:
+                    break
+                continue
+            self.stdout.write(
+                f"Stored {result['read']} messages: {result['created']} created, "
+                f"{result['duplicates']} duplicates, {result['dead']} rejected"
+            )
@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from messaging import partitions
+
+
+class Command(BaseCommand):
+    help = (
+        "Manage the monthly partitions of the message table: convert the "
+        "table once, then run maintain regularly (e.g. daily) to create the "
+        "next partitions and detach expired ones."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=["convert", "maintain", "list"])
+        parser.add_argument(
+            "--months-ahead",
+            type=int,
+            default=settings.MESSAGING_PARTITION_MONTHS_AHEAD,
+            help="Number of monthly partitions to create after the current month.",
+        )
+        parser.add_argument(
+            "--retention-months",
+            type=int,
+            default=settings.MESSAGING_PARTITION_RETENTION_MONTHS,
+            help="Detach the partitions older than this many months, none by default.",
+        )
+        parser.add_argument(
+            "--drop",
+            action="store_true",
+            help="Drop the detached partitions instead of keeping them as tables.",
+        )
+
+    def handle(self, *args, **options):
+        if options["action"] == "convert":
+            if not settings.MESSAGING_PARTITIONED_MESSAGES:
+                raise CommandError(
+                    "Enable MESSAGING_PARTITIONED_MESSAGES and deploy it before "
+                    "converting, so inbound messages are deduplicated with "
+                    "ProviderMessageKey."
+                )
+            try:
+                partitions.convert(options["months_ahead"])
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(f"Converted {partitions.TABLE} to a partitioned table")
+        elif not partitions.is_partitioned():
+            raise CommandError(f"{partitions.TABLE} is not partitioned")
+        elif options["action"] == "maintain":
+            for name in partitions.ensure_partitions(options["months_ahead"]):
+                self.stdout.write(f"Created partition {name}")
+            if options["retention_months"] is not None:
+                for name in partitions.expire_partitions(
+                    options["retention_months"], drop=options["drop"]
+                ):
+                    action = "Dropped" if options["drop"] else "Detached"
+                    self.stdout.write(f"{action} partition {name}")
+
+        if options["action"] != "convert" or partitions.is_partitioned():
+            for name, lower, upper in partitions.list_partitions():
+                self.stdout.write(f"{name}: {lower} - {upper}")
@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from messaging.archive import restore_messages
+
+
+def parse_bound(value):
+    bound = parse_datetime(value)
+    if bound is None:
+        raise CommandError(f"Invalid date: {value}")
+    if timezone.is_naive(bound):
+        bound = timezone.make_aware(bound)
+    return bound
+
+
+class Command(BaseCommand):
+    help = (
+        "Restore archived messages into the message table, optionally only "
+        "those of a range of timestamps. Messages already in the table are "
+        "skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "paths", nargs="+", help="Archive files written by archive_old_messages."
+        )
+        parser.add_argument(
+            "--since",
+            type=parse_bound,
+            help="Only restore messages with a timestamp from this date (ISO 8601).",
+        )
+        parser.add_argument(
+            "--until",
+            type=parse_bound,
+            help="Only restore messages with a timestamp before this date (ISO 8601).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.MESSAGING_ARCHIVE_BATCH_SIZE,
+            help="Number of messages inserted per statement.",
+        )
+
+    def handle(self, *args, **options):
+        for path in options["paths"]:
+            try:
+                result = restore_messages(
+                    path,
+                    since=options["since"],
+                    until=options["until"],
+                    batch_size=options["batch_size"],
+                )
+            except OSError as e:
+                raise CommandError(f"Can't read {path}: {e}")
+            self.stdout.write(
+                f"{path}: restored {result['restored']} messages, "
+                f"skipped {result['skipped']}"
+            )
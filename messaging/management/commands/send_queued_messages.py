@@ -0,0 +1,62 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from messaging.delivery import DeliveryEngine
+from messaging.tasks import schedule_batch_retry, schedule_reserved
+
+
+class Command(BaseCommand):
+    help = (
+        "Send QUEUED messages in batches with the asyncio delivery engine. "
+        "Several processes can run this command on the same queue."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.MESSAGING_DELIVERY_BATCH_SIZE,
+            help="Number of messages loaded and sent per batch.",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=settings.MESSAGING_DELIVERY_CONCURRENCY,
+            help="Maximum number of provider requests in flight.",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling for new messages instead of exiting when the queue is empty.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait between polls when the queue is empty.",
+        )
+
+    def handle(self, *args, **options):
+        with DeliveryEngine(concurrency=options["concurrency"]) as engine:
+            while True:
+                result = engine.deliver_queued(options["batch_size"])
+                if not result["claimed"]:
+                    if not options["loop"]:
+                        break
+                    time.sleep(options["interval"])
+                    continue
+                # Temporary failures are retried by the Celery workers, and
+                # so are the messages with a rate limit slot too far away
+                schedule_batch_retry(result, 0)
+                schedule_reserved(result, 0)
+                self.stdout.write(
+                    f"Sent {result['sent']} messages, {result['failed']} failed, "
+                    f"{len(result['retry'])} to retry, "
+                    f"{len(result['deferred']) + len(result['reserved'])} deferred"
+                )
+                if result["deferred"]:
+                    # Deferred messages are QUEUED again, wait for the rate
+                    # limits to have slots for them
+                    time.sleep(result["deferred_countdown"])
@@ -0,0 +1,213 @@
+"""
+Prometheus metrics of the inbound webhooks, the sends and the provider
+requests.
+
+The metrics are module-level prometheus_client objects updated in process,
+which costs a dictionary lookup and a few additions per sample. Gunicorn
+workers and the prefork Celery pool run several processes: set
+PROMETHEUS_MULTIPROC_DIR to an empty directory per service so every process
+writes its samples there, and the exporter of the service adds them up.
+"""
+
+import logging
+import os
+import shutil
+import time
+from collections import Counter as Tally
+
+import redis
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import Count
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    multiprocess,
+    start_http_server,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_TYPES = {"sms", "mms", "email"}
+# Statuses of the messages waiting to be sent
+PENDING_STATUSES = ["QUEUED", "RETRYING", "SENDING"]
+
+WEBHOOK_DURATION = Histogram(
+    "messaging_webhook_duration_seconds",
+    "Duration of the inbound webhook requests.",
+    ["webhook", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+INBOUND_MESSAGES = Counter(
+    "messaging_inbound_messages",
+    "Inbound messages received by the webhooks, by outcome: created, "
+    "duplicate, accepted (buffered) or error.",
+    ["message_type", "outcome"],
+)
+SEND_DURATION = Histogram(
+    "messaging_send_duration_seconds",
+    "Duration of the send_message task, provider request included.",
+    ["message_type", "outcome"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+SENDS = Counter(
+    "messaging_sends",
+    "Sends of messages by the send_message task and the delivery engine, by "
+    "outcome: sent, retrying, failed or deferred (by the rate limits or an "
+    "open circuit).",
+    ["message_type", "outcome"],
+)
+PROVIDER_REQUEST_DURATION = Histogram(
+    "messaging_provider_request_duration_seconds",
+    "Duration of the requests to the providers, by outcome: the class of the "
+    "response status (2xx, 4xx, 5xx), 429 or transport_error.",
+    ["provider", "outcome"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+CIRCUIT_TRANSITIONS = Counter(
+    "messaging_circuit_transitions",
+    "Circuit breaker transitions of the providers to open or closed.",
+    ["provider", "state"],
+)
+
+
+def message_type_label(message_type):
+    # Payload values are not validated, unknown ones share a label
+    return message_type if message_type in MESSAGE_TYPES else "other"
+
+
+def response_outcome(status_code):
+    """
+    :return: The outcome label of a provider response with status_code.
+    """
+    if status_code == 429:
+        return "429"
+    return f"{status_code // 100}xx"
+
+
+def count_inbound(outcomes):
+    """
+    Count inbound messages.
+
+    :param outcomes: Iterable of (message type, outcome) pairs.
+    """
+    for (message_type, outcome), count in Tally(outcomes).items():
+        INBOUND_MESSAGES.labels(message_type_label(message_type), outcome).inc(count)
+
+
+def count_sends(outcomes):
+    """
+    Count sends of messages.
+
+    :param outcomes: Iterable of (message type, outcome) pairs.
+    """
+    for (message_type, outcome), count in Tally(outcomes).items():
+        SENDS.labels(message_type_label(message_type), outcome).inc(count)
+
+
+def observe_send(message_type, outcome, start):
+    """
+    Record a send of the send_message task started at `start`, a
+    time.perf_counter() value.
+    """
+    SEND_DURATION.labels(message_type_label(message_type), outcome).observe(
+        time.perf_counter() - start
+    )
+    count_sends([(message_type, outcome)])
+
+
+class QueueCollector:
+    """
+    Depth of the queues, read on scrape: messages waiting to be sent by
+    status, counted with message_status_created_idx, and entries of the
+    inbound buffer when it is enabled.
+    """
+
+    def collect(self):
+        # Imported here, the gunicorn configuration imports this module
+        # before the apps are loaded
+        from .buffer import inbound_buffer
+        from .models import Message
+
+        try:
+            counts = dict(
+                Message.objects.filter(status__in=PENDING_STATUSES)
+                .values_list("status")
+                .annotate(Count("id"))
+                .order_by()
+            )
+        except DatabaseError:
+            logger.exception("Could not count the pending messages")
+        else:
+            pending = GaugeMetricFamily(
+                "messaging_pending_messages",
+                "Messages waiting to be sent, by status.",
+                labels=["status"],
+            )
+            for status in PENDING_STATUSES:
+                pending.add_metric([status], counts.get(status, 0))
+            yield pending
+
+        if settings.MESSAGING_INBOUND_BUFFER:
+            try:
+                length = inbound_buffer.redis.xlen(inbound_buffer.stream)
+            except redis.RedisError:
+                logger.exception("Could not read the length of the inbound buffer")
+            else:
+                yield GaugeMetricFamily(
+                    "messaging_inbound_buffer_length",
+                    "Inbound messages waiting in the buffer.",
+                    value=length,
+                )
+
+
+def multiprocess_mode():
+    return "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+
+def build_registry(queues=False):
+    """
+    Registry of the metrics to export: those of every process writing to
+    PROMETHEUS_MULTIPROC_DIR when it is set, else those of this process.
+
+    :param queues: Whether to add the queue depths, see QueueCollector.
+    :return: A new CollectorRegistry.
+    """
+    registry = CollectorRegistry()
+    if multiprocess_mode():
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry.register(REGISTRY)
+    if queues:
+        registry.register(QueueCollector())
+    return registry
+
+
+def reset_multiprocess_dir():
+    """
+    Empty PROMETHEUS_MULTIPROC_DIR, before the processes of a service start.
+    The samples of a previous run would otherwise be added to the new ones.
+    """
+    if multiprocess_mode():
+        directory = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+
+
+def mark_process_dead(pid):
+    """
+    Forget the live samples of a process that exited, in multiprocess mode.
+    """
+    if multiprocess_mode():
+        multiprocess.mark_process_dead(pid)
+
+
+def start_exporter(port):
+    """
+    Serve the metrics over HTTP on port from a background thread, e.g. in the
+    main process of a Celery worker.
+    """
+    start_http_server(port, registry=build_registry())
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("messaging", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="message",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("QUEUED", "Queued"),
+                    ("SENDING", "Sending"),
+                    ("RETRYING", "Retrying"),
+                    ("SENT", "Sent"),
+                    ("FAILED", "Failed"),
+                    ("RECIEVED", "Received"),
+                ],
+                max_length=10,
+            ),
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction. Building the
+    # indexes concurrently doesn't lock the message table against writes.
+    atomic = False
+
+    dependencies = [
+        ("messaging", "0002_message_retrying_status"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="message",
+            index=models.Index(
+                fields=["conversation", "timestamp"],
+                name="message_conv_timestamp_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="message",
+            index=models.Index(
+                fields=["status", "created_at"],
+                name="message_status_created_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="message",
+            index=models.Index(fields=["created_at"], name="message_created_at_idx"),
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("messaging", "0004_conversation_activity_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="message",
+            name="batch_id",
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+        AddIndexConcurrently(
+            model_name="message",
+            index=models.Index(
+                fields=["batch_id", "status"], name="message_batch_status_idx"
+            ),
+        ),
+    ]
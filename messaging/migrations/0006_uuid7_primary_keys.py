@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:04
+
+import messaging.ids
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("messaging", "0005_message_batch_id"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="conversation",
+            name="id",
+            field=models.UUIDField(
+                default=messaging.ids.uuid7,
+                editable=False,
+                primary_key=True,
+                serialize=False,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="message",
+            name="id",
+            field=models.UUIDField(
+                default=messaging.ids.uuid7,
+                editable=False,
+                primary_key=True,
+                serialize=False,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="participant",
+            name="id",
+            field=models.UUIDField(
+                default=messaging.ids.uuid7,
+                editable=False,
+                primary_key=True,
+                serialize=False,
+            ),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("messaging", "0006_uuid7_primary_keys"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProviderMessageKey",
+            fields=[
+                (
+                    "provider_message_id",
+                    models.CharField(max_length=100, primary_key=True, serialize=False),
+                ),
+                ("message_id", models.UUIDField()),
+                ("created_at", models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
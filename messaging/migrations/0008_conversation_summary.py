@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("messaging", "0007_provider_message_key"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="conversation",
+            name="last_message_direction",
+            field=models.CharField(
+                blank=True, editable=False, max_length=10, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="conversation",
+            name="last_message_id",
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="conversation",
+            name="last_message_preview",
+            field=models.CharField(
+                blank=True, editable=False, max_length=160, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="conversation",
+            name="last_message_timestamp",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="conversation",
+            name="message_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
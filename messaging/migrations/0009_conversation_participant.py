@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:22
+
+import django.db.models.deletion
+import messaging.ids
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("messaging", "0008_conversation_summary"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ConversationParticipant",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=messaging.ids.uuid7,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("last_activity", models.DateTimeField()),
+                (
+                    "conversation",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="memberships",
+                        to="messaging.conversation",
+                    ),
+                ),
+                (
+                    "participant",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="memberships",
+                        to="messaging.participant",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["participant", "last_activity", "conversation"],
+                        name="membership_inbox_idx",
+                    )
+                ],
+                "unique_together": {("participant", "conversation")},
+            },
+        ),
+    ]
@@ -0,0 +1,82 @@
+from django.db import migrations
+
+# Conversations updated per statement, each batch is committed on its own so
+# the rows of the other conversations aren't locked while the table is filled
+BATCH_SIZE = 1000
+
+# Summaries of the existing conversations, maintained by messaging.summaries
+# from then on
+SUMMARIES_SQL = """
+UPDATE messaging_conversation AS c SET
+    message_count = s.count,
+    last_message_id = s.id,
+    last_message_preview = left(s.body, 160),
+    last_message_direction = s.direction,
+    last_message_timestamp = s."timestamp",
+    last_activity = GREATEST(c.last_activity, s."timestamp")
+FROM (
+    SELECT DISTINCT ON (conversation_id)
+        conversation_id, id, body, direction, "timestamp",
+        count(*) OVER (PARTITION BY conversation_id) AS count
+    FROM messaging_message
+    WHERE conversation_id = ANY(%(ids)s::uuid[])
+    ORDER BY conversation_id, "timestamp" DESC, id DESC
+) AS s
+WHERE c.id = s.conversation_id
+"""
+
+# Memberships of the existing conversations, created with the conversations
+# from then on
+MEMBERSHIPS_SQL = """
+INSERT INTO messaging_conversationparticipant
+    (id, conversation_id, participant_id, last_activity)
+SELECT gen_random_uuid(), id, participant_id, last_activity
+FROM messaging_conversation,
+    LATERAL (VALUES (participant_1_id), (participant_2_id)) AS p (participant_id)
+WHERE id = ANY(%(ids)s::uuid[])
+ON CONFLICT DO NOTHING
+"""
+
+
+def backfill(connection, sql, batch_size=BATCH_SIZE):
+    """
+    Run sql for the conversations in batches of batch_size, in the order of
+    their ids.
+
+    :param sql: Statement taking the ids of the batch as the ids parameter.
+    """
+    last = "00000000-0000-0000-0000-000000000000"
+    with connection.cursor() as cursor:
+        while True:
+            cursor.execute(
+                "SELECT id FROM messaging_conversation WHERE id > %s "
+                "ORDER BY id LIMIT %s",
+                [last, batch_size],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+            if not ids:
+                return
+            cursor.execute(sql, {"ids": ids})
+            last = ids[-1]
+
+
+def backfill_summaries(apps, schema_editor):
+    backfill(schema_editor.connection, SUMMARIES_SQL)
+
+
+def backfill_memberships(apps, schema_editor):
+    backfill(schema_editor.connection, MEMBERSHIPS_SQL)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("messaging", "0009_conversation_participant"),
+    ]
+
+    operations = [
+        # Memberships copy the last_activity of the summaries
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+        migrations.RunPython(backfill_memberships, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+# Messages claimed before the column existed are reclaimed after the timeout
+# if they are still SENDING by then
+CLAIMED_SQL = "UPDATE messaging_message SET claimed_at = now() WHERE status = 'SENDING'"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("messaging", "0010_backfill_conversations"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="message",
+            name="claimed_at",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunSQL(CLAIMED_SQL, migrations.RunSQL.noop),
+    ]
@@ -1,6 +1,6 @@
-import uuid
 from django.db import models
 from django.core.validators import validate_email, RegexValidator
+from .ids import uuid7
 
 
 # Create your models here.
@@ -9,7 +9,7 @@ class Participant(models.Model):
     Each participant can have a unique phone number and email.
     """
 
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     phone = models.CharField(
         max_length=20,
         unique=True,
@@ -30,9 +30,14 @@ class Participant(models.Model):
 class Conversation(models.Model):
     """Conversation model to represent a messaging conversation.
     Each conversation can have multiple messages and 2 participants.
+
+    The last_message fields and message_count summarize its messages for the
+    conversation list, they are updated with every message created or
+    deleted (see messaging.summaries). last_activity is the time of the
+    latest message, or of the creation of the conversation.
     """
 
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     participant_1 = models.ForeignKey(
         Participant,
         on_delete=models.CASCADE,
@@ -44,9 +49,63 @@ class Conversation(models.Model):
         related_name="participant_2_conversations",
     )
     last_activity = models.DateTimeField(auto_now=True)
+    # Not a foreign key, a partitioned message table can't be referenced
+    last_message_id = models.UUIDField(null=True, blank=True, editable=False)
+    # Start of the body of the last message
+    last_message_preview = models.CharField(
+        max_length=160, null=True, blank=True, editable=False
+    )
+    last_message_direction = models.CharField(
+        max_length=10, null=True, blank=True, editable=False
+    )
+    last_message_timestamp = models.DateTimeField(null=True, blank=True, editable=False)
+    message_count = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         unique_together = ("participant_1", "participant_2")
+        indexes = [
+            # Keyset pagination of the conversation list, most recent first
+            # with a backward scan
+            models.Index(
+                fields=["last_activity", "id"],
+                name="conversation_activity_idx",
+            ),
+        ]
+
+
+class ConversationParticipant(models.Model):
+    """Membership of a participant in a conversation, for participant inboxes.
+    A participant can be either participant of a conversation, so listing
+    their conversations from Conversation needs an OR across both columns.
+    Each conversation has one row per participant instead, created with the
+    conversation. last_activity is a copy of the one of the conversation,
+    updated with it (see messaging.summaries), so an inbox page is one scan
+    of membership_inbox_idx.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
+    conversation = models.ForeignKey(
+        Conversation, on_delete=models.CASCADE, related_name="memberships"
+    )
+    # Indexed by the unique constraint
+    participant = models.ForeignKey(
+        Participant,
+        on_delete=models.CASCADE,
+        related_name="memberships",
+        db_index=False,
+    )
+    last_activity = models.DateTimeField()
+
+    class Meta:
+        unique_together = ("participant", "conversation")
+        indexes = [
+            # Keyset pagination of the inbox of a participant, most recent
+            # first with a backward scan
+            models.Index(
+                fields=["participant", "last_activity", "conversation"],
+                name="membership_inbox_idx",
+            ),
+        ]
 
 
 class Message(models.Model):
@@ -55,9 +114,11 @@ class Message(models.Model):
     message type, direction, body
 
     It can optionaly have attachments, a status based on where it is in the queue,
-    and a last error message if it failed to send.
+    and a last error message if it failed to send. Messages waiting for a
+    scheduled retry are RETRYING, FAILED messages won't be sent again.
     The timestamp is when the message was sent or received.
     The created_at field is when the message was created in the database.
+    The batch_id groups the messages created by one bulk send.
     """
 
     MESSAGE_TYPE_CHOICES = [
@@ -73,11 +134,12 @@ class Message(models.Model):
     STATUS_CHOICES = [
         ("QUEUED", "Queued"),
         ("SENDING", "Sending"),
+        ("RETRYING", "Retrying"),
         ("SENT", "Sent"),
         ("FAILED", "Failed"),
         ("RECIEVED", "Received"),
     ]
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE)
     sender = models.ForeignKey(
         Participant,
@@ -102,6 +164,44 @@ class Message(models.Model):
 
     timestamp = models.DateTimeField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # Set on the messages created together by a bulk send
+    batch_id = models.UUIDField(null=True, blank=True, editable=False)
+    # Last time a worker moved the message to SENDING, see
+    # tasks.reclaim_stalled_messages
+    claimed_at = models.DateTimeField(null=True, blank=True, editable=False)
 
     class Meta:
         ordering = ["created_at"]
+        # Created with CREATE INDEX CONCURRENTLY, see migration 0003
+        indexes = [
+            # Conversation timelines
+            models.Index(
+                fields=["conversation", "timestamp"],
+                name="message_conv_timestamp_idx",
+            ),
+            # Scans of the messages waiting to be sent
+            models.Index(
+                fields=["status", "created_at"],
+                name="message_status_created_idx",
+            ),
+            # Default ordering of the message list
+            models.Index(fields=["created_at"], name="message_created_at_idx"),
+            # Progress of bulk sends, see migration 0005
+            models.Index(
+                fields=["batch_id", "status"], name="message_batch_status_idx"
+            ),
+        ]
+
+
+class ProviderMessageKey(models.Model):
+    """Provider message id of a stored inbound message.
+    A partitioned message table can't have a unique constraint on
+    provider_message_id alone, so with MESSAGING_PARTITIONED_MESSAGES inbound
+    messages are deduplicated by inserting their key here first, in the same
+    transaction as the message. Unused otherwise.
+    """
+
+    provider_message_id = models.CharField(max_length=100, primary_key=True)
+    message_id = models.UUIDField()
+    # Keys are deleted with the partitions of their messages
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
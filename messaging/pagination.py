@@ -0,0 +1,161 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on a (field, id) pair.
+
+    Rows are ordered by `ordering`, and the cursor is an opaque token holding
+    the values of the last row of the previous page. The next page is fetched
+    with a `WHERE (field, id) > (value, id)` condition instead of an OFFSET,
+    so a deep page costs the same as the first one. The id breaks ties between
+    rows with the same field value, so no row is skipped or repeated.
+
+    Prefix both fields with "-" for a descending order.
+    """
+
+    ordering = ("created_at", "id")
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 200
+    page_size_query_param = "page_size"
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.next_position = None
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.after(position))
+
+        # Fetch one extra row to know if there is a next page
+        results = list(queryset[: self.page_size + 1])
+        if len(results) > self.page_size:
+            results = results[: self.page_size]
+            last = results[-1]
+            self.next_position = [
+                getattr(last, name.lstrip("-")) for name in self.ordering
+            ]
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(self.next_position)
+        )
+
+    def after(self, position):
+        """
+        Build the condition selecting the rows after a position.
+        The redundant `field >= value` term gives the database an index range
+        to scan, the rest of the condition only filters the rows with equal
+        values.
+        """
+        (field, field_value), (key, key_value) = zip(
+            [name.lstrip("-") for name in self.ordering], position
+        )
+        lookup = "lt" if self.ordering[0].startswith("-") else "gt"
+        return Q(**{f"{field}__{lookup}e": field_value}) & (
+            Q(**{f"{field}__{lookup}": field_value})
+            | Q(**{field: field_value, f"{key}__{lookup}": key_value})
+        )
+
+    def encode_cursor(self, position):
+        values = [
+            value.isoformat() if hasattr(value, "isoformat") else str(value)
+            for value in position
+        ]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, request, model):
+        """
+        Decode the cursor of the request.
+
+        :return: The position as a list of values, or None on the first page.
+        :raises NotFound: If the cursor is not a valid token.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                raise ValueError
+            position = [
+                model._meta.get_field(name.lstrip("-")).to_python(value)
+                for name, value in zip(self.ordering, values)
+            ]
+            # The ordering fields are not nullable, and None can't be compared
+            if None in position:
+                raise ValueError
+            return position
+        except (
+            binascii.Error,
+            UnicodeDecodeError,
+            TypeError,
+            ValueError,
+            ValidationError,
+        ):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class TimelinePagination(KeysetPagination):
+    """
+    Keyset pagination of the messages of a conversation, by timestamp.
+    """
+
+    ordering = ("timestamp", "id")
+
+
+class ConversationPagination(KeysetPagination):
+    """
+    Keyset pagination of conversations, most recent activity first. Pages
+    are read with a backward scan of conversation_activity_idx.
+    """
+
+    ordering = ("-last_activity", "-id")
+
+
+class InboxPagination(KeysetPagination):
+    """
+    Keyset pagination of the memberships of a participant, most recent
+    activity first. Pages are read with a backward scan of
+    membership_inbox_idx.
+    """
+
+    ordering = ("-last_activity", "-conversation_id")
@@ -0,0 +1,307 @@
+import re
+from collections import Counter
+
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import summaries
+from .models import Message, ProviderMessageKey
+
+TABLE = Message._meta.db_table
+LEGACY_PARTITION = f"{TABLE}_legacy"
+DEFAULT_PARTITION = f"{TABLE}_default"
+
+_BOUNDS = re.compile(r"FROM \((.+)\) TO \((.+)\)")
+
+
+def month_start(value):
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(value, months):
+    years, month = divmod(value.month - 1 + months, 12)
+    return value.replace(year=value.year + years, month=month + 1)
+
+
+def partition_name(month):
+    return f"{TABLE}_p{month:%Y_%m}"
+
+
+def _quote(name):
+    return connection.ops.quote_name(name)
+
+
+def _parse_bound(value):
+    if value in ("MINVALUE", "MAXVALUE"):
+        return None
+    return parse_datetime(value.strip("'"))
+
+
+def is_partitioned():
+    """
+    :return: True if the message table has been converted by convert.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass",
+            [TABLE],
+        )
+        return cursor.fetchone() is not None
+
+
+def list_partitions():
+    """
+    :return: List of (name, lower bound, upper bound) of the partitions of the
+        message table, ordered by name. Unbounded sides are None, and both
+        bounds are None for the default partition.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+            FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = %s::regclass
+            ORDER BY child.relname
+            """,
+            [TABLE],
+        )
+        partitions = []
+        for name, bounds in cursor.fetchall():
+            match = _BOUNDS.search(bounds)
+            if match is None:
+                partitions.append((name, None, None))
+            else:
+                partitions.append(
+                    (name, _parse_bound(match[1]), _parse_bound(match[2]))
+                )
+        return partitions
+
+
+def convert(months_ahead, now=None):
+    """
+    Convert the message table to a table range-partitioned by month of
+    timestamp.
+
+    The existing table becomes the partition of all rows before the first
+    month without messages, the others are created by ensure_partitions, plus
+    a default partition for timestamps out of their range. The table is
+    locked while the primary key index (id, timestamp) of existing rows is
+    built and the rows are checked against the partition bounds.
+
+    Unique constraints of a partitioned table must include the partition
+    key, so provider_message_id is no longer unique in the table: the keys of
+    existing inbound messages are copied to ProviderMessageKey, which
+    deduplicates them from then on (see MESSAGING_PARTITIONED_MESSAGES).
+
+    :param months_ahead: Number of monthly partitions to create after the
+        current month.
+    :raises ValueError: If the table is already partitioned.
+    """
+    if is_partitioned():
+        raise ValueError(f"{TABLE} is already partitioned")
+    now = now or timezone.now()
+    table = _quote(TABLE)
+    legacy = _quote(LEGACY_PARTITION)
+    keys_table = _quote(ProviderMessageKey._meta.db_table)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(f"""
+            INSERT INTO {keys_table} (provider_message_id, message_id, created_at)
+            SELECT provider_message_id, id, created_at FROM {table}
+            WHERE provider_message_id IS NOT NULL
+            ON CONFLICT DO NOTHING
+            """)
+        cursor.execute(f'SELECT max("timestamp") FROM {table}')
+        (latest,) = cursor.fetchone()
+        boundary = add_months(month_start(max(now, latest or now)), 1)
+
+        # Indexes and foreign keys to recreate on the partitioned table,
+        # unique ones (primary key and provider_message_id) aside
+        cursor.execute(
+            """
+            SELECT indexname, indexdef FROM pg_indexes
+            WHERE tablename = %s AND indexdef NOT LIKE 'CREATE UNIQUE INDEX %%'
+            """,
+            [TABLE],
+        )
+        indexes = cursor.fetchall()
+        cursor.execute(
+            """
+            SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+            WHERE conrelid = %s::regclass AND contype = 'f'
+            """,
+            [TABLE],
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(
+            """
+            SELECT conname FROM pg_constraint
+            WHERE conrelid = %s::regclass AND contype = 'p'
+            """,
+            [TABLE],
+        )
+        (primary_key,) = cursor.fetchone()
+
+        cursor.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+        cursor.execute(f"ALTER TABLE {legacy} DROP CONSTRAINT {_quote(primary_key)}")
+        cursor.execute(
+            f"CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS "
+            f'INCLUDING CONSTRAINTS) PARTITION BY RANGE ("timestamp")'
+        )
+        cursor.execute(f'ALTER TABLE {table} ADD PRIMARY KEY (id, "timestamp")')
+        for name, definition in foreign_keys:
+            cursor.execute(
+                f"ALTER TABLE {table} ADD CONSTRAINT {_quote(name)} {definition}"
+            )
+        for name, definition in indexes:
+            # Index names are unique per schema, the legacy index is attached
+            # to the new one below
+            cursor.execute(
+                f"ALTER INDEX {_quote(name)} RENAME TO {_quote(name[:59] + '_old')}"
+            )
+            cursor.execute(definition)
+        cursor.execute(
+            f"ALTER TABLE {table} ATTACH PARTITION {legacy} "
+            "FOR VALUES FROM (MINVALUE) TO (%s)",
+            [boundary],
+        )
+        cursor.execute(
+            f"CREATE TABLE {_quote(DEFAULT_PARTITION)} PARTITION OF {table} DEFAULT"
+        )
+        ensure_partitions(months_ahead, now)
+
+
+def ensure_partitions(months_ahead, now=None):
+    """
+    Create the monthly partitions of the current month and the next
+    months_ahead months that don't exist yet.
+
+    A partition can't be created while the default partition holds rows of
+    its range, e.g. messages with a timestamp in the future, or received
+    after a month was skipped by the maintenance. Those rows are moved to
+    the new partition, in the transaction that creates it.
+
+    :return: The names of the created partitions.
+    """
+    now = now or timezone.now()
+    existing = [
+        (lower, upper)
+        for name, lower, upper in list_partitions()
+        if name != DEFAULT_PARTITION
+    ]
+    created = []
+    month = month_start(now)
+    with connection.cursor() as cursor:
+        for _ in range(months_ahead + 1):
+            upper = add_months(month, 1)
+            overlaps = any(
+                (lower is None or lower < upper) and (bound is None or bound > month)
+                for lower, bound in existing
+            )
+            if not overlaps:
+                name = partition_name(month)
+                _create_partition(cursor, name, month, upper)
+                created.append(name)
+            month = upper
+    return created
+
+
+def _create_partition(cursor, name, lower, upper):
+    table = _quote(TABLE)
+    default = _quote(DEFAULT_PARTITION)
+    cursor.execute(
+        f'SELECT 1 FROM {default} WHERE "timestamp" >= %s AND "timestamp" < %s '
+        "LIMIT 1",
+        [lower, upper],
+    )
+    if cursor.fetchone() is None:
+        cursor.execute(
+            f"CREATE TABLE {_quote(name)} PARTITION OF {table} "
+            "FOR VALUES FROM (%s) TO (%s)",
+            [lower, upper],
+        )
+        return
+    # Attaching the partition checks that the default partition has no row
+    # left in its range, and creates its indexes
+    with transaction.atomic():
+        cursor.execute(
+            f"CREATE TABLE {_quote(name)} (LIKE {table} INCLUDING DEFAULTS "
+            "INCLUDING CONSTRAINTS)"
+        )
+        cursor.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM {default}
+                WHERE "timestamp" >= %s AND "timestamp" < %s
+                RETURNING *
+            )
+            INSERT INTO {_quote(name)} SELECT * FROM moved
+            """,
+            [lower, upper],
+        )
+        cursor.execute(
+            f"ALTER TABLE {table} ATTACH PARTITION {_quote(name)} "
+            "FOR VALUES FROM (%s) TO (%s)",
+            [lower, upper],
+        )
+
+
+def expire_partitions(retention_months, drop=False, now=None, batch_size=10000):
+    """
+    Detach the partitions whose messages are all older than retention_months
+    months before the current month, and delete the ProviderMessageKey rows
+    of the same period.
+
+    The messages of the detached partitions are then removed from the
+    summaries of their conversations, batch_size conversations per
+    transaction.
+
+    :param drop: Drop the detached partitions, otherwise they are left as
+        standalone tables, to be archived.
+    :return: The names of the detached partitions.
+    """
+    now = now or timezone.now()
+    cutoff = add_months(month_start(now), -retention_months)
+    expired = [
+        name
+        for name, _, upper in list_partitions()
+        if upper is not None and upper <= cutoff
+    ]
+    counts = Counter()
+    with connection.cursor() as cursor:
+        for name in expired:
+            cursor.execute(
+                f"SELECT conversation_id, count(*) FROM {_quote(name)} "
+                "GROUP BY conversation_id"
+            )
+            counts.update(dict(cursor.fetchall()))
+            cursor.execute(
+                f"ALTER TABLE {_quote(TABLE)} DETACH PARTITION {_quote(name)}"
+            )
+            if drop:
+                cursor.execute(f"DROP TABLE {_quote(name)}")
+
+    conversation_ids = sorted(counts)
+    for i in range(0, len(conversation_ids), batch_size):
+        with transaction.atomic():
+            summaries.remove_expired_messages(
+                {
+                    conversation_id: counts[conversation_id]
+                    for conversation_id in conversation_ids[i : i + batch_size]
+                }
+            )
+
+    # In batches, so no single statement holds locks on many rows for long
+    while True:
+        keys = list(
+            ProviderMessageKey.objects.filter(created_at__lt=cutoff).values_list(
+                "pk", flat=True
+            )[:batch_size]
+        )
+        if not keys:
+            break
+        ProviderMessageKey.objects.filter(pk__in=keys).delete()
+    return expired
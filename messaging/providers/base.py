@@ -1,46 +1,223 @@
-from datetime import datetime
+import math
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 
 import httpx
-from tenacity import (
-    retry,
-    stop_after_attempt,
-    wait_exponential,
-    retry_if_exception_type,
-)
+
+from .. import metrics
+from .circuit import get_breaker
+from .clients import get_client
+
+
+class ProviderError(Exception):
+    """
+    Raised when a request to a provider fails.
+    `retryable` tells whether sending the same request again later can succeed.
+    """
+
+    retryable = False
+
+    def __init__(self, message, status_code=None, retry_after=None):
+        """
+        :param message: The error message.
+        :param status_code: The HTTP status code of the response, if any.
+        :param retry_after: Seconds the provider asked us to wait, if any.
+        """
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class RetryableProviderError(ProviderError):
+    """
+    A temporary failure: server errors, rate limiting, timeouts and network errors.
+    """
+
+    retryable = True
+
+
+class CircuitOpenError(RetryableProviderError):
+    """
+    Raised instead of sending a request to a provider whose circuit is open,
+    see circuit.CircuitBreaker. The request was not sent: try again after
+    `retry_after` seconds.
+    """
+
+
+class PermanentProviderError(ProviderError):
+    """
+    A failure that will happen again on every retry, e.g. a 4xx response.
+    """
+
+    retryable = False
+
+
+def parse_retry_after(value):
+    """
+    Parse a Retry-After header, given either in seconds or as an HTTP date.
+
+    :param value: The header value, or None.
+    :return: The number of seconds to wait, or None if missing or invalid.
+    """
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        pass
+    else:
+        # float() also parses "nan" and "inf"
+        return max(seconds, 0.0) if math.isfinite(seconds) else None
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def error_from_response(response):
+    """
+    Build the ProviderError matching an unsuccessful response.
+    429, 408 and 5xx responses are retryable, other responses are permanent.
+
+    :param response: The httpx.Response with an error status code.
+    :return: A RetryableProviderError or PermanentProviderError.
+    """
+    message = f"{response.status_code} error from {response.request.url}"
+    if response.status_code in (408, 429) or response.status_code >= 500:
+        return RetryableProviderError(
+            message,
+            status_code=response.status_code,
+            retry_after=parse_retry_after(response.headers.get("Retry-After")),
+        )
+    return PermanentProviderError(message, status_code=response.status_code)
 
 
 class MessagingProvider:
     """
     Base class for messaging providers.
+    Subclasses set `name`, the label of their requests in the metrics and
+    the name of their circuit breaker.
     """
 
-    def __init__(self, timeout=10):
+    name = "unknown"
+
+    def __init__(self, timeout=10, base_url=None):
         """
         Initialize the messaging provider with a timeout.
+        The HTTP client is shared by every provider instance with the same
+        base URL and timeout in the process, see clients.get_client.
 
         :param timeout: The timeout for HTTP requests in seconds.
+        :param base_url: The base URL of the provider API.
         """
         self.timeout = timeout
-        self.client = httpx.Client(timeout=httpx.Timeout(timeout))
+        self.base_url = base_url
+        self.client = get_client(base_url, timeout)
+        self.breaker = get_breaker(self.name)
 
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=10),
-        retry=retry_if_exception_type(httpx.HTTPStatusError),
-    )
     def send_request(self, method, url, data=None):
         """
         Send a message using the specified method and URL.
+        Failed requests are not retried here, so the caller never sleeps.
+        Retries are scheduled by messaging.retry based on the type of the error.
+
+        :param method: The HTTP method to use (e.g., 'POST', 'GET').
+        :param url: The URL to send the request to.
+        :param data: The data to send in the request body (optional).
+        :return: The response from the server.
+        :raises CircuitOpenError: Without sending the request, when the
+            circuit of the provider is open.
+        :raises RetryableProviderError: On 5xx, 408 and 429 responses, timeouts and network errors.
+        :raises PermanentProviderError: On other unsuccessful responses.
+        """
+        probe = self.check_circuit()
+        start = time.perf_counter()
+        try:
+            response = self.client.request(method, url, json=data)
+        except httpx.TransportError as exc:
+            self.observe_request(start, None, probe)
+            raise RetryableProviderError(str(exc) or repr(exc)) from exc
+        self.observe_request(start, response.status_code, probe)
+        if response.is_error:
+            raise error_from_response(response)
+        return response.json()
+
+    async def asend_request(self, client, method, url, data=None):
+        """
+        Async counterpart of send_request for the delivery engine.
 
+        :param client: The httpx.AsyncClient to send the request with.
         :param method: The HTTP method to use (e.g., 'POST', 'GET').
         :param url: The URL to send the request to.
         :param data: The data to send in the request body (optional).
         :return: The response from the server.
         """
-        response = self.client.request(method, url, json=data)
-        response.raise_for_status()
+        probe = self.circuit_probe(*await self.breaker.aallow(self.timeout))
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, json=data)
+        except httpx.TransportError as exc:
+            await self.breaker.arecord(None, self.observe_duration(start, None), probe)
+            raise RetryableProviderError(str(exc) or repr(exc)) from exc
+        await self.breaker.arecord(
+            response.status_code,
+            self.observe_duration(start, response.status_code),
+            probe,
+        )
+        if response.is_error:
+            raise error_from_response(response)
         return response.json()
 
+    def check_circuit(self):
+        """
+        :return: Whether the request about to be sent is the probe of a
+            half-open circuit.
+        :raises CircuitOpenError: If the circuit of the provider is open.
+        """
+        return self.circuit_probe(*self.breaker.allow(self.timeout))
+
+    def circuit_probe(self, delay, probe):
+        """
+        Turn the (delay, probe) answer of CircuitBreaker.allow into the
+        result of check_circuit.
+        """
+        if delay:
+            raise CircuitOpenError(
+                f"Circuit of the {self.name} provider is open", retry_after=delay
+            )
+        return probe
+
+    def observe_request(self, start, status_code, probe=False):
+        """
+        Record a request started at `start`, a time.perf_counter() value, in
+        the metrics and in the circuit breaker.
+
+        :param status_code: The status code of the response, or None after a
+            transport error.
+        :param probe: Whether the request was the probe of a half-open circuit.
+        """
+        self.breaker.record(
+            status_code, self.observe_duration(start, status_code), probe
+        )
+
+    def observe_duration(self, start, status_code):
+        """
+        Record the duration of a request in the metrics only.
+
+        :return: The duration in seconds.
+        """
+        duration = time.perf_counter() - start
+        if status_code is None:
+            outcome = "transport_error"
+        else:
+            outcome = metrics.response_outcome(status_code)
+        metrics.PROVIDER_REQUEST_DURATION.labels(self.name, outcome).observe(duration)
+        return duration
+
     def get_current_timestamp(self):
         """
         Get the current timestamp in ISO 8601 format.
@@ -0,0 +1,258 @@
+import logging
+import random
+import threading
+import time
+
+import redis
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .. import metrics
+from ..redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Buckets of the rolling window of outcomes
+WINDOW_BUCKETS = 6
+# Seconds a process trusts the last state it read from Redis
+STATE_TTL = 1.0
+
+# KEYS: the state hash of the circuit. ARGV: seconds a probe may take.
+# Returns {allowed (0 or 1), probe (0 or 1), seconds until the next try}.
+ALLOW_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+if redis.call('HGET', KEYS[1], 'state') ~= 'open' then
+    return {1, 0, '0'}
+end
+local open_until = tonumber(redis.call('HGET', KEYS[1], 'open_until'))
+if now < open_until then
+    return {0, 0, tostring(open_until - now)}
+end
+local probe_until = tonumber(redis.call('HGET', KEYS[1], 'probe_until') or 0)
+if now < probe_until then
+    return {0, 0, tostring(probe_until - now)}
+end
+redis.call('HSET', KEYS[1], 'probe_until', now + tonumber(ARGV[1]))
+return {1, 1, '0'}
+"""
+
+# KEYS: the state hash and the window hash of the circuit.
+# ARGV: failed, slow, probe (0 or 1), window, min_requests, error_rate,
+# slow_rate, open_seconds.
+# Returns {state after the request, whether it changed (0 or 1)}.
+RECORD_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local failed, slow, probe = ARGV[1] == '1', ARGV[2] == '1', ARGV[3] == '1'
+local window = tonumber(ARGV[4])
+local open_seconds = tonumber(ARGV[8])
+
+local function open()
+    redis.call('HSET', KEYS[1], 'state', 'open',
+        'open_until', now + open_seconds, 'probe_until', 0)
+    redis.call('DEL', KEYS[2])
+end
+
+if redis.call('HGET', KEYS[1], 'state') == 'open' then
+    if not probe then
+        -- A request started before the circuit opened
+        return {'open', 0}
+    end
+    if failed or slow then
+        open()
+        return {'open', 0}
+    end
+    redis.call('DEL', KEYS[1], KEYS[2])
+    return {'closed', 1}
+end
+
+local buckets = %(buckets)d
+local bucket = math.floor(now * buckets / window)
+if redis.call('HINCRBY', KEYS[2], bucket .. ':total', 1) == 1 then
+    -- First request of the bucket, forget the buckets out of the window
+    for _, field in ipairs(redis.call('HKEYS', KEYS[2])) do
+        if tonumber(string.match(field, '^(%%d+):')) <= bucket - buckets then
+            redis.call('HDEL', KEYS[2], field)
+        end
+    end
+end
+if failed then redis.call('HINCRBY', KEYS[2], bucket .. ':failed', 1) end
+if slow then redis.call('HINCRBY', KEYS[2], bucket .. ':slow', 1) end
+redis.call('EXPIRE', KEYS[2], math.ceil(window))
+
+local total, failures, slows = 0, 0, 0
+for b = bucket - buckets + 1, bucket do
+    local counts = redis.call('HMGET', KEYS[2], b .. ':total', b .. ':failed', b .. ':slow')
+    total = total + (tonumber(counts[1]) or 0)
+    failures = failures + (tonumber(counts[2]) or 0)
+    slows = slows + (tonumber(counts[3]) or 0)
+end
+if total >= tonumber(ARGV[5]) and (failures >= total * tonumber(ARGV[6])
+        or slows >= total * tonumber(ARGV[7])) then
+    open()
+    return {'open', 1}
+end
+return {'closed', 0}
+""" % {"buckets": WINDOW_BUCKETS}
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker of a provider, with its state shared by every worker
+    through Redis.
+
+    The outcomes of the requests are counted over a rolling window of
+    MESSAGING_CIRCUIT_WINDOW seconds. Once it holds at least
+    MESSAGING_CIRCUIT_MIN_REQUESTS requests, the circuit opens when the share
+    of failures (timeouts, network errors, 5xx and 408 responses) reaches
+    MESSAGING_CIRCUIT_ERROR_RATE, or the share of requests slower than
+    MESSAGING_CIRCUIT_SLOW_CALL seconds reaches MESSAGING_CIRCUIT_SLOW_RATE.
+    Other 4xx responses and 429 tell nothing about the health of the
+    provider and count as successes.
+
+    While the circuit is open, requests are not sent, see allow.
+    After MESSAGING_CIRCUIT_OPEN_SECONDS seconds, a single request is let
+    through as a probe: the circuit closes if it succeeds and opens again
+    otherwise.
+
+    Each provider has its own circuit, so an outage of one doesn't hold up
+    the sends of the others. When Redis can't be reached, requests are let
+    through and not counted.
+    """
+
+    prefix = "messaging:circuit"
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.state_key = f"{self.prefix}:{provider}"
+        self.window_key = f"{self.state_key}:window"
+        # Last state read from Redis: the time the circuit is known to be
+        # closed until, or the time it is open until
+        self._closed_until = 0.0
+        self._open_until = 0.0
+
+    @property
+    def redis(self):
+        return get_redis()
+
+    def allow(self, probe_timeout):
+        """
+        Tell whether a request can be sent now.
+
+        :param probe_timeout: Seconds the request may take, if it is a probe.
+        :return: A (delay, probe) tuple. The request can be sent when delay
+            is 0, and probe tells whether it is the probe of a half-open
+            circuit. Otherwise the circuit is open and the request is tried
+            again after delay seconds.
+        """
+        known = self._known_state()
+        if known is not None:
+            return known
+        return self._read_state(probe_timeout)
+
+    async def aallow(self, probe_timeout):
+        """
+        Async version of allow. Redis is called in a worker thread, so the
+        requests of the event loop don't wait on it.
+        """
+        known = self._known_state()
+        if known is not None:
+            return known
+        return await sync_to_async(self._read_state, thread_sensitive=False)(
+            probe_timeout
+        )
+
+    def _known_state(self):
+        # The answer of allow without calling Redis, or None
+        if not settings.MESSAGING_CIRCUIT_BREAKER:
+            return 0.0, False
+        now = time.monotonic()
+        if now < self._closed_until:
+            return 0.0, False
+        if now < self._open_until:
+            return self.retry_delay(self._open_until - now), False
+        return None
+
+    def _read_state(self, probe_timeout):
+        now = time.monotonic()
+        try:
+            allowed, probe, wait = self.redis.register_script(ALLOW_SCRIPT)(
+                keys=[self.state_key], args=[probe_timeout]
+            )
+        except redis.RedisError:
+            logger.warning("Could not reach Redis, the circuit breaker is off")
+            return 0.0, False
+        if not allowed:
+            self._open_until = now + float(wait)
+            return self.retry_delay(float(wait)), False
+        if not probe:
+            self._closed_until = now + STATE_TTL
+        return 0.0, bool(probe)
+
+    def record(self, status_code, duration, probe=False):
+        """
+        Count the outcome of a request, opening or closing the circuit.
+
+        :param status_code: The status code of the response, or None if the
+            request failed with a timeout or a network error.
+        :param duration: Duration of the request in seconds.
+        :param probe: Whether the request was a probe, see allow.
+        """
+        if not settings.MESSAGING_CIRCUIT_BREAKER:
+            return
+        failed = status_code is None or status_code == 408 or status_code >= 500
+        try:
+            state, changed = self.redis.register_script(RECORD_SCRIPT)(
+                keys=[self.state_key, self.window_key],
+                args=[
+                    int(failed),
+                    int(duration >= settings.MESSAGING_CIRCUIT_SLOW_CALL),
+                    int(probe),
+                    settings.MESSAGING_CIRCUIT_WINDOW,
+                    settings.MESSAGING_CIRCUIT_MIN_REQUESTS,
+                    settings.MESSAGING_CIRCUIT_ERROR_RATE,
+                    settings.MESSAGING_CIRCUIT_SLOW_RATE,
+                    settings.MESSAGING_CIRCUIT_OPEN_SECONDS,
+                ],
+            )
+        except redis.RedisError:
+            logger.warning("Could not reach Redis, the circuit breaker is off")
+            return
+        state = state.decode()
+        if state == "open":
+            # The next request asks Redis how long the circuit stays open
+            self._closed_until = 0.0
+        if changed:
+            logger.warning("Circuit of the %s provider %s", self.provider, state)
+            metrics.CIRCUIT_TRANSITIONS.labels(self.provider, state).inc()
+
+    async def arecord(self, status_code, duration, probe=False):
+        """
+        Async version of record, calling Redis in a worker thread.
+        """
+        if not settings.MESSAGING_CIRCUIT_BREAKER:
+            return
+        await sync_to_async(self.record, thread_sensitive=False)(
+            status_code, duration, probe
+        )
+
+    @staticmethod
+    def retry_delay(wait):
+        # Spread the sends coming back, so they don't all wait for the probe
+        return wait + random.uniform(0, settings.MESSAGING_CIRCUIT_OPEN_SECONDS / 2)
+
+
+_breakers = {}
+_lock = threading.Lock()
+
+
+def get_breaker(provider):
+    """
+    Get the circuit breaker of a provider, shared by the provider instances
+    of the process so they share its last known state.
+    """
+    with _lock:
+        if provider not in _breakers:
+            _breakers[provider] = CircuitBreaker(provider)
+        return _breakers[provider]
@@ -0,0 +1,81 @@
+import os
+import threading
+
+import httpx
+from django.conf import settings
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    """
+    Forget the clients inherited from the parent process.
+    Pooled connections can't be shared between processes, so every Celery
+    prefork child builds its own clients on first use.
+    """
+    global _lock
+    _lock = threading.Lock()
+    _clients.clear()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_client(base_url=None, timeout=10):
+    """
+    Get the process-wide HTTP client for a provider.
+    Clients are created on first use and reused afterwards, so connections
+    (DNS, TCP and TLS setup) are kept alive between sends.
+
+    :param base_url: The base URL of the provider the client talks to.
+    :param timeout: The timeout for HTTP requests in seconds.
+    :return: A shared httpx.Client.
+    """
+    key = (base_url, timeout)
+    with _lock:
+        client = _clients.get(key)
+        if client is None or client.is_closed:
+            client = httpx.Client(
+                timeout=httpx.Timeout(timeout),
+                limits=httpx.Limits(
+                    max_connections=settings.MESSAGING_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.MESSAGING_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=settings.MESSAGING_HTTP_KEEPALIVE_EXPIRY,
+                ),
+                http2=settings.MESSAGING_HTTP2,
+            )
+            _clients[key] = client
+        return client
+
+
+def create_async_client(max_connections, timeout=10):
+    """
+    Create an HTTP client for the asyncio delivery engine.
+    Async clients are bound to the event loop they are used in, so they are
+    owned by the engine instead of the process-wide registry.
+
+    :param max_connections: Maximum number of concurrent connections.
+    :param timeout: The timeout for HTTP requests in seconds.
+    :return: A new httpx.AsyncClient.
+    """
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(timeout),
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=settings.MESSAGING_HTTP_KEEPALIVE_EXPIRY,
+        ),
+        http2=settings.MESSAGING_HTTP2,
+    )
+
+
+def close_clients():
+    """
+    Close every client in the registry, e.g. when a worker process exits.
+    """
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
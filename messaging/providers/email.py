@@ -1,4 +1,6 @@
-from .base import MessagingProvider
+from django.conf import settings
+
+from .base import MessagingProvider, ProviderError
 
 
 class EmailProvider(MessagingProvider):
@@ -6,9 +8,10 @@ class EmailProvider(MessagingProvider):
     A provider for sending emails.
     """
 
+    name = "email"
+
     def __init__(self, to, _from, body, attachments=[]):
-        super().__init__()
-        self.base_url = "https://www.mailplus.app/api/email"
+        super().__init__(base_url=settings.MESSAGING_EMAIL_PROVIDER_URL)
         self.to = to
         self._from = _from
         self.body = body
@@ -26,13 +29,38 @@ class EmailProvider(MessagingProvider):
         :return: The response from the API.
         """
         try:
-            data = {
-                "to": self.to,
-                "from": self._from,
-                "body": self.body,
-                "attachments": self.attachments,
-                "timestamp": self.get_current_timestamp(),
-            }
-            return self.send_request("POST", self.base_url, data)
+            return self.send_request("POST", self.base_url, self.build_payload())
+        except ProviderError:
+            raise
+        except Exception as e:
+            raise Exception(f"Failed to send email: {str(e)}")
+
+    async def asend_message(self, client):
+        """
+        Send an email using the provider's API without blocking the event loop.
+
+        :param client: The httpx.AsyncClient to send the request with.
+        :return: The response from the API.
+        """
+        try:
+            return await self.asend_request(
+                client, "POST", self.base_url, self.build_payload()
+            )
+        except ProviderError:
+            raise
         except Exception as e:
             raise Exception(f"Failed to send email: {str(e)}")
+
+    def build_payload(self):
+        """
+        Build the request body expected by the email provider's API.
+
+        :return: The request body as a dict.
+        """
+        return {
+            "to": self.to,
+            "from": self._from,
+            "body": self.body,
+            "attachments": self.attachments,
+            "timestamp": self.get_current_timestamp(),
+        }
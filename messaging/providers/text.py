@@ -1,4 +1,6 @@
-from .base import MessagingProvider
+from django.conf import settings
+
+from .base import MessagingProvider, ProviderError
 
 
 class TextProvider(MessagingProvider):
@@ -6,9 +8,10 @@ class TextProvider(MessagingProvider):
     A provider for sending text messages.
     """
 
+    name = "text"
+
     def __init__(self, to, _from, _type, body, attachments=None):
-        super().__init__()
-        self.base_url = "https://www.provider.app/api/messages"
+        super().__init__(base_url=settings.MESSAGING_TEXT_PROVIDER_URL)
         self.to = to
         self._from = _from
         self.type = _type
@@ -27,14 +30,39 @@ class TextProvider(MessagingProvider):
         :return: The response from the API.
         """
         try:
-            data = {
-                "to": self.to,
-                "from": self._from,
-                "type": self.type,
-                "body": self.body,
-                "attachments": self.attachments,
-                "timestamp": self.get_current_timestamp(),
-            }
-            return self.send_request("POST", self.base_url, data)
+            return self.send_request("POST", self.base_url, self.build_payload())
+        except ProviderError:
+            raise
+        except Exception as e:
+            raise Exception(f"Failed to send text message: {str(e)}")
+
+    async def asend_message(self, client):
+        """
+        Send a text message using the provider's API without blocking the event loop.
+
+        :param client: The httpx.AsyncClient to send the request with.
+        :return: The response from the API.
+        """
+        try:
+            return await self.asend_request(
+                client, "POST", self.base_url, self.build_payload()
+            )
+        except ProviderError:
+            raise
         except Exception as e:
             raise Exception(f"Failed to send text message: {str(e)}")
+
+    def build_payload(self):
+        """
+        Build the request body expected by the text provider's API.
+
+        :return: The request body as a dict.
+        """
+        return {
+            "to": self.to,
+            "from": self._from,
+            "type": self.type,
+            "body": self.body,
+            "attachments": self.attachments,
+            "timestamp": self.get_current_timestamp(),
+        }
@@ -0,0 +1,154 @@
+import logging
+
+import redis
+from django.conf import settings
+
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Generic cell rate algorithm: each limit is one key holding the theoretical
+# arrival time (TAT) of the next request. A request conforms once
+# now >= TAT - (burst - 1) / rate, and pushes the TAT 1 / rate further.
+# The slot of the request is the earliest time all its limits conform. It is
+# reserved (the TATs are moved past it) unless it is more than max_delay
+# seconds away. The clock of Redis is used, so every worker agrees on it.
+#
+# KEYS: one per limit. ARGV: max_delay, then the rate and burst of each limit.
+# Returns {reserved (0 or 1), delay in seconds before the slot}.
+RESERVE_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local max_delay = tonumber(ARGV[1])
+local tats = {}
+local delay = 0
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[2 * i])
+    local burst = tonumber(ARGV[2 * i + 1])
+    tats[i] = math.max(tonumber(redis.call('GET', key) or now), now)
+    delay = math.max(delay, tats[i] - (burst - 1) / rate - now)
+end
+if delay > max_delay then
+    return {0, tostring(delay)}
+end
+for i, key in ipairs(KEYS) do
+    local tat = math.max(tats[i], now + delay) + 1 / tonumber(ARGV[2 * i])
+    redis.call('SET', key, tostring(tat), 'PX', math.ceil((tat - now) * 1000) + 1000)
+end
+return {1, tostring(delay)}
+"""
+
+
+class RateLimiter:
+    """
+    Distributed token buckets pacing the requests to the providers, shared
+    by every worker through Redis.
+
+    Each provider has a bucket of MESSAGING_<PROVIDER>_RATE_LIMIT requests per
+    second holding up to MESSAGING_<PROVIDER>_RATE_BURST tokens, and with
+    MESSAGING_SENDER_RATE_LIMIT each sender address of a provider has its
+    own bucket too. Providers without a rate are not limited.
+
+    A send doesn't poll for a token: it reserves the next free slot and is
+    deferred until then, see reserve. Deferred sends therefore come back
+    spread at the configured rate instead of all at once, and throughput
+    stays at the limit rather than oscillating around it. Slots are reserved
+    at most MESSAGING_RATE_LIMIT_MAX_DELAY seconds ahead.
+
+    When Redis can't be reached, sends are not limited.
+    """
+
+    prefix = "messaging:ratelimit"
+
+    @property
+    def redis(self):
+        return get_redis()
+
+    @staticmethod
+    def route(message):
+        """
+        :param message: A Message with its sender loaded.
+        :return: The name of the provider sending message and the address it
+            is sent from.
+        """
+        if message.message_type == "email":
+            return "email", message.sender.email
+        return "text", message.sender.phone
+
+    def limits(self, provider, sender):
+        """
+        :return: The (key, rate, burst) of the buckets limiting a send of
+            provider from sender.
+        """
+        limits = []
+        rate = getattr(settings, f"MESSAGING_{provider.upper()}_RATE_LIMIT", None)
+        if rate:
+            burst = getattr(settings, f"MESSAGING_{provider.upper()}_RATE_BURST")
+            limits.append((f"{self.prefix}:{provider}", rate, burst))
+        if settings.MESSAGING_SENDER_RATE_LIMIT and sender:
+            limits.append(
+                (
+                    f"{self.prefix}:{provider}:sender:{sender}",
+                    settings.MESSAGING_SENDER_RATE_LIMIT,
+                    settings.MESSAGING_SENDER_RATE_BURST,
+                )
+            )
+        return limits
+
+    def reserve(self, message):
+        """
+        Reserve the slot of a send of message.
+
+        :param message: A Message with its sender loaded.
+        :return: A (delay, reserved) tuple. The message can be sent now when
+            delay is 0, else it is sent after delay seconds if reserved is
+            True. Otherwise no slot was free within
+            MESSAGING_RATE_LIMIT_MAX_DELAY seconds, and the caller asks again
+            after delay seconds.
+        """
+        return self.reserve_many([message])[0]
+
+    def reserve_many(self, messages):
+        """
+        Reserve the slots of the sends of messages, in order, with one round
+        trip to Redis.
+
+        :return: The (delay, reserved) tuples described in reserve.
+        """
+        results = [(0.0, True)] * len(messages)
+        calls = []
+        for index, message in enumerate(messages):
+            limits = self.limits(*self.route(message))
+            if limits:
+                calls.append((index, limits))
+        if not calls:
+            return results
+
+        max_delay = settings.MESSAGING_RATE_LIMIT_MAX_DELAY
+        try:
+            pipeline = self.redis.pipeline(transaction=False)
+            script = self.redis.register_script(RESERVE_SCRIPT)
+            for _, limits in calls:
+                script(
+                    keys=[key for key, _, _ in limits],
+                    args=[max_delay]
+                    + [value for _, rate, burst in limits for value in (rate, burst)],
+                    client=pipeline,
+                )
+            replies = pipeline.execute()
+        except redis.RedisError:
+            logger.warning("Could not reach Redis, sends are not rate limited")
+            return results
+
+        results = list(results)
+        for (index, _), (reserved, delay) in zip(calls, replies):
+            delay = max(float(delay), 0.0)
+            if reserved:
+                results[index] = (delay, True)
+            else:
+                # Ask again when the slot could be within reach
+                results[index] = (delay - max_delay, False)
+        return results
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,17 @@
+import redis
+from django.conf import settings
+
+_client = None
+
+
+def get_redis():
+    """
+    Get the Redis client of the messaging app, connected to MESSAGING_REDIS_URL.
+
+    The client is shared by the threads of the process. Its connection pool
+    notices when the process was forked and opens new connections in the child.
+    """
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.MESSAGING_REDIS_URL)
+    return _client
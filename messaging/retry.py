@@ -0,0 +1,70 @@
+import random
+
+import httpx
+from django.conf import settings
+
+from .providers.base import ProviderError
+
+
+class RetryPolicy:
+    """
+    Decides whether a failed send is retried and how long to wait before.
+
+    Nothing here sleeps: callers reschedule the work through the broker with
+    the returned countdown, so worker slots stay free while a message waits.
+    """
+
+    def __init__(self, max_retries=None, base_delay=None, max_delay=None):
+        """
+        :param max_retries: Maximum number of retries of a message.
+        :param base_delay: Delay in seconds before the first retry.
+        :param max_delay: Upper bound of the exponential backoff in seconds.
+        """
+        self.max_retries = (
+            settings.MESSAGING_RETRY_MAX_RETRIES if max_retries is None else max_retries
+        )
+        self.base_delay = (
+            settings.MESSAGING_RETRY_BASE_DELAY if base_delay is None else base_delay
+        )
+        self.max_delay = (
+            settings.MESSAGING_RETRY_MAX_DELAY if max_delay is None else max_delay
+        )
+
+    def is_retryable(self, exc):
+        """
+        Tell whether an error is temporary.
+        Provider errors carry their own classification (5xx, 408 and 429 are
+        retryable, other 4xx are not). Timeouts and network errors are
+        retryable, anything else is treated as permanent.
+
+        :param exc: The exception raised while sending.
+        :return: True if sending again later can succeed.
+        """
+        if isinstance(exc, ProviderError):
+            return exc.retryable
+        return isinstance(exc, httpx.TransportError)
+
+    def should_retry(self, exc, retries):
+        """
+        :param exc: The exception raised while sending.
+        :param retries: Number of retries already done.
+        :return: True if the send should be retried.
+        """
+        return retries < self.max_retries and self.is_retryable(exc)
+
+    def countdown(self, retries, exc=None):
+        """
+        Compute the delay before the next attempt.
+        The Retry-After value sent by the provider wins when there is one,
+        otherwise an exponential backoff with jitter is used, so messages that
+        failed together don't all come back at the same time.
+
+        :param retries: Number of retries already done.
+        :param exc: The exception raised while sending (optional).
+        :return: The delay in seconds.
+        """
+        retry_after = getattr(exc, "retry_after", None)
+        if retry_after is not None:
+            return retry_after
+        delay = min(self.max_delay, self.base_delay * 2**retries)
+        return random.uniform(delay / 2, delay)
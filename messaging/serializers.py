@@ -1,6 +1,19 @@
+import uuid
+from functools import partial
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.validators import MaxLengthValidator, RegexValidator, validate_email
 from rest_framework import serializers
-from .models import Message, Conversation
-from .utils import resolve_participant, resolve_conversation
+from . import summaries
+from .models import Message, Conversation, Participant
+from .utils import (
+    resolve_participant,
+    resolve_conversation,
+    resolve_participants,
+    resolve_conversations,
+)
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 
 
@@ -42,14 +55,56 @@ class ConversationSerializer(serializers.ModelSerializer):
             "participant_1",
             "participant_2",
             "last_activity",
+            "last_message_id",
+            "last_message_preview",
+            "last_message_direction",
+            "last_message_timestamp",
+            "message_count",
+        ]
+        read_only_fields = [
+            "id",
+            "last_activity",
+            "last_message_id",
+            "last_message_preview",
+            "last_message_direction",
+            "last_message_timestamp",
+            "message_count",
         ]
-        read_only_fields = ["id", "last_activity"]
         extra_kwargs = {
             "participant_1": {"required": True},
             "participant_2": {"required": True},
         }
 
 
+# Digits with an optional leading +, the strict US format of
+# Participant.phone isn't enforced by the API
+PHONE_VALIDATOR = RegexValidator(
+    r"^\+?\d+$", "Phone numbers must only contain digits, after an optional +."
+)
+
+
+def validate_address(value, message_type):
+    """
+    Validate a sender or recipient address against the Participant field it
+    is stored in, so it can't fail the insert: the length of a phone number
+    and its digits for texts, an email address for emails.
+
+    :raises serializers.ValidationError: If the address is invalid.
+    """
+    field = Participant._meta.get_field("email" if message_type == "email" else "phone")
+    validators = [MaxLengthValidator(field.max_length)]
+    validators.append(validate_email if message_type == "email" else PHONE_VALIDATOR)
+    errors = []
+    for validator in validators:
+        try:
+            validator(value)
+        except DjangoValidationError as exc:
+            errors.extend(exc.messages)
+    if errors:
+        raise serializers.ValidationError(errors)
+    return value
+
+
 class MessageCreateSerializer(serializers.Serializer):
     sender = serializers.CharField(required=True)
     recipient = serializers.CharField(required=True)
@@ -61,6 +116,17 @@ class MessageCreateSerializer(serializers.Serializer):
         child=serializers.DictField(), required=False, allow_empty=True
     )
 
+    def validate(self, attrs):
+        errors = {}
+        for name in ("sender", "recipient"):
+            try:
+                validate_address(attrs[name], attrs["message_type"])
+            except serializers.ValidationError as exc:
+                errors[name] = exc.detail
+        if errors:
+            raise serializers.ValidationError(errors)
+        return attrs
+
     def create(self, validated_data):
         if validated_data["message_type"] in ["sms", "mms"]:
             sender_contact = resolve_participant(phone=validated_data["sender"])
@@ -73,15 +139,185 @@ class MessageCreateSerializer(serializers.Serializer):
 
         conversation = resolve_conversation(sender_contact, recipient_contact)
 
-        message = Message.objects.create(
-            conversation=conversation,
-            sender=sender_contact,
-            recipient=recipient_contact,
-            message_type=validated_data["message_type"],
-            direction="outbound",
-            body=validated_data["body"],
-            attachments=validated_data.get("attachments"),
-            status="QUEUED",
-            timestamp=timezone.now(),
-        )
+        with transaction.atomic():
+            message = Message.objects.create(
+                conversation=conversation,
+                sender=sender_contact,
+                recipient=recipient_contact,
+                message_type=validated_data["message_type"],
+                direction="outbound",
+                body=validated_data["body"],
+                attachments=validated_data.get("attachments"),
+                status="QUEUED",
+                timestamp=timezone.now(),
+            )
+            summaries.add_messages([message])
         return message
+
+
+class MessageBulkCreateSerializer(serializers.Serializer):
+    """
+    Serializer for bulk sends. Accepts either one message fanned out to many
+    recipients (sender, recipients, message_type, body, attachments) or a
+    list of complete messages (messages). All messages are created together
+    with the same batch_id.
+    """
+
+    sender = serializers.CharField(required=False)
+    recipients = serializers.ListField(
+        child=serializers.CharField(), required=False, allow_empty=False
+    )
+    message_type = serializers.ChoiceField(
+        choices=Message.MESSAGE_TYPE_CHOICES, required=False
+    )
+    body = serializers.CharField(required=False)
+    attachments = serializers.ListField(
+        child=serializers.DictField(), required=False, allow_empty=True
+    )
+    messages = MessageCreateSerializer(many=True, required=False, allow_empty=False)
+
+    fan_out_fields = ["sender", "recipients", "message_type", "body"]
+
+    def validate(self, attrs):
+        if "messages" in attrs:
+            if any(field in attrs for field in self.fan_out_fields):
+                raise serializers.ValidationError(
+                    "Provide either messages or sender and recipients, not both."
+                )
+            messages = attrs["messages"]
+        else:
+            missing = [field for field in self.fan_out_fields if field not in attrs]
+            if missing:
+                raise serializers.ValidationError(
+                    {field: "This field is required." for field in missing}
+                )
+            self.validate_fan_out(attrs)
+            messages = [
+                {
+                    "sender": attrs["sender"],
+                    "recipient": recipient,
+                    "message_type": attrs["message_type"],
+                    "body": attrs["body"],
+                    "attachments": attrs.get("attachments"),
+                }
+                for recipient in attrs["recipients"]
+            ]
+        if len(messages) > settings.MESSAGING_BULK_SEND_MAX_SIZE:
+            raise serializers.ValidationError(
+                "Too many messages, the maximum is "
+                f"{settings.MESSAGING_BULK_SEND_MAX_SIZE}"
+            )
+        return {"messages": messages}
+
+    @staticmethod
+    def validate_fan_out(attrs):
+        errors = {}
+        try:
+            validate_address(attrs["sender"], attrs["message_type"])
+        except serializers.ValidationError as exc:
+            errors["sender"] = exc.detail
+        recipient_errors = {}
+        for index, recipient in enumerate(attrs["recipients"]):
+            try:
+                validate_address(recipient, attrs["message_type"])
+            except serializers.ValidationError as exc:
+                recipient_errors[index] = exc.detail
+        if recipient_errors:
+            errors["recipients"] = recipient_errors
+        if errors:
+            raise serializers.ValidationError(errors)
+
+    def create(self, validated_data):
+        """
+        Create all messages of the bulk send with a fixed number of statements
+        per chunk: participants and conversations are resolved in bulk and the
+        messages are inserted with bulk_create.
+
+        Each chunk is created in its own transaction, so the rows of the
+        conversations are only locked for the time of a chunk. An optional
+        "on_commit" callable passed to save is called with the ids of the
+        messages of each chunk once it is committed.
+
+        :return: The list of created Message objects.
+        """
+        batch_id = uuid.uuid4()
+        timestamp = timezone.now()
+        messages = validated_data["messages"]
+        on_commit = validated_data.get("on_commit")
+        chunk_size = settings.MESSAGING_BULK_SEND_CHUNK_SIZE
+        created = []
+        for start in range(0, len(messages), chunk_size):
+            chunk = messages[start : start + chunk_size]
+            with transaction.atomic():
+                chunk_created = self.create_chunk(chunk, batch_id, timestamp)
+                if on_commit is not None:
+                    transaction.on_commit(
+                        partial(on_commit, [message.id for message in chunk_created])
+                    )
+            created += chunk_created
+        return created
+
+    def create_chunk(self, messages, batch_id, timestamp):
+        values = {"phone": set(), "email": set()}
+        for data in messages:
+            field = self.participant_field(data["message_type"])
+            values[field].update([data["sender"], data["recipient"]])
+        participants = {
+            field: resolve_participants(field, field_values)
+            for field, field_values in values.items()
+        }
+
+        pairs = []
+        for data in messages:
+            field = self.participant_field(data["message_type"])
+            sender_contact = participants[field][data["sender"]]
+            recipient_contact = participants[field][data["recipient"]]
+            pairs.append((sender_contact, recipient_contact))
+        conversations = resolve_conversations(
+            (sender_contact.id, recipient_contact.id)
+            for sender_contact, recipient_contact in pairs
+        )
+
+        created = Message.objects.bulk_create(
+            [
+                Message(
+                    conversation=conversations[
+                        tuple(sorted([sender_contact.id, recipient_contact.id]))
+                    ],
+                    sender=sender_contact,
+                    recipient=recipient_contact,
+                    message_type=data["message_type"],
+                    direction="outbound",
+                    body=data["body"],
+                    attachments=data.get("attachments"),
+                    status="QUEUED",
+                    timestamp=timestamp,
+                    batch_id=batch_id,
+                )
+                for data, (sender_contact, recipient_contact) in zip(messages, pairs)
+            ]
+        )
+        summaries.add_messages(created)
+        return created
+
+    @staticmethod
+    def participant_field(message_type):
+        return "email" if message_type == "email" else "phone"
+
+
+class MessageExportSerializer(serializers.Serializer):
+    """
+    Serializer of the query parameters of a message export, see
+    MessageExportView. All filters are optional.
+    """
+
+    format = serializers.ChoiceField(choices=["ndjson", "csv"], default="ndjson")
+    conversation = serializers.UUIDField(required=False)
+    # Sender or recipient
+    participant = serializers.UUIDField(required=False)
+    message_type = serializers.ChoiceField(
+        choices=Message.MESSAGE_TYPE_CHOICES, required=False
+    )
+    status = serializers.ChoiceField(choices=Message.STATUS_CHOICES, required=False)
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
@@ -0,0 +1,57 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import resolution_cache
+from .models import Conversation, ConversationParticipant, Participant
+
+
+@receiver(post_delete, sender=Participant)
+def invalidate_participant(sender, instance, **kwargs):
+    """
+    Remove a deleted participant from the resolution cache.
+    """
+    resolution_cache.delete_many(
+        [
+            resolution_cache.participant_key(field, value)
+            for field, value in [("phone", instance.phone), ("email", instance.email)]
+            if value
+        ]
+    )
+
+
+@receiver(post_delete, sender=Conversation)
+def invalidate_conversation(sender, instance, **kwargs):
+    """
+    Remove a deleted conversation from the resolution cache.
+    Participant deletes cascade to their conversations, so this also runs then.
+    """
+    resolution_cache.delete_many(
+        [
+            resolution_cache.conversation_key(
+                instance.participant_1_id, instance.participant_2_id
+            )
+        ]
+    )
+
+
+@receiver(post_save, sender=Conversation)
+def create_memberships(sender, instance, created, **kwargs):
+    """
+    Add the participants of a conversation created with the ORM to its
+    memberships. resolve_conversations inserts them itself.
+    """
+    if created:
+        ConversationParticipant.objects.bulk_create(
+            [
+                ConversationParticipant(
+                    conversation=instance,
+                    participant_id=participant_id,
+                    last_activity=instance.last_activity,
+                )
+                for participant_id in {
+                    instance.participant_1_id,
+                    instance.participant_2_id,
+                }
+            ],
+            ignore_conflicts=True,
+        )
@@ -0,0 +1,200 @@
+from collections import Counter
+
+from django.db import connection
+from django.utils import timezone
+
+from .models import Conversation, ConversationParticipant, Message
+
+PREVIEW_LENGTH = Conversation._meta.get_field("last_message_preview").max_length
+
+CONVERSATION_TABLE = connection.ops.quote_name(Conversation._meta.db_table)
+MESSAGE_TABLE = connection.ops.quote_name(Message._meta.db_table)
+MEMBERSHIP_TABLE = connection.ops.quote_name(ConversationParticipant._meta.db_table)
+
+
+def _timestamp(message):
+    # Naive timestamps are stored in the default time zone
+    if timezone.is_naive(message.timestamp):
+        return timezone.make_aware(message.timestamp)
+    return message.timestamp
+
+
+def _lock(conversation_ids):
+    """
+    Lock the rows of the conversations in the order of their ids, so two
+    transactions updating the same conversations can't deadlock. A single
+    row is locked by its UPDATE.
+    """
+    if len(conversation_ids) > 1:
+        list(
+            Conversation.objects.filter(id__in=conversation_ids)
+            .order_by("id")
+            .select_for_update()
+            .values_list("id", flat=True)
+        )
+
+
+def add_messages(messages):
+    """
+    Add new messages to the summaries of their conversations, with one
+    UPDATE statement for all of them.
+
+    The message count of each conversation is incremented, and its last
+    message and last_activity are replaced by its newest new message if it
+    is more recent, by timestamp then id, so messages stored out of order
+    (e.g. restored from an archive) don't replace a newer last message. The
+    new last_activity is copied to the ConversationParticipant rows in the
+    same statement.
+
+    Must run in the transaction that inserted the messages. The conversation
+    rows stay locked until it ends, so concurrent messages of a conversation
+    are counted one transaction after the other.
+
+    :param messages: The inserted Message instances.
+    """
+    if not messages:
+        return
+    counts = Counter(message.conversation_id for message in messages)
+    newest = {}
+    for message in messages:
+        last = newest.get(message.conversation_id)
+        if last is None or (_timestamp(message), message.id) > (
+            _timestamp(last),
+            last.id,
+        ):
+            newest[message.conversation_id] = message
+
+    conversation_ids = sorted(counts)
+    _lock(conversation_ids)
+    newer = (
+        "c.last_message_id IS NULL OR (v.last_timestamp, v.message_id) > "
+        "(c.last_message_timestamp, c.last_message_id)"
+    )
+    rows = ", ".join(
+        ["(%s::uuid, %s::integer, %s::uuid, %s, %s, %s::timestamptz)"]
+        * len(conversation_ids)
+    )
+    params = []
+    for conversation_id in conversation_ids:
+        message = newest[conversation_id]
+        params += [
+            conversation_id,
+            counts[conversation_id],
+            message.id,
+            # Bodies of inbound payloads aren't always strings
+            str(message.body)[:PREVIEW_LENGTH],
+            message.direction,
+            _timestamp(message),
+        ]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            WITH updated AS (
+                UPDATE {CONVERSATION_TABLE} AS c SET
+                    message_count = c.message_count + v.count,
+                    last_message_id = CASE WHEN {newer}
+                        THEN v.message_id ELSE c.last_message_id END,
+                    last_message_preview = CASE WHEN {newer}
+                        THEN v.preview ELSE c.last_message_preview END,
+                    last_message_direction = CASE WHEN {newer}
+                        THEN v.direction ELSE c.last_message_direction END,
+                    last_message_timestamp = CASE WHEN {newer}
+                        THEN v.last_timestamp ELSE c.last_message_timestamp END,
+                    last_activity = GREATEST(c.last_activity, v.last_timestamp)
+                FROM (VALUES {rows}) AS v (
+                    conversation_id, count, message_id, preview, direction,
+                    last_timestamp
+                )
+                WHERE c.id = v.conversation_id
+                RETURNING c.id, c.last_activity
+            )
+            UPDATE {MEMBERSHIP_TABLE} AS m SET last_activity = u.last_activity
+            FROM updated AS u
+            WHERE m.conversation_id = u.id AND m.last_activity < u.last_activity
+            """,
+            params,
+        )
+
+
+def remove_messages(messages):
+    """
+    Remove deleted messages from the summaries of their conversations.
+
+    The message count of each conversation is decremented. Conversations
+    whose last message was deleted get their newest remaining message as
+    last message, or none.
+
+    Must run in the transaction that deleted the messages, after the delete.
+
+    :param messages: List of (conversation id, message id) pairs.
+    """
+    if not messages:
+        return
+    _remove(
+        Counter(conversation_id for conversation_id, _ in messages),
+        "c.last_message_id = ANY(%s::uuid[])",
+        [[message_id for _, message_id in messages]],
+    )
+
+
+def remove_expired_messages(counts):
+    """
+    Remove the messages of an expired partition from the summaries of their
+    conversations, like remove_messages. The removed messages aren't known
+    one by one, so the last message of a conversation is replaced when it
+    no longer exists.
+
+    Must run after the partition is detached.
+
+    :param counts: Mapping of conversation ids to the number of messages
+        removed.
+    """
+    if not counts:
+        return
+    _remove(
+        counts,
+        f"""
+        c.last_message_id IS NOT NULL AND NOT EXISTS (
+            SELECT 1 FROM {MESSAGE_TABLE} AS m
+            WHERE m.id = c.last_message_id
+                AND m."timestamp" = c.last_message_timestamp
+        )
+        """,
+        [],
+    )
+
+
+def _remove(counts, last_removed, params):
+    conversation_ids = sorted(counts)
+    _lock(conversation_ids)
+    rows = ", ".join(["(%s::uuid, %s::integer)"] * len(conversation_ids))
+    values = []
+    for conversation_id in conversation_ids:
+        values += [conversation_id, counts[conversation_id]]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE {CONVERSATION_TABLE} AS c SET
+                message_count = GREATEST(c.message_count - v.count, 0)
+            FROM (VALUES {rows}) AS v (conversation_id, count)
+            WHERE c.id = v.conversation_id
+            """,
+            values,
+        )
+        # Set to NULL when the conversation has no message left
+        cursor.execute(
+            f"""
+            UPDATE {CONVERSATION_TABLE} AS c SET (
+                last_message_id, last_message_preview, last_message_direction,
+                last_message_timestamp
+            ) = (
+                SELECT m.id, left(m.body, %s), m.direction, m."timestamp"
+                FROM {MESSAGE_TABLE} AS m
+                WHERE m.conversation_id = c.id
+                ORDER BY m."timestamp" DESC, m.id DESC
+                LIMIT 1
+            )
+            WHERE c.id = ANY(%s::uuid[]) AND {last_removed}
+            """,
+            [PREVIEW_LENGTH, conversation_ids, *params],
+        )
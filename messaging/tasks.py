@@ -1,29 +1,83 @@
-from celery import shared_task
+import os
+import time
+from datetime import timedelta
+
+from celery import group, shared_task
+from celery.signals import worker_init, worker_process_shutdown, worker_shutdown
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from opentelemetry import trace
+from . import metrics
+from .archive import archive_messages
+from .delivery import close_engine, get_engine
 from .models import Message
+from .providers.base import CircuitOpenError
+from .providers.clients import close_clients
 from .providers.email import EmailProvider
 from .providers.text import TextProvider
+from .ratelimit import rate_limiter
+from .retry import RetryPolicy
 
 
 @shared_task(
     bind=True,
-    max_retries=3,
+    # The number of retries is limited by the RetryPolicy
+    max_retries=None,
 )
-def send_message(self, message_id):
+def send_message(self, message_id, reserved=False):
     """
     Celery task to send a message using the appropriate provider based on the message type.
 
+    Temporary failures are retried through the broker with the backoff of
+    RetryPolicy, the message is RETRYING in the meantime. Permanent failures
+    mark the message as FAILED. The duration and outcome of every attempt are
+    recorded in the metrics.
+
+    Sends over the rate limits of the provider are deferred: the message goes
+    back to its previous status and the task is enqueued again for the slot
+    reserved by the RateLimiter, without counting as a retry. So are the sends
+    to a provider whose circuit is open, until the circuit may be half-open.
+
+    The message is claimed by moving it from QUEUED or RETRYING to SENDING in
+    one conditional UPDATE, so it is skipped if a dispatcher (see
+    DeliveryEngine.deliver_queued) already sent it. Status changes only write
+    the status and last_error columns.
+
     Args:
         self: The current task instance.
         message_id (str): The ID of the Message to be sent.
+        reserved (bool): Whether the task was deferred to a slot it already
+            reserved, so it sends without asking the RateLimiter.
 
     Returns:
         None
     """
-    try:
+    # The span of the task when tracing is enabled, see messaging.tracing
+    trace.get_current_span().set_attribute("messaging.message_id", str(message_id))
+    claimed = Message.objects.filter(
+        id=message_id, status__in=["QUEUED", "RETRYING"]
+    ).update(status="SENDING", claimed_at=timezone.now())
+    if not claimed:
+        return
 
-        message = Message.objects.get(id=message_id)
-        message.status = "SENDING"
-        message.save()
+    start = time.perf_counter()
+    message = Message.objects.select_related("sender", "recipient").get(id=message_id)
+    if not reserved:
+        delay, reserved = rate_limiter.reserve(message)
+        if delay:
+            message.status = "RETRYING" if self.request.retries else "QUEUED"
+            message.save(update_fields=["status"])
+            self.apply_async(
+                (message_id,),
+                {"reserved": reserved},
+                countdown=delay,
+                retries=self.request.retries,
+            )
+            metrics.observe_send(message.message_type, "deferred", start)
+            return
+
+    try:
 
         # Determine the provider based on the message type
         if message.message_type == "email":
@@ -44,18 +98,198 @@ def send_message(self, message_id):
         else:
             message.status = "FAILED"
             message.last_error = "Unsupported message type"
-            message.save()
+            message.save(update_fields=["status", "last_error"])
             raise ValueError(message.last_error)
 
         provider.send_message()
         message.status = "SENT"
-        message.save()
+        message.save(update_fields=["status"])
+        metrics.observe_send(message.message_type, "sent", start)
 
-    except Exception as exc:  # Retry after 60 seconds
-        message.status = "FAILED"
+    except CircuitOpenError as exc:
+        # Nothing was sent, the provider is probably down
+        message.status = "RETRYING" if self.request.retries else "QUEUED"
         message.last_error = str(exc)
-        message.save()
-        raise self.retry(
-            exc=exc,
-            countdown=60,
+        message.save(update_fields=["status", "last_error"])
+        self.apply_async(
+            (message_id,), countdown=exc.retry_after, retries=self.request.retries
         )
+        metrics.observe_send(message.message_type, "deferred", start)
+
+    except Exception as exc:
+        message.last_error = str(exc)
+        retry_policy = RetryPolicy()
+        if retry_policy.should_retry(exc, self.request.retries):
+            message.status = "RETRYING"
+            message.save(update_fields=["status", "last_error"])
+            metrics.observe_send(message.message_type, "retrying", start)
+            raise self.retry(
+                exc=exc,
+                countdown=retry_policy.countdown(self.request.retries, exc),
+                # The retry asks for a new slot
+                kwargs={},
+            )
+        message.status = "FAILED"
+        message.save(update_fields=["status", "last_error"])
+        metrics.observe_send(message.message_type, "failed", start)
+        raise
+
+
+@shared_task
+def send_message_batch(message_ids, retries=0):
+    """
+    Celery task to send a batch of messages concurrently with the delivery engine.
+    Messages that failed temporarily are sent again later by a new
+    send_message_batch task, see schedule_batch_retry, and so are the
+    messages deferred by the rate limits or an open circuit, see
+    schedule_deferred. Messages with a rate limit slot too far to wait for are
+    sent by send_message tasks at their slot, see schedule_reserved.
+
+    Args:
+        message_ids (list): IDs of the Messages to be sent. Only messages that
+            are QUEUED (or RETRYING, when retrying) are sent.
+        retries (int): Number of retries already done for these messages.
+
+    Returns:
+        dict: The number of "sent", "failed", "retrying" and "deferred"
+            messages.
+    """
+    result = get_engine().deliver(message_ids, retries)
+    schedule_batch_retry(result, retries)
+    schedule_deferred(result, retries)
+    schedule_reserved(result, retries)
+    return {
+        "sent": result["sent"],
+        "failed": result["failed"],
+        "retrying": len(result["retry"]),
+        "deferred": len(result["deferred"]) + len(result["reserved"]),
+    }
+
+
+def enqueue_messages(message_ids):
+    """
+    Enqueue the delivery of many messages as a Celery group of
+    send_message_batch tasks, MESSAGING_DELIVERY_BATCH_SIZE messages each.
+
+    :param message_ids: IDs of the QUEUED Messages to send.
+    :return: The GroupResult of the enqueued tasks.
+    """
+    chunk_size = settings.MESSAGING_DELIVERY_BATCH_SIZE
+    message_ids = [str(message_id) for message_id in message_ids]
+    return group(
+        send_message_batch.s(message_ids[start : start + chunk_size])
+        for start in range(0, len(message_ids), chunk_size)
+    ).apply_async()
+
+
+def schedule_batch_retry(result, retries):
+    """
+    Enqueue a send_message_batch task for the retryable messages of a delivery.
+
+    :param result: The dict returned by DeliveryEngine.deliver.
+    :param retries: Number of retries already done for these messages.
+    """
+    if result["retry"]:
+        send_message_batch.apply_async(
+            (result["retry"], retries + 1), countdown=result["countdown"]
+        )
+
+
+def schedule_deferred(result, retries):
+    """
+    Enqueue a send_message_batch task for the messages of a delivery deferred
+    by the rate limits or an open circuit. Deferring doesn't count as a retry.
+
+    :param result: The dict returned by DeliveryEngine.deliver.
+    :param retries: Number of retries already done for these messages.
+    """
+    if result["deferred"]:
+        send_message_batch.apply_async(
+            (result["deferred"], retries), countdown=result["deferred_countdown"]
+        )
+
+
+def schedule_reserved(result, retries):
+    """
+    Enqueue a send_message task for each message of a delivery whose rate
+    limit slot was too far for the engine to wait for. The task runs at the
+    slot and keeps the reservation. Reserving doesn't count as a retry.
+
+    :param result: The dict returned by DeliveryEngine.deliver.
+    :param retries: Number of retries already done for these messages.
+    """
+    for message_id, delay in result["reserved"]:
+        send_message.apply_async(
+            (str(message_id),), {"reserved": True}, countdown=delay, retries=retries
+        )
+
+
+@shared_task
+def reclaim_stalled_messages():
+    """
+    Celery beat task putting the messages left in SENDING for more than
+    MESSAGING_SENDING_TIMEOUT seconds, by a worker that died after claiming
+    them, back to QUEUED, and enqueuing their delivery again. A message that
+    reached the provider before the worker died is sent twice.
+
+    Returns:
+        int: The number of messages put back to QUEUED.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.MESSAGING_SENDING_TIMEOUT)
+    with transaction.atomic():
+        message_ids = list(
+            Message.objects.filter(status="SENDING", claimed_at__lt=cutoff)
+            .select_for_update(skip_locked=True)
+            .values_list("id", flat=True)
+        )
+        if message_ids:
+            Message.objects.filter(id__in=message_ids).update(status="QUEUED")
+            transaction.on_commit(lambda: enqueue_messages(message_ids))
+    return len(message_ids)
+
+
+@shared_task
+def archive_old_messages():
+    """
+    Celery beat task moving the messages older than
+    MESSAGING_ARCHIVE_AFTER_DAYS days to an archive file, see
+    messaging.archive.archive_messages. Does nothing when the setting is empty.
+
+    Returns:
+        dict: The path of the archive and the number of "archived" and
+            "deleted" messages, or None when archival is disabled.
+    """
+    if settings.MESSAGING_ARCHIVE_AFTER_DAYS is None:
+        return None
+    return archive_messages(
+        timezone.now() - timedelta(days=settings.MESSAGING_ARCHIVE_AFTER_DAYS)
+    )
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def close_provider_clients(**kwargs):
+    """
+    Close the pooled provider HTTP clients when a worker (process) exits.
+    """
+    close_engine()
+    close_clients()
+
+
+@worker_init.connect
+def start_metrics_exporter(**kwargs):
+    """
+    Serve the metrics of the worker pool on MESSAGING_METRICS_WORKER_PORT from
+    the main worker process, when the setting is set.
+    """
+    if settings.MESSAGING_METRICS_WORKER_PORT is not None:
+        metrics.reset_multiprocess_dir()
+        metrics.start_exporter(settings.MESSAGING_METRICS_WORKER_PORT)
+
+
+@worker_process_shutdown.connect
+def forget_process_metrics(pid=None, **kwargs):
+    """
+    Forget the live samples of a pool process that exits.
+    """
+    metrics.mark_process_dead(pid or os.getpid())
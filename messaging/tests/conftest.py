@@ -1,7 +1,16 @@
 import pytest
+from messaging.cache import resolution_cache
 from messaging.models import Participant
 
 
+@pytest.fixture(autouse=True)
+def clear_resolution_cache():
+    # Cached ids would point to rows rolled back by previous tests
+    resolution_cache.clear()
+    yield
+    resolution_cache.clear()
+
+
 @pytest.fixture
 def participant_1(db):
     return Participant.objects.create(phone="1234567890", email="test@example.com")
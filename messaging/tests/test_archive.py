@@ -0,0 +1,207 @@
+import gzip
+import json
+import os
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest.mock import patch
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+
+from messaging import partitions
+from messaging.archive import archive_messages, read_archive, restore_messages
+from messaging.models import Message, Participant, ProviderMessageKey
+from messaging.tasks import archive_old_messages
+from messaging.utils import resolve_conversation
+
+NOW = datetime(2026, 10, 18, 12, 0, tzinfo=dt_timezone.utc)
+
+
+def create_message(participant_1, participant_2, timestamp, status="SENT", **kwargs):
+    return Message.objects.create(
+        conversation=resolve_conversation(participant_1, participant_2),
+        sender=participant_1,
+        recipient=participant_2,
+        message_type="mms",
+        direction="OUTGOING",
+        body="Hello",
+        attachments=["https://example.com/image.png"],
+        status=status,
+        timestamp=timestamp,
+        **kwargs,
+    )
+
+
+@pytest.fixture
+def messages(participant_1, participant_2):
+    return {
+        "old": create_message(participant_1, participant_2, NOW - timedelta(days=400)),
+        "old_inbound": create_message(
+            participant_2,
+            participant_1,
+            NOW - timedelta(days=390, microseconds=123456),
+            status="RECIEVED",
+            provider_message_id="inbound-1",
+        ),
+        "old_queued": create_message(
+            participant_1, participant_2, NOW - timedelta(days=400), status="QUEUED"
+        ),
+        "recent": create_message(participant_1, participant_2, NOW - timedelta(days=1)),
+    }
+
+
+def archived_rows(path):
+    with gzip.open(path, "rt") as archive:
+        return [json.loads(line) for line in archive]
+
+
+@pytest.mark.django_db
+def test_archive_messages_moves_old_final_messages(messages, tmp_path):
+    result = archive_messages(NOW - timedelta(days=365), tmp_path, batch_size=1)
+
+    assert result["archived"] == 2
+    assert result["deleted"] == 2
+    assert os.listdir(tmp_path) == [os.path.basename(result["path"])]
+    assert {row["id"] for row in archived_rows(result["path"])} == {
+        str(messages["old"].id),
+        str(messages["old_inbound"].id),
+    }
+    # Queued messages are still to be sent, recent ones are kept
+    assert set(Message.objects.values_list("id", flat=True)) == {
+        messages["old_queued"].id,
+        messages["recent"].id,
+    }
+
+
+# Not in the transaction of a test, so the cursor would be in autocommit mode
+@pytest.mark.django_db(transaction=True)
+def test_archive_messages_reads_in_a_transaction(messages, tmp_path):
+    in_atomic_block = []
+    chunked_cursor = connection.chunked_cursor
+
+    def spy():
+        in_atomic_block.append(connection.in_atomic_block)
+        return chunked_cursor()
+
+    with patch.object(connection, "chunked_cursor", spy):
+        result = archive_messages(NOW - timedelta(days=365), tmp_path, batch_size=1)
+
+    assert result["deleted"] == 2
+    assert in_atomic_block == [True]
+
+
+@pytest.mark.django_db
+def test_archive_messages_without_old_messages(messages, tmp_path):
+    result = archive_messages(NOW - timedelta(days=1000), tmp_path)
+
+    assert result == {"path": None, "archived": 0, "deleted": 0}
+    assert os.listdir(tmp_path) == []
+    assert Message.objects.count() == 4
+
+
+@pytest.mark.django_db
+def test_read_archive_returns_field_values(messages, tmp_path):
+    old = messages["old_inbound"]
+    path = archive_messages(NOW - timedelta(days=365), tmp_path)["path"]
+
+    row = next(row for row in read_archive(path) if row["id"] == old.id)
+
+    # The microseconds are kept
+    assert row["timestamp"] == old.timestamp
+    assert row["created_at"] == old.created_at
+    assert row["conversation_id"] == old.conversation_id
+    assert row["attachments"] == ["https://example.com/image.png"]
+
+
+@pytest.mark.django_db
+def test_restore_messages(messages, tmp_path):
+    old = messages["old_inbound"]
+    path = archive_messages(NOW - timedelta(days=365), tmp_path)["path"]
+
+    assert restore_messages(path) == {"restored": 2, "skipped": 0}
+    restored = Message.objects.get(id=old.id)
+    assert restored.created_at == old.created_at
+    assert restored.timestamp == old.timestamp
+    assert restored.provider_message_id == "inbound-1"
+
+    # Messages already in the table are skipped
+    assert restore_messages(path) == {"restored": 0, "skipped": 2}
+    assert Message.objects.count() == 4
+
+
+@pytest.mark.django_db
+def test_restore_messages_of_a_range(messages, tmp_path):
+    path = archive_messages(NOW - timedelta(days=365), tmp_path)["path"]
+
+    result = restore_messages(
+        path, since=NOW - timedelta(days=395), until=NOW - timedelta(days=365)
+    )
+
+    assert result == {"restored": 1, "skipped": 0}
+    assert Message.objects.filter(id=messages["old_inbound"].id).exists()
+    assert not Message.objects.filter(id=messages["old"].id).exists()
+
+
+@pytest.mark.django_db
+def test_restore_messages_skips_deleted_conversations(
+    participant_1, participant_2, tmp_path
+):
+    other = Participant.objects.create(phone="+15550000000")
+    create_message(participant_1, participant_2, NOW - timedelta(days=400))
+    create_message(participant_1, other, NOW - timedelta(days=400))
+    path = archive_messages(NOW - timedelta(days=365), tmp_path)["path"]
+    other.delete()
+
+    assert restore_messages(path) == {"restored": 1, "skipped": 1}
+
+
+@pytest.mark.django_db
+def test_archive_and_restore_partitioned_messages(messages, tmp_path, settings):
+    settings.MESSAGING_PARTITIONED_MESSAGES = True
+    ProviderMessageKey.objects.create(
+        provider_message_id="inbound-1", message_id=messages["old_inbound"].id
+    )
+    connection.check_constraints()
+    partitions.convert(months_ahead=1, now=NOW)
+
+    path = archive_messages(NOW - timedelta(days=365), tmp_path)["path"]
+    assert not ProviderMessageKey.objects.exists()
+
+    assert restore_messages(path) == {"restored": 2, "skipped": 0}
+    assert ProviderMessageKey.objects.get().message_id == messages["old_inbound"].id
+
+
+@pytest.mark.django_db
+def test_restore_messages_skips_provider_ids_stored_again(messages, tmp_path, settings):
+    settings.MESSAGING_PARTITIONED_MESSAGES = True
+    path = archive_messages(NOW - timedelta(days=365), tmp_path)["path"]
+    # The provider sent the message again after it was archived
+    ProviderMessageKey.objects.create(
+        provider_message_id="inbound-1", message_id=messages["recent"].id
+    )
+
+    assert restore_messages(path) == {"restored": 1, "skipped": 1}
+    assert not Message.objects.filter(id=messages["old_inbound"].id).exists()
+
+
+@pytest.mark.django_db
+def test_archive_old_messages_task(messages, tmp_path, settings):
+    settings.MESSAGING_ARCHIVE_DIR = str(tmp_path)
+    settings.MESSAGING_ARCHIVE_AFTER_DAYS = None
+    assert archive_old_messages() is None
+
+    settings.MESSAGING_ARCHIVE_AFTER_DAYS = 30
+    result = archive_old_messages()
+
+    assert result["archived"] == 2
+    assert Message.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_restore_messages_command(messages, tmp_path, capsys):
+    path = archive_messages(NOW - timedelta(days=365), tmp_path)["path"]
+
+    call_command("restore_messages", path, "--since", "2025-09-20")
+
+    assert capsys.readouterr().out == f"{path}: restored 1 messages, skipped 0\n"
+    assert Message.objects.count() == 3
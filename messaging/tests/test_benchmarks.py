@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+from messaging.models import Conversation, ConversationParticipant, Message
+
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+        "benchmarks",
+    ),
+)
+
+from generate_data import generate  # noqa: E402
+
+
+# VACUUM can't run in the transaction of a test
+@pytest.mark.django_db(transaction=True)
+def test_generate_data():
+    result = generate(200, days=10, batch_size=150)
+
+    assert result["rows"]["messaging_message"] == Message.objects.count() > 0
+    conversation = Conversation.objects.filter(message_count__gt=0).first()
+    assert (
+        conversation.message_count
+        == Message.objects.filter(conversation=conversation).count()
+    )
+    assert conversation.last_message_id is not None
+    assert (
+        ConversationParticipant.objects.filter(conversation=conversation).count() == 2
+    )
@@ -0,0 +1,127 @@
+import pytest
+from unittest.mock import MagicMock, patch
+from django.core.management import call_command
+from django.db import OperationalError
+from django.utils import timezone
+
+from messaging.buffer import InboundBuffer
+from messaging.models import Message
+
+
+def make_entry(provider_message_id, sender="+15550000001"):
+    return {
+        "to": "+15550000000",
+        "from": sender,
+        "type": "sms",
+        "body": "Hello!",
+        "provider_message_id": provider_message_id,
+        "attachments": None,
+        "timestamp": timezone.now(),
+    }
+
+
+def stream_item(entry_id, entry, field="phone"):
+    return (
+        entry_id,
+        {b"field": field.encode(), b"entry": InboundBuffer.dumps(entry).encode()},
+    )
+
+
+@pytest.fixture
+def mock_redis():
+    with patch("messaging.buffer.get_redis") as mock_get_redis:
+        client = mock_get_redis.return_value
+        client.xautoclaim.return_value = [b"0-0", [], []]
+        client.xreadgroup.return_value = []
+        yield client
+
+
+def test_dumps_and_loads_keep_the_timestamp():
+    entry = make_entry("msg-1")
+    assert InboundBuffer.loads(InboundBuffer.dumps(entry)) == entry
+
+
+def test_append_adds_every_entry_to_the_stream(mock_redis, settings):
+    settings.MESSAGING_INBOUND_STREAM = "inbound"
+    entries = [make_entry("msg-1"), make_entry("msg-2")]
+    InboundBuffer().append("phone", entries)
+    pipeline = mock_redis.pipeline.return_value
+    assert [call.args for call in pipeline.xadd.call_args_list] == [
+        ("inbound", {"field": "phone", "entry": InboundBuffer.dumps(entry)})
+        for entry in entries
+    ]
+    pipeline.execute.assert_called_once_with()
+
+
+@pytest.mark.django_db
+def test_consume_stores_and_acknowledges_entries(mock_redis, settings):
+    settings.MESSAGING_INBOUND_STREAM = "inbound"
+    mock_redis.xreadgroup.return_value = [
+        [
+            b"inbound",
+            [
+                stream_item(b"1-0", make_entry("msg-1")),
+                stream_item(b"2-0", make_entry("msg-2", sender="+15550000002")),
+                # Delivered again, e.g. after a consumer crashed
+                stream_item(b"3-0", make_entry("msg-1")),
+            ],
+        ]
+    ]
+    result = InboundBuffer().consume("consumer-1", 10)
+    assert result == {"read": 3, "created": 2, "duplicates": 1, "dead": 0}
+    assert Message.objects.filter(status="RECIEVED").count() == 2
+    pipeline = mock_redis.pipeline.return_value
+    pipeline.xack.assert_called_once_with("inbound", "ingest", b"1-0", b"2-0", b"3-0")
+    pipeline.xdel.assert_called_once_with("inbound", b"1-0", b"2-0", b"3-0")
+
+
+@pytest.mark.django_db
+def test_consume_claims_stale_entries_first(mock_redis):
+    mock_redis.xautoclaim.return_value = [
+        b"0-0",
+        [stream_item(b"1-0", make_entry("msg-1"))],
+        [],
+    ]
+    assert InboundBuffer().consume("consumer-1", 10)["created"] == 1
+    assert not mock_redis.xreadgroup.called
+
+
+@pytest.mark.django_db(transaction=True)
+def test_consume_moves_rejected_entries_to_dead_letters(mock_redis, settings):
+    settings.MESSAGING_INBOUND_STREAM = "inbound"
+    invalid = make_entry("msg-2", sender="+1" + "5" * 30)
+    mock_redis.xreadgroup.return_value = [
+        [
+            b"inbound",
+            [stream_item(b"1-0", make_entry("msg-1")), stream_item(b"2-0", invalid)],
+        ]
+    ]
+    result = InboundBuffer().consume("consumer-1", 10)
+    assert result == {"read": 2, "created": 1, "duplicates": 0, "dead": 1}
+    pipeline = mock_redis.pipeline.return_value
+    pipeline.xadd.assert_called_once_with(
+        "inbound:dead", stream_item(b"2-0", invalid)[1]
+    )
+    pipeline.xack.assert_called_once_with("inbound", "ingest", b"1-0", b"2-0")
+
+
+@patch("messaging.buffer.ingest_inbound_messages")
+def test_consume_leaves_entries_pending_on_database_errors(mock_ingest, mock_redis):
+    mock_ingest.side_effect = OperationalError("connection lost")
+    mock_redis.xreadgroup.return_value = [
+        [b"inbound", [stream_item(b"1-0", make_entry("msg-1"))]]
+    ]
+    with pytest.raises(OperationalError):
+        InboundBuffer().consume("consumer-1", 10)
+    assert not mock_redis.pipeline.return_value.xack.called
+
+
+@pytest.mark.django_db(transaction=True)
+def test_consume_inbound_messages_command(mock_redis):
+    mock_redis.xreadgroup.side_effect = [
+        [[b"inbound", [stream_item(b"1-0", make_entry("msg-1"))]]],
+        [],
+    ]
+    call_command("consume_inbound_messages", consumer="test")
+    mock_redis.xgroup_create.assert_called_once()
+    assert Message.objects.filter(provider_message_id="msg-1").exists()
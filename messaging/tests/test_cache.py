@@ -0,0 +1,143 @@
+import pytest
+from unittest.mock import patch
+from django.core.cache import caches
+from django.db import transaction
+
+from messaging.cache import LRUCache, ResolutionCache, resolution_cache
+from messaging.models import Conversation, Participant
+from messaging.utils import (
+    resolve_conversation,
+    resolve_conversations,
+    resolve_participant,
+    resolve_participants,
+)
+
+
+@pytest.fixture
+def shared_cache(settings):
+    settings.CACHES = {
+        **settings.CACHES,
+        "resolution": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    }
+    yield caches["resolution"]
+    caches["resolution"].clear()
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+def test_lru_cache_expires_entries():
+    cache = LRUCache(maxsize=2, ttl=60)
+    with patch("messaging.cache.time.monotonic", return_value=100):
+        cache.set("a", 1)
+    with patch("messaging.cache.time.monotonic", return_value=159):
+        assert cache.get("a") == 1
+    with patch("messaging.cache.time.monotonic", return_value=160):
+        assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_resolution_cache_tiers(shared_cache):
+    first = ResolutionCache()
+    first.set_many({"key": "value"})
+    # Another process only finds the value in the shared tier
+    second = ResolutionCache()
+    assert second.get_many(["key", "other"]) == {"key": "value"}
+    assert second.get_many(["key"]) == {"key": "value"}
+    assert second.stats() == {"local_hits": 1, "shared_hits": 1, "misses": 1}
+
+
+def test_resolution_cache_survives_shared_tier_errors(shared_cache):
+    cache = ResolutionCache()
+    with patch.object(shared_cache, "get_many", side_effect=ConnectionError):
+        assert cache.get_many(["key"]) == {}
+    with patch.object(shared_cache, "set_many", side_effect=ConnectionError):
+        cache.set_many({"key": "value"})
+    assert cache.get_many(["key"]) == {"key": "value"}
+
+
+@pytest.mark.django_db
+def test_warm_resolution_does_no_queries(
+    django_assert_num_queries, django_capture_on_commit_callbacks
+):
+    # The cache is written when the transaction of the test would commit
+    with django_capture_on_commit_callbacks(execute=True):
+        sender = resolve_participant(phone="+11111111111")
+        recipient = resolve_participant(phone="+12222222222")
+        conversation = resolve_conversation(sender, recipient)
+
+    with django_assert_num_queries(0):
+        participants = resolve_participants("phone", ["+11111111111", "+12222222222"])
+        pair = (participants["+11111111111"].id, participants["+12222222222"].id)
+        conversations = resolve_conversations([pair])
+    assert participants["+11111111111"] == sender
+    assert participants["+11111111111"].phone == "+11111111111"
+    assert list(conversations.values()) == [conversation]
+    assert resolution_cache.stats()["local_hits"] == 3
+
+
+@pytest.mark.django_db
+def test_cached_participant_loads_other_fields_on_access(participant_1):
+    resolve_participant(phone=participant_1.phone)
+    participant = resolve_participant(phone=participant_1.phone)
+    assert participant.email == "test@example.com"
+
+
+@pytest.mark.django_db
+def test_participant_delete_invalidates_cache(
+    shared_cache, django_capture_on_commit_callbacks
+):
+    with django_capture_on_commit_callbacks(execute=True):
+        sender = resolve_participant(email="sender@example.com")
+        recipient = resolve_participant(email="recipient@example.com")
+        resolve_conversation(sender, recipient)
+    keys = [
+        resolution_cache.participant_key("email", "sender@example.com"),
+        resolution_cache.conversation_key(*sorted([sender.id, recipient.id])),
+    ]
+    assert len(resolution_cache.get_many(keys)) == 2
+    # Deleting the participant cascades to the conversation
+    sender.delete()
+
+    assert resolution_cache.get_many(keys) == {}
+    new_sender = resolve_participant(email="sender@example.com")
+    assert Participant.objects.filter(id=new_sender.id).exists()
+    conversation = resolve_conversation(new_sender, recipient)
+    assert Conversation.objects.filter(id=conversation.id).exists()
+
+
+class Rollback(Exception):
+    pass
+
+
+@pytest.mark.django_db(transaction=True)
+def test_rolled_back_resolution_is_not_cached(shared_cache):
+    with pytest.raises(Rollback):
+        with transaction.atomic():
+            sender = resolve_participant(phone="+11111111111")
+            recipient = resolve_participant(phone="+12222222222")
+            resolve_conversation(sender, recipient)
+            raise Rollback()
+
+    assert (
+        resolution_cache.get_many(
+            [
+                resolution_cache.participant_key("phone", "+11111111111"),
+                resolution_cache.conversation_key(*sorted([sender.id, recipient.id])),
+            ]
+        )
+        == {}
+    )
+    sender = resolve_participant(phone="+11111111111")
+    recipient = resolve_participant(phone="+12222222222")
+    conversation = resolve_conversation(sender, recipient)
+    assert Participant.objects.filter(id__in=[sender.id, recipient.id]).count() == 2
+    assert Conversation.objects.filter(id=conversation.id).exists()
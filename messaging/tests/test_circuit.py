@@ -0,0 +1,264 @@
+import asyncio
+import json
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import fakeredis
+import httpx
+import pytest
+import redis
+from django.utils import timezone
+
+from messaging.delivery import DeliveryEngine
+from messaging.models import Message, Participant
+from messaging.providers import circuit
+from messaging.providers.base import CircuitOpenError, MessagingProvider
+from messaging.providers.circuit import CircuitBreaker
+from messaging.tasks import send_message
+from messaging.utils import resolve_conversation
+
+
+@pytest.fixture
+def fake_redis():
+    client = fakeredis.FakeRedis()
+    with patch("messaging.providers.circuit.get_redis", return_value=client):
+        yield client
+
+
+@pytest.fixture(autouse=True)
+def breakers():
+    # Forget the state the breakers of the process cached
+    circuit._breakers.clear()
+    yield
+    circuit._breakers.clear()
+
+
+@pytest.fixture
+def enabled(settings):
+    settings.MESSAGING_CIRCUIT_BREAKER = True
+    settings.MESSAGING_CIRCUIT_WINDOW = 60
+    settings.MESSAGING_CIRCUIT_MIN_REQUESTS = 4
+    settings.MESSAGING_CIRCUIT_ERROR_RATE = 0.5
+    settings.MESSAGING_CIRCUIT_SLOW_CALL = 5
+    settings.MESSAGING_CIRCUIT_SLOW_RATE = 0.5
+    settings.MESSAGING_CIRCUIT_OPEN_SECONDS = 0.2
+    return settings
+
+
+def is_open(breaker):
+    delay, _ = breaker.allow(10)
+    return delay > 0
+
+
+def test_opens_on_error_rate(fake_redis, enabled):
+    breaker = CircuitBreaker("text")
+    for status_code in (200, 500, 200):
+        breaker.record(status_code, 0.1)
+    assert not is_open(breaker)
+
+    breaker.record(None, 0.1)
+
+    # Another worker sees the open circuit
+    assert is_open(CircuitBreaker("text"))
+
+
+def test_needs_min_requests(fake_redis, enabled):
+    breaker = CircuitBreaker("text")
+    for _ in range(3):
+        breaker.record(503, 0.1)
+
+    assert not is_open(breaker)
+
+
+def test_client_errors_are_not_failures(fake_redis, enabled):
+    breaker = CircuitBreaker("text")
+    for status_code in (400, 404, 429, 429, 422):
+        breaker.record(status_code, 0.1)
+
+    assert not is_open(CircuitBreaker("text"))
+
+
+def test_opens_on_slow_rate(fake_redis, enabled):
+    breaker = CircuitBreaker("text")
+    for duration in (0.1, 6, 0.1, 8):
+        breaker.record(200, duration)
+
+    assert is_open(CircuitBreaker("text"))
+
+
+def open_circuit(breaker):
+    for _ in range(4):
+        breaker.record(408, 0.1)
+
+
+def test_half_open_probe_closes_circuit(fake_redis, enabled):
+    breaker = CircuitBreaker("text")
+    open_circuit(breaker)
+    time.sleep(0.25)
+
+    assert breaker.allow(10) == (0.0, True)
+    # A single probe at a time
+    assert is_open(CircuitBreaker("text"))
+
+    breaker.record(200, 0.1, probe=True)
+
+    assert CircuitBreaker("text").allow(10) == (0.0, False)
+
+
+def test_failed_probe_opens_circuit_again(fake_redis, enabled):
+    breaker = CircuitBreaker("text")
+    open_circuit(breaker)
+    time.sleep(0.25)
+    assert breaker.allow(10) == (0.0, True)
+
+    breaker.record(502, 0.1, probe=True)
+
+    assert is_open(CircuitBreaker("text"))
+
+
+def test_lost_probe_is_replaced(fake_redis, enabled):
+    breaker = CircuitBreaker("text")
+    open_circuit(breaker)
+    time.sleep(0.25)
+
+    assert breaker.allow(0.1) == (0.0, True)
+    # The worker sending the probe never recorded it
+    time.sleep(0.15)
+    assert CircuitBreaker("text").allow(10) == (0.0, True)
+
+
+def test_providers_have_their_own_circuit(fake_redis, enabled):
+    open_circuit(CircuitBreaker("text"))
+
+    assert is_open(CircuitBreaker("text"))
+    assert not is_open(CircuitBreaker("email"))
+
+
+def test_disabled_by_default(settings):
+    settings.MESSAGING_CIRCUIT_BREAKER = False
+    breaker = CircuitBreaker("text")
+    with patch("messaging.providers.circuit.get_redis") as mock_get_redis:
+        for _ in range(10):
+            breaker.record(503, 0.1)
+        assert breaker.allow(10) == (0.0, False)
+    assert not mock_get_redis.called
+
+
+def test_redis_unavailable_lets_requests_through(enabled):
+    client = MagicMock()
+    client.register_script.return_value.side_effect = redis.ConnectionError()
+    with patch("messaging.providers.circuit.get_redis", return_value=client):
+        breaker = CircuitBreaker("text")
+        breaker.record(503, 0.1)
+        assert breaker.allow(10) == (0.0, False)
+
+
+@patch("httpx.Client.request")
+def test_open_circuit_fails_fast(mock_request, fake_redis, enabled):
+    provider = MessagingProvider()
+    open_circuit(provider.breaker)
+
+    with pytest.raises(CircuitOpenError) as exc_info:
+        provider.send_request("POST", "http://test.com")
+
+    assert not mock_request.called
+    assert 0 < exc_info.value.retry_after <= 0.3
+
+
+def test_async_send_calls_redis_off_the_event_loop(enabled):
+    client = fakeredis.FakeRedis()
+    threads = []
+
+    def register_script(script):
+        run = client.register_script(script)
+
+        def call(**kwargs):
+            threads.append(threading.get_ident())
+            return run(**kwargs)
+
+        return call
+
+    async def send():
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, json={}))
+        async with httpx.AsyncClient(transport=transport) as http_client:
+            await MessagingProvider().asend_request(http_client, "POST", "http://t")
+        return threading.get_ident()
+
+    with patch("messaging.providers.circuit.get_redis") as mock_get_redis:
+        mock_get_redis.return_value.register_script = register_script
+        loop_thread = asyncio.run(send())
+
+    # allow and record
+    assert len(threads) == 2
+    assert loop_thread not in threads
+
+
+def create_message(message_type, recipient):
+    sender = Participant.objects.get_or_create(
+        phone="+11111111111", email="sender@example.com"
+    )[0]
+    recipient = Participant.objects.get_or_create(**recipient)[0]
+    return Message.objects.create(
+        conversation=resolve_conversation(sender, recipient),
+        sender=sender,
+        recipient=recipient,
+        message_type=message_type,
+        direction="outbound",
+        body="Hello",
+        status="QUEUED",
+        timestamp=timezone.now(),
+    )
+
+
+@pytest.mark.django_db
+@patch("messaging.tasks.TextProvider")
+def test_send_message_deferred_while_circuit_is_open(mock_text_provider):
+    message = create_message("sms", {"phone": "+15550000001"})
+    mock_text_provider.return_value.send_message.side_effect = CircuitOpenError(
+        "Circuit of the text provider is open", retry_after=12
+    )
+
+    with patch.object(send_message, "apply_async") as mock_apply_async:
+        send_message.apply(args=[str(message.id)])
+
+    mock_apply_async.assert_called_once_with(
+        (str(message.id),), countdown=12, retries=0
+    )
+    message.refresh_from_db()
+    assert message.status == "QUEUED"
+
+
+def handler(request):
+    # The text provider is down, the email provider is up
+    if json.loads(request.content).get("type") == "sms":
+        return httpx.Response(503)
+    return httpx.Response(200, json={"status": "ok"})
+
+
+@pytest.mark.django_db
+def test_deliver_defers_messages_to_open_circuit(fake_redis, enabled):
+    enabled.MESSAGING_CIRCUIT_MIN_REQUESTS = 2
+    enabled.MESSAGING_CIRCUIT_OPEN_SECONDS = 30
+    texts = [create_message("sms", {"phone": f"+1555000000{i}"}) for i in range(4)]
+    emails = [
+        create_message("email", {"email": f"user{i}@example.com"}) for i in range(2)
+    ]
+
+    with patch("messaging.delivery.create_async_client") as mock_create:
+        mock_create.side_effect = lambda *args: httpx.AsyncClient(
+            transport=httpx.MockTransport(handler)
+        )
+        with DeliveryEngine(concurrency=1) as engine:
+            result = engine.deliver([message.id for message in texts + emails])
+
+    # Two failures open the circuit, the other texts are not sent
+    assert result["sent"] == 2
+    assert result["retry"] == [texts[0].id, texts[1].id]
+    assert result["deferred"] == [texts[2].id, texts[3].id]
+    assert 30 <= result["deferred_countdown"] <= 45
+    assert set(
+        Message.objects.filter(id__in=result["deferred"]).values_list(
+            "status", flat=True
+        )
+    ) == {"QUEUED"}
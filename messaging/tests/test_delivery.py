@@ -0,0 +1,260 @@
+import json
+import threading
+import time
+from datetime import timedelta
+
+import fakeredis
+import httpx
+import pytest
+from unittest.mock import patch
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.utils import timezone
+
+from messaging.delivery import DeliveryEngine
+from messaging.models import Message, Participant
+from messaging.tasks import reclaim_stalled_messages
+from messaging.utils import resolve_conversation
+
+
+def handler(request):
+    payload = json.loads(request.content)
+    if payload["to"] == "+19999999999":
+        return httpx.Response(400, json={"error": "invalid number"})
+    if payload["to"] == "+18888888888":
+        return httpx.Response(503, headers={"Retry-After": "30"})
+    return httpx.Response(200, json={"status": "ok"})
+
+
+@pytest.fixture
+def mock_async_client():
+    with patch("messaging.delivery.create_async_client") as mock_create:
+        mock_create.side_effect = lambda *args: httpx.AsyncClient(
+            transport=httpx.MockTransport(handler)
+        )
+        yield mock_create
+
+
+def create_message(recipient_phone, message_type="sms", status="QUEUED"):
+    sender = Participant.objects.get_or_create(phone="+11111111111")[0]
+    recipient = Participant.objects.get_or_create(phone=recipient_phone)[0]
+    return Message.objects.create(
+        conversation=resolve_conversation(sender, recipient),
+        sender=sender,
+        recipient=recipient,
+        message_type=message_type,
+        direction="outbound",
+        body="Hello",
+        status=status,
+        timestamp=timezone.now(),
+    )
+
+
+@pytest.mark.django_db
+def test_deliver_updates_statuses_in_bulk(mock_async_client, django_assert_num_queries):
+    sent = [create_message(f"+1222222222{i}") for i in range(5)]
+    failed = create_message("+19999999999")
+    unsupported = create_message("+13333333333", message_type="fax")
+    unavailable = create_message("+18888888888")
+    already_sent = create_message("+14444444444", status="SENT")
+    ids = [m.id for m in sent + [failed, unsupported, unavailable, already_sent]]
+
+    with DeliveryEngine(concurrency=2) as engine:
+        # savepoint, select for update, mark as SENDING, release savepoint,
+        # mark as SENT, record failures
+        with django_assert_num_queries(6):
+            result = engine.deliver(ids)
+
+    assert result == {
+        "sent": 5,
+        "failed": 2,
+        "retry": [unavailable.id],
+        "countdown": 30,
+        "deferred": [],
+        "deferred_countdown": None,
+        "reserved": [],
+    }
+    assert set(
+        Message.objects.filter(id__in=[m.id for m in sent]).values_list(
+            "status", flat=True
+        )
+    ) == {"SENT"}
+    failed.refresh_from_db()
+    assert failed.status == "FAILED"
+    assert "400" in failed.last_error
+    assert failed.claimed_at is not None
+    unavailable.refresh_from_db()
+    assert unavailable.status == "RETRYING"
+    unsupported.refresh_from_db()
+    assert unsupported.last_error == "Unsupported message type"
+    # One client is shared by every request of the engine
+    assert mock_async_client.call_count == 1
+
+
+@pytest.mark.django_db
+def test_deliver_retry_only_sends_retrying_messages(mock_async_client):
+    queued = create_message("+12222222222")
+    retrying = create_message("+12222222223", status="RETRYING")
+    with DeliveryEngine() as engine:
+        result = engine.deliver([queued.id, retrying.id], retries=1)
+    assert result["sent"] == 1
+    retrying.refresh_from_db()
+    assert retrying.status == "SENT"
+    queued.refresh_from_db()
+    assert queued.status == "QUEUED"
+
+
+@pytest.mark.django_db
+def test_deliver_gives_up_after_max_retries(mock_async_client, settings):
+    settings.MESSAGING_RETRY_MAX_RETRIES = 2
+    unavailable = create_message("+18888888888", status="RETRYING")
+    with DeliveryEngine() as engine:
+        result = engine.deliver([unavailable.id], retries=2)
+    assert result["failed"] == 1
+    assert result["retry"] == []
+    unavailable.refresh_from_db()
+    assert unavailable.status == "FAILED"
+
+
+@pytest.mark.django_db
+def test_deliver_paces_sends_and_defers_the_rest(mock_async_client, settings):
+    settings.MESSAGING_TEXT_RATE_LIMIT = 4
+    settings.MESSAGING_TEXT_RATE_BURST = 1
+    settings.MESSAGING_RATE_LIMIT_MAX_DELAY = 0.3
+    messages = [create_message(f"+1555000000{i}") for i in range(3)]
+
+    with patch("messaging.ratelimit.get_redis", return_value=fakeredis.FakeRedis()):
+        with DeliveryEngine() as engine:
+            started = time.monotonic()
+            result = engine.deliver([message.id for message in messages])
+            elapsed = time.monotonic() - started
+
+    # Slots at 0 and 0.25 seconds, the third is 0.5 seconds away
+    assert result["sent"] == 2
+    assert elapsed >= 0.25
+    (deferred,) = result["deferred"]
+    assert result["deferred_countdown"] == pytest.approx(0.2, abs=0.05)
+    assert Message.objects.get(id=deferred).status == "QUEUED"
+    assert Message.objects.filter(status="SENT").count() == 2
+
+
+@pytest.mark.django_db
+def test_deliver_hands_far_slots_back(mock_async_client, settings):
+    settings.MESSAGING_TEXT_RATE_LIMIT = 2
+    settings.MESSAGING_TEXT_RATE_BURST = 1
+    settings.MESSAGING_RATE_LIMIT_MAX_DELAY = 60
+    settings.MESSAGING_DELIVERY_MAX_WAIT = 0.6
+    messages = [create_message(f"+1555000000{i}") for i in range(3)]
+
+    with patch("messaging.ratelimit.get_redis", return_value=fakeredis.FakeRedis()):
+        with DeliveryEngine() as engine:
+            started = time.monotonic()
+            result = engine.deliver([message.id for message in messages])
+            elapsed = time.monotonic() - started
+
+    # Slots at 0 and 0.5 seconds are waited for, the one at 1 second isn't
+    assert result["sent"] == 2
+    assert elapsed < 1
+    ((reserved, delay),) = result["reserved"]
+    assert reserved == messages[2].id
+    assert delay == pytest.approx(1, abs=0.05)
+    assert result["deferred"] == []
+    assert Message.objects.get(id=reserved).status == "QUEUED"
+
+
+@pytest.mark.django_db
+def test_deliver_nothing_queued(mock_async_client):
+    with DeliveryEngine() as engine:
+        assert engine.deliver([]) == {
+            "sent": 0,
+            "failed": 0,
+            "retry": [],
+            "countdown": None,
+            "deferred": [],
+            "deferred_countdown": None,
+            "reserved": [],
+        }
+    assert not mock_async_client.called
+
+
+@pytest.mark.django_db
+def test_send_queued_messages_command(mock_async_client, settings):
+    settings.MESSAGING_DELIVERY_BATCH_SIZE = 2
+    for i in range(3):
+        create_message(f"+1222222222{i}")
+    call_command("send_queued_messages", batch_size=2)
+    assert not Message.objects.filter(status="QUEUED").exists()
+    assert Message.objects.filter(status="SENT").count() == 3
+
+
+@pytest.mark.django_db
+def test_deliver_queued_claims_oldest_messages(mock_async_client):
+    messages = [create_message(f"+1222222222{i}") for i in range(3)]
+    with DeliveryEngine() as engine:
+        result = engine.deliver_queued(batch_size=2)
+    assert result["claimed"] == 2
+    assert result["sent"] == 2
+    statuses = {
+        message.id: message.status
+        for message in Message.objects.filter(id__in=[m.id for m in messages])
+    }
+    assert [statuses[m.id] for m in messages] == ["SENT", "SENT", "QUEUED"]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_deliver_queued_skips_messages_locked_by_another_dispatcher(
+    mock_async_client,
+):
+    locked = create_message("+12222222220")
+    free = create_message("+12222222221")
+    is_locked = threading.Event()
+    release = threading.Event()
+
+    def hold_lock():
+        try:
+            with transaction.atomic():
+                list(Message.objects.select_for_update().filter(id=locked.id))
+                is_locked.set()
+                release.wait(10)
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=hold_lock)
+    thread.start()
+    try:
+        assert is_locked.wait(10)
+        with DeliveryEngine() as engine:
+            result = engine.deliver_queued()
+    finally:
+        release.set()
+        thread.join()
+
+    assert result["claimed"] == 1
+    locked.refresh_from_db()
+    assert locked.status == "QUEUED"
+    free.refresh_from_db()
+    assert free.status == "SENT"
+
+
+@pytest.mark.django_db
+def test_reclaim_stalled_messages(settings, django_capture_on_commit_callbacks):
+    settings.MESSAGING_SENDING_TIMEOUT = 60
+    now = timezone.now()
+    stalled = create_message("+12222222220", status="SENDING")
+    sending = create_message("+12222222221", status="SENDING")
+    sent = create_message("+12222222222", status="SENT")
+    Message.objects.filter(id__in=[stalled.id, sent.id]).update(
+        claimed_at=now - timedelta(seconds=120)
+    )
+    Message.objects.filter(id=sending.id).update(claimed_at=now - timedelta(seconds=10))
+
+    with patch("messaging.tasks.enqueue_messages") as mock_enqueue:
+        with django_capture_on_commit_callbacks(execute=True):
+            assert reclaim_stalled_messages() == 1
+
+    mock_enqueue.assert_called_once_with([stalled.id])
+    assert dict(Message.objects.values_list("id", "status")) == {
+        stalled.id: "QUEUED",
+        sending.id: "SENDING",
+        sent.id: "SENT",
+    }
@@ -0,0 +1,150 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import AsyncRequestFactory, RequestFactory
+
+from messaging.export import COLUMNS, export_messages
+from messaging.models import Message, Participant
+from messaging.utils import resolve_conversation
+from messaging.views import MessageExportView
+
+NOW = datetime(2026, 10, 18, 12, 0, tzinfo=dt_timezone.utc)
+
+
+def create_message(sender, recipient, timestamp, **kwargs):
+    fields = {
+        "message_type": "sms",
+        "direction": "OUTGOING",
+        "body": "Hello, world",
+        "status": "SENT",
+        **kwargs,
+    }
+    return Message.objects.create(
+        conversation=resolve_conversation(sender, recipient),
+        sender=sender,
+        recipient=recipient,
+        timestamp=timestamp,
+        **fields,
+    )
+
+
+@pytest.fixture
+def messages(participant_1, participant_2):
+    other = Participant.objects.create(phone="+15550000000")
+    return [
+        create_message(participant_1, participant_2, NOW - timedelta(minutes=2)),
+        create_message(
+            participant_2,
+            participant_1,
+            NOW - timedelta(minutes=3),
+            message_type="mms",
+            attachments=[{"url": "https://example.com/a.png"}],
+        ),
+        create_message(participant_1, other, NOW, status="FAILED", last_error="Down"),
+    ]
+
+
+def export(query=None):
+    request = RequestFactory().get("/messages/export/", query or {})
+    return MessageExportView.as_view()(request)
+
+
+def ndjson_rows(response):
+    content = b"".join(response.streaming_content).decode()
+    return [json.loads(line) for line in content.splitlines()]
+
+
+@pytest.mark.django_db
+def test_export_messages_in_chunks(messages):
+    chunks = list(export_messages(Message.objects.order_by(), "ndjson", 2))
+
+    assert len(chunks) == 2
+    assert sum(chunk.count(b"\n") for chunk in chunks) == 3
+
+
+@pytest.mark.django_db
+def test_export_ndjson(messages):
+    response = export()
+
+    assert response.status_code == 200
+    assert response.streaming
+    assert response["Content-Type"] == "application/x-ndjson"
+    assert response["Content-Disposition"] == 'attachment; filename="messages.ndjson"'
+    rows = {row["id"]: row for row in ndjson_rows(response)}
+    row = rows[str(messages[1].id)]
+    assert list(row) == COLUMNS
+    assert row["conversation"] == str(messages[1].conversation_id)
+    assert row["attachments"] == [{"url": "https://example.com/a.png"}]
+    assert row["timestamp"] == "2026-10-18T11:57:00Z"
+
+
+@pytest.mark.django_db
+def test_export_csv(messages):
+    response = export({"format": "csv"})
+
+    assert response["Content-Type"] == "text/csv"
+    content = b"".join(response.streaming_content).decode()
+    rows = list(csv.DictReader(io.StringIO(content)))
+    assert len(rows) == 3
+    row = next(row for row in rows if row["id"] == str(messages[1].id))
+    assert json.loads(row["attachments"]) == [{"url": "https://example.com/a.png"}]
+    assert row["last_error"] == ""
+    assert row["timestamp"] == "2026-10-18T11:57:00+00:00"
+
+
+@pytest.mark.django_db
+def test_export_conversation_in_timestamp_order(messages):
+    response = export({"conversation": str(messages[0].conversation_id)})
+
+    assert [row["id"] for row in ndjson_rows(response)] == [
+        str(messages[1].id),
+        str(messages[0].id),
+    ]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ({"message_type": "mms"}, [1]),
+        ({"status": "FAILED"}, [2]),
+        ({"since": "2026-10-18T11:58:00Z"}, [0, 2]),
+        ({"since": "2026-10-18T11:58:00Z", "until": "2026-10-18T12:00:00Z"}, [0]),
+    ],
+)
+def test_export_filters(messages, query, expected):
+    rows = ndjson_rows(export(query))
+
+    assert {row["id"] for row in rows} == {str(messages[i].id) for i in expected}
+
+
+@pytest.mark.django_db
+def test_export_participant(messages, participant_2):
+    rows = ndjson_rows(export({"participant": str(participant_2.id)}))
+
+    assert {row["id"] for row in rows} == {str(messages[0].id), str(messages[1].id)}
+
+
+@pytest.mark.django_db
+def test_export_invalid_parameters():
+    response = export({"format": "xml", "since": "yesterday"})
+
+    assert response.status_code == 400
+    assert set(json.loads(response.content)) == {"format", "since"}
+
+
+@pytest.mark.django_db
+def test_export_streams_asynchronously_under_asgi(messages):
+    request = AsyncRequestFactory().get("/messages/export/")
+    response = MessageExportView.as_view()(request)
+
+    async def read():
+        return [chunk async for chunk in response.streaming_content]
+
+    assert response.is_async
+    content = b"".join(async_to_sync(read)()).decode()
+    assert len(content.splitlines()) == 3
@@ -0,0 +1,44 @@
+import time
+import uuid
+
+import pytest
+
+from messaging.ids import uuid7, uuid7_timestamp
+from messaging.models import Conversation, Message, Participant
+
+
+def test_uuid7_version_and_variant():
+    value = uuid7()
+    assert value.version == 7
+    assert value.variant == uuid.RFC_4122
+
+
+def test_uuid7_holds_generation_time():
+    before = time.time()
+    value = uuid7()
+    after = time.time()
+    assert before - 0.001 <= uuid7_timestamp(value) <= after
+
+
+def test_uuid7_is_time_ordered():
+    values = []
+    for _ in range(5):
+        values.append(uuid7())
+        time.sleep(0.002)
+    assert values == sorted(values)
+    assert str(values[0]) < str(values[-1])
+
+
+def test_uuid7_is_unique():
+    assert len({uuid7() for _ in range(10000)}) == 10000
+
+
+@pytest.mark.django_db
+def test_models_use_uuid7(participant_1, participant_2):
+    conversation = Conversation.objects.create(
+        participant_1=participant_1, participant_2=participant_2
+    )
+    assert participant_1.id.version == 7
+    assert conversation.id.version == 7
+    for model in [Participant, Conversation, Message]:
+        assert model._meta.pk.default is uuid7
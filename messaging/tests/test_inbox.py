@@ -0,0 +1,179 @@
+import importlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import pytest
+from django.db import connection
+from rest_framework.test import APIRequestFactory
+
+from messaging import summaries
+from messaging.models import (
+    Conversation,
+    ConversationParticipant,
+    Message,
+    Participant,
+)
+from messaging.utils import resolve_conversations, resolve_participant
+from messaging.views import ParticipantInboxView
+
+NOW = datetime(2026, 10, 18, 12, 0, tzinfo=dt_timezone.utc)
+# Minutes since the last message of each conversation of the fixture
+MINUTES = [0, 1, 1, 2, 3]
+
+
+@pytest.fixture
+def owner(db):
+    return Participant.objects.create(phone="+15550000000", email="owner@example.com")
+
+
+@pytest.fixture
+def conversations(owner):
+    """
+    Conversations of owner with 5 other participants, on both sides of the
+    conversation, the first one the most recent.
+    """
+    others = [resolve_participant(phone=f"+1555000010{i}") for i in range(5)]
+    resolved = resolve_conversations([(owner.id, other.id) for other in others])
+    conversations = [resolved[tuple(sorted([owner.id, o.id]))] for o in others]
+    # Two conversations with the same activity, the id breaks the tie
+    for conversation, other, minutes in zip(conversations, others, MINUTES):
+        summaries.add_messages(
+            Message.objects.bulk_create(
+                [
+                    Message(
+                        conversation=conversation,
+                        sender=owner,
+                        recipient=other,
+                        message_type="sms",
+                        direction="outbound",
+                        body="Hello",
+                        status="SENT",
+                        timestamp=NOW - timedelta(minutes=minutes),
+                    )
+                ]
+            )
+        )
+    return conversations
+
+
+def inbox(query):
+    return ParticipantInboxView.as_view()(APIRequestFactory().get("/", query))
+
+
+def fetch_all(query):
+    pages = []
+    response = inbox(query)
+    while True:
+        assert response.status_code == 200
+        pages.append([row["id"] for row in response.data["results"]])
+        if not response.data["next"]:
+            return pages
+        request = APIRequestFactory().get(response.data["next"])
+        response = ParticipantInboxView.as_view()(request)
+
+
+@pytest.mark.django_db
+def test_resolve_conversations_creates_memberships(owner, participant_1):
+    resolve_conversations([(owner.id, participant_1.id)])
+    # Resolved again, the memberships are left alone
+    resolve_conversations([(participant_1.id, owner.id)])
+
+    assert set(
+        ConversationParticipant.objects.values_list("participant_id", flat=True)
+    ) == {owner.id, participant_1.id}
+
+
+@pytest.mark.django_db
+def test_conversation_created_with_the_orm_has_memberships(owner, participant_1):
+    conversation = Conversation.objects.create(
+        participant_1=owner, participant_2=participant_1
+    )
+
+    memberships = ConversationParticipant.objects.filter(conversation=conversation)
+    assert {m.participant_id for m in memberships} == {owner.id, participant_1.id}
+    assert {m.last_activity for m in memberships} == {conversation.last_activity}
+
+
+@pytest.mark.django_db
+def test_add_messages_updates_membership_activity(conversations, owner):
+    activity = {
+        m.conversation_id: m.last_activity
+        for m in ConversationParticipant.objects.filter(participant=owner)
+    }
+
+    assert activity == {
+        conversation.id: NOW - timedelta(minutes=minutes)
+        for conversation, minutes in zip(conversations, MINUTES)
+    }
+    # Both memberships follow the conversation
+    assert (
+        ConversationParticipant.objects.filter(
+            conversation=conversations[0], last_activity=NOW
+        ).count()
+        == 2
+    )
+
+
+@pytest.mark.django_db
+def test_inbox_most_recent_first(conversations):
+    pages = fetch_all({"phone": "+15550000000", "page_size": 2})
+
+    assert [len(page) for page in pages] == [2, 2, 1]
+    tied = sorted([conversations[1].id, conversations[2].id], reverse=True)
+    expected = [conversations[0].id, *tied, conversations[3].id, conversations[4].id]
+    assert sum(pages, []) == [str(conversation_id) for conversation_id in expected]
+
+
+@pytest.mark.django_db
+def test_inbox_by_email(conversations):
+    response = inbox({"email": "owner@example.com"})
+
+    assert response.status_code == 200
+    assert response.data["results"][0]["id"] == str(conversations[0].id)
+    assert response.data["results"][0]["message_count"] == 1
+    assert len(response.data["results"]) == 5
+
+
+@pytest.mark.django_db
+def test_inbox_of_other_participant(conversations):
+    response = inbox({"phone": "+15550000100"})
+
+    assert [row["id"] for row in response.data["results"]] == [str(conversations[0].id)]
+
+
+@pytest.mark.django_db
+def test_inbox_of_unknown_participant():
+    response = inbox({"phone": "+19999999999"})
+
+    assert response.status_code == 200
+    assert response.data == {"next": None, "results": []}
+
+
+@pytest.mark.django_db
+def test_inbox_requires_phone_or_email():
+    response = inbox({})
+
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_inbox_is_one_query(conversations, django_assert_num_queries):
+    with django_assert_num_queries(1):
+        response = inbox({"phone": "+15550000000", "page_size": 2})
+        response.render()
+    assert len(response.data["results"]) == 2
+
+
+@pytest.mark.django_db
+def test_migration_backfills_memberships(conversations):
+    ConversationParticipant.objects.all().delete()
+    migration = importlib.import_module(
+        "messaging.migrations.0010_backfill_conversations"
+    )
+
+    migration.backfill(connection, migration.MEMBERSHIPS_SQL, batch_size=3)
+
+    assert ConversationParticipant.objects.count() == 10
+    membership = ConversationParticipant.objects.get(
+        conversation=conversations[0], participant=conversations[0].participant_1
+    )
+    assert membership.last_activity == NOW
@@ -0,0 +1,208 @@
+import json
+from unittest.mock import MagicMock, patch
+
+import httpx
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import AsyncRequestFactory
+from django.utils import timezone
+from prometheus_client import REGISTRY
+from rest_framework.test import APIRequestFactory
+
+from messaging import metrics
+from messaging.models import Conversation, Message
+from messaging.providers.base import RetryableProviderError
+from messaging.providers.text import TextProvider
+from messaging.tasks import send_message
+from messaging.views import (
+    AsyncTextInboundWebhook,
+    MetricsView,
+    TextInboundBatchWebhook,
+    TextInboundWebhook,
+)
+
+
+@pytest.fixture
+def payload():
+    return {
+        "to": "+15550000001",
+        "from": "+15550000002",
+        "type": "sms",
+        "body": "Hello!",
+        "messaging_provider_id": "metrics-1",
+        "attachments": None,
+        "timestamp": "2024-06-01T12:00:00Z",
+    }
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class Delta:
+    """
+    Changes of samples of the default registry, which is shared by the tests.
+    """
+
+    def __init__(self, *samples):
+        self.samples = samples
+        self.before = [sample(name, **labels) for name, labels in samples]
+
+    def __call__(self):
+        return [
+            sample(name, **labels) - before
+            for (name, labels), before in zip(self.samples, self.before)
+        ]
+
+
+def inbound(outcome, message_type="sms"):
+    return (
+        "messaging_inbound_messages_total",
+        {"message_type": message_type, "outcome": outcome},
+    )
+
+
+def post(view_class, data):
+    request = APIRequestFactory().post("/", data, format="json")
+    return view_class.as_view()(request)
+
+
+@pytest.mark.django_db
+def test_webhook_counts_outcomes(payload):
+    delta = Delta(
+        inbound("created"),
+        inbound("duplicate"),
+        inbound("error", "other"),
+        (
+            "messaging_webhook_duration_seconds_count",
+            {"webhook": "text", "status": "201"},
+        ),
+    )
+    # Unknown payload types, and payloads without one, share a label
+    delta_other = Delta(inbound("created", "other"))
+
+    assert post(TextInboundWebhook, payload).status_code == 201
+    assert post(TextInboundWebhook, payload).status_code == 200
+    assert post(TextInboundWebhook, {"to": "+1"}).status_code == 400
+    post(TextInboundWebhook, {**payload, "type": "fax", "messaging_provider_id": "x"})
+
+    assert delta() == [1, 1, 1, 2]
+    assert delta_other() == [1]
+
+
+@pytest.mark.django_db
+def test_batch_webhook_counts_each_message(payload):
+    delta = Delta(
+        inbound("created"),
+        inbound("error", "other"),
+        (
+            "messaging_webhook_duration_seconds_count",
+            {"webhook": "text_batch", "status": "200"},
+        ),
+    )
+
+    response = post(
+        TextInboundBatchWebhook,
+        [payload, {**payload, "messaging_provider_id": "metrics-2"}, {"to": "+1"}],
+    )
+
+    assert response.data["created"] == 2
+    assert delta() == [2, 1, 1]
+
+
+@pytest.mark.django_db
+def test_async_webhook_counts_outcomes(payload):
+    delta = Delta(
+        inbound("created"),
+        (
+            "messaging_webhook_duration_seconds_count",
+            {"webhook": "text_async", "status": "201"},
+        ),
+    )
+    request = AsyncRequestFactory().post(
+        "/", json.dumps(payload), content_type="application/json"
+    )
+
+    response = async_to_sync(AsyncTextInboundWebhook.as_view())(request)
+
+    assert response.status_code == 201
+    assert delta() == [1, 1]
+
+
+@pytest.mark.django_db
+@patch("messaging.tasks.TextProvider")
+def test_send_message_observes_sends(mock_text_provider, participant_1, participant_2):
+    message = Message.objects.create(
+        conversation=Conversation.objects.create(
+            participant_1=participant_1, participant_2=participant_2
+        ),
+        sender=participant_1,
+        recipient=participant_2,
+        message_type="sms",
+        direction="outbound",
+        body="Hello",
+        status="QUEUED",
+        timestamp=timezone.now(),
+    )
+    labels = {"message_type": "sms", "outcome": "sent"}
+    delta = Delta(
+        ("messaging_sends_total", labels),
+        ("messaging_send_duration_seconds_count", labels),
+    )
+
+    send_message.apply(args=[str(message.id)])
+
+    assert delta() == [1, 1]
+
+
+@pytest.mark.parametrize(
+    "response, outcome",
+    [
+        (httpx.Response(200, json={"id": "1"}), "2xx"),
+        (httpx.Response(503), "5xx"),
+        (httpx.Response(429), "429"),
+        (httpx.ConnectError("refused"), "transport_error"),
+    ],
+)
+def test_provider_request_outcome(response, outcome):
+    provider = TextProvider(to="+1", _from="+2", _type="sms", body="Hi")
+    delta = Delta(
+        (
+            "messaging_provider_request_duration_seconds_count",
+            {"provider": "text", "outcome": outcome},
+        )
+    )
+    if isinstance(response, httpx.Response):
+        response.request = httpx.Request("POST", "http://provider.test")
+    mock_request = MagicMock(side_effect=[response])
+
+    with patch.object(provider.client, "request", mock_request):
+        try:
+            provider.send_message()
+        except RetryableProviderError:
+            pass
+
+    assert delta() == [1]
+
+
+def test_response_outcome():
+    assert metrics.response_outcome(201) == "2xx"
+    assert metrics.response_outcome(404) == "4xx"
+    assert metrics.response_outcome(429) == "429"
+
+
+@pytest.mark.django_db
+def test_metrics_view(payload, settings):
+    settings.MESSAGING_INBOUND_BUFFER = False
+    post(TextInboundWebhook, payload)
+    Message.objects.update(status="QUEUED")
+
+    response = MetricsView.as_view()(APIRequestFactory().get("/metrics"))
+
+    assert response.status_code == 200
+    assert response["Content-Type"].startswith("text/plain")
+    content = response.content.decode()
+    assert 'messaging_pending_messages{status="QUEUED"} 1.0' in content
+    assert 'messaging_pending_messages{status="RETRYING"} 0.0' in content
+    assert "messaging_inbound_messages_total" in content
+    assert "messaging_inbound_buffer_length" not in content
@@ -0,0 +1,137 @@
+from datetime import timedelta
+
+import pytest
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIRequestFactory
+
+from messaging.models import Conversation, Message, Participant
+from messaging.pagination import KeysetPagination
+from messaging.utils import resolve_conversation, resolve_participant
+from messaging.views import (
+    ConversationListView,
+    ConversationMessagesView,
+    MessageListView,
+)
+
+
+@pytest.fixture
+def api_factory():
+    return APIRequestFactory()
+
+
+@pytest.fixture
+def conversation(db):
+    sender = resolve_participant(phone="+11111111111")
+    recipient = resolve_participant(phone="+12222222222")
+    conversation = resolve_conversation(sender, recipient)
+    timestamp = timezone.now()
+    Message.objects.bulk_create(
+        [
+            Message(
+                conversation=conversation,
+                sender=sender,
+                recipient=recipient,
+                message_type="sms",
+                direction="outbound",
+                body=f"Message {i}",
+                status="SENT",
+                # Pairs of messages share a timestamp, the id breaks the tie
+                timestamp=timestamp + timedelta(seconds=i // 2),
+            )
+            for i in range(7)
+        ]
+    )
+    return conversation
+
+
+def fetch_all(api_factory, view, url, **kwargs):
+    pages = []
+    while url:
+        response = view(api_factory.get(url), **kwargs)
+        assert response.status_code == status.HTTP_200_OK
+        pages.append(response.data["results"])
+        url = response.data["next"]
+    return pages
+
+
+def test_conversation_messages_pages(api_factory, conversation):
+    view = ConversationMessagesView.as_view()
+    pages = fetch_all(
+        api_factory,
+        view,
+        f"/conversations/{conversation.id}/messages/?page_size=2",
+        conversation_id=conversation.id,
+    )
+    assert [len(page) for page in pages] == [2, 2, 2, 1]
+    ids = [message["id"] for page in pages for message in page]
+    expected = Message.objects.order_by("timestamp", "id").values_list("id", flat=True)
+    assert ids == [str(id) for id in expected]
+
+
+@pytest.mark.parametrize("since", ["yesterday", "2024-13-45T00:00"])
+def test_conversation_messages_invalid_bound(api_factory, conversation, since):
+    response = ConversationMessagesView.as_view()(
+        api_factory.get(f"/conversations/{conversation.id}/messages/?since={since}"),
+        conversation_id=conversation.id,
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.data == {"since": "Invalid timestamp"}
+
+
+def test_message_list_pages(api_factory, conversation):
+    pages = fetch_all(api_factory, MessageListView.as_view(), "/messages/?page_size=3")
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert len({message["id"] for page in pages for message in page}) == 7
+
+
+def test_conversation_list_single_page(api_factory, conversation):
+    response = ConversationListView.as_view()(api_factory.get("/conversations/"))
+    assert response.data["next"] is None
+    assert [c["id"] for c in response.data["results"]] == [str(conversation.id)]
+
+
+def test_conversation_list_most_recent_first(api_factory, conversation):
+    older = Conversation.objects.create(
+        participant_1=conversation.participant_2,
+        participant_2=Participant.objects.create(phone="+15550000099"),
+    )
+    Conversation.objects.filter(id=older.id).update(
+        last_activity=conversation.last_activity - timedelta(days=1)
+    )
+    pages = fetch_all(
+        api_factory, ConversationListView.as_view(), "/conversations/?page_size=1"
+    )
+    assert [c["id"] for page in pages for c in page] == [
+        str(conversation.id),
+        str(older.id),
+    ]
+
+
+def test_page_size_is_bounded(api_factory, conversation, monkeypatch):
+    monkeypatch.setattr(KeysetPagination, "max_page_size", 5)
+    response = MessageListView.as_view()(api_factory.get("/messages/?page_size=1000"))
+    assert len(response.data["results"]) == 5
+
+
+def test_deep_page_is_one_query(api_factory, conversation, django_assert_num_queries):
+    response = MessageListView.as_view()(api_factory.get("/messages/?page_size=3"))
+    with django_assert_num_queries(1):
+        MessageListView.as_view()(api_factory.get(response.data["next"]))
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "garbage",
+        "WyJmb28iXQ==",
+        "WyJmb28iLCAiYmFyIl0=",
+        # [null, null]
+        "W251bGwsIG51bGxd",
+        # [1, 2]
+        "WzEsIDJd",
+    ],
+)
+def test_invalid_cursor(api_factory, conversation, cursor):
+    response = MessageListView.as_view()(api_factory.get(f"/messages/?cursor={cursor}"))
+    assert response.status_code == status.HTTP_404_NOT_FOUND
@@ -0,0 +1,204 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from messaging import partitions, summaries
+from messaging.models import Conversation, Message, Participant, ProviderMessageKey
+from messaging.utils import ingest_inbound_messages, resolve_conversation
+from messaging.views import ConversationMessagesView
+
+NOW = datetime(2026, 10, 18, 12, 0, tzinfo=dt_timezone.utc)
+
+
+def create_message(participant_1, participant_2, timestamp, provider_message_id):
+    return Message.objects.create(
+        conversation=resolve_conversation(participant_1, participant_2),
+        sender=participant_1,
+        recipient=participant_2,
+        message_type="sms",
+        direction="inbound",
+        body="Hello",
+        provider_message_id=provider_message_id,
+        status="RECIEVED",
+        timestamp=timestamp,
+    )
+
+
+def partition_of(message):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT tableoid::regclass::text FROM messaging_message WHERE id = %s",
+            [message.id],
+        )
+        return cursor.fetchone()[0]
+
+
+def entry(provider_message_id, timestamp):
+    return {
+        "to": "1234567890",
+        "from": "0987654321",
+        "type": "sms",
+        "body": "Hello",
+        "provider_message_id": provider_message_id,
+        "attachments": None,
+        "timestamp": timestamp,
+    }
+
+
+@pytest.fixture
+def partitioned(participant_1, participant_2, settings):
+    settings.MESSAGING_PARTITIONED_MESSAGES = True
+    old = create_message(participant_1, participant_2, NOW - timedelta(days=400), "old")
+    # Tables with pending foreign key checks can't be altered, the checks are
+    # deferred to the end of the test transaction otherwise
+    connection.check_constraints()
+    partitions.convert(months_ahead=2, now=NOW)
+    return old
+
+
+def test_add_months():
+    assert partitions.add_months(NOW, 3) == datetime(
+        2027, 1, 18, 12, 0, tzinfo=dt_timezone.utc
+    )
+    assert partitions.add_months(NOW, -10).month == 12
+
+
+@pytest.mark.django_db
+def test_convert_creates_monthly_partitions(partitioned):
+    assert partitions.is_partitioned()
+    assert partitions.list_partitions() == [
+        (partitions.DEFAULT_PARTITION, None, None),
+        (
+            partitions.LEGACY_PARTITION,
+            None,
+            datetime(2026, 11, 1, tzinfo=dt_timezone.utc),
+        ),
+        (
+            "messaging_message_p2026_11",
+            datetime(2026, 11, 1, tzinfo=dt_timezone.utc),
+            datetime(2026, 12, 1, tzinfo=dt_timezone.utc),
+        ),
+        (
+            "messaging_message_p2026_12",
+            datetime(2026, 12, 1, tzinfo=dt_timezone.utc),
+            datetime(2027, 1, 1, tzinfo=dt_timezone.utc),
+        ),
+    ]
+    assert partition_of(partitioned) == partitions.LEGACY_PARTITION
+    assert ProviderMessageKey.objects.filter(
+        provider_message_id="old", message_id=partitioned.id
+    ).exists()
+
+
+@pytest.mark.django_db
+def test_messages_are_routed_and_deduplicated(partitioned):
+    timestamp = datetime(2026, 11, 5, tzinfo=dt_timezone.utc)
+    assert ingest_inbound_messages(
+        [entry("new", timestamp), entry("old", timestamp), entry("new", timestamp)],
+        "phone",
+    ) == ["created", "duplicate", "duplicate"]
+    message = Message.objects.get(provider_message_id="new")
+    assert partition_of(message) == "messaging_message_p2026_11"
+
+    far = create_message(
+        message.sender, message.recipient, NOW + timedelta(days=3650), "far"
+    )
+    assert partition_of(far) == partitions.DEFAULT_PARTITION
+
+
+@pytest.mark.django_db
+def test_timeline_query_prunes_partitions(partitioned):
+    view = ConversationMessagesView(
+        request=Request(
+            APIRequestFactory().get(
+                "/", {"since": "2026-12-01T00:00:00Z", "until": "2026-12-15T00:00:00Z"}
+            )
+        ),
+        kwargs={"conversation_id": partitioned.conversation_id},
+    )
+    plan = view.get_queryset().explain()
+    assert "messaging_message_p2026_12" in plan
+    assert "messaging_message_p2026_11" not in plan
+    assert partitions.LEGACY_PARTITION not in plan
+
+
+@pytest.mark.django_db
+def test_ensure_partitions_is_idempotent(partitioned):
+    later = partitions.add_months(NOW, 1)
+    assert partitions.ensure_partitions(2, now=later) == ["messaging_message_p2027_01"]
+    assert partitions.ensure_partitions(2, now=later) == []
+
+
+@pytest.mark.django_db
+def test_ensure_partitions_moves_rows_out_of_default(partitioned):
+    far = create_message(
+        partitioned.sender,
+        partitioned.recipient,
+        datetime(2027, 1, 20, tzinfo=dt_timezone.utc),
+        "far",
+    )
+    assert partition_of(far) == partitions.DEFAULT_PARTITION
+    connection.check_constraints()
+
+    later = partitions.add_months(NOW, 1)
+    assert partitions.ensure_partitions(2, now=later) == ["messaging_message_p2027_01"]
+
+    assert partition_of(far) == "messaging_message_p2027_01"
+    assert Message.objects.filter(timestamp__gte=NOW).get() == far
+
+
+@pytest.mark.django_db
+def test_expire_partitions(partitioned):
+    ProviderMessageKey.objects.filter(provider_message_id="old").update(
+        created_at=NOW - timedelta(days=400)
+    )
+    later = datetime(2027, 2, 10, tzinfo=dt_timezone.utc)
+    connection.check_constraints()
+    detached = partitions.expire_partitions(2, drop=True, now=later)
+    assert detached == [partitions.LEGACY_PARTITION, "messaging_message_p2026_11"]
+    assert not Message.objects.filter(id=partitioned.id).exists()
+    assert not ProviderMessageKey.objects.filter(provider_message_id="old").exists()
+
+
+@pytest.mark.django_db
+def test_expire_partitions_updates_summaries(partitioned):
+    recent = create_message(
+        partitioned.sender,
+        partitioned.recipient,
+        datetime(2026, 12, 7, tzinfo=dt_timezone.utc),
+        "recent",
+    )
+    other = Participant.objects.create(phone="+15550000003")
+    alone = create_message(other, partitioned.recipient, NOW - timedelta(days=90), "")
+    summaries.add_messages([partitioned, recent, alone])
+    later = datetime(2027, 2, 10, tzinfo=dt_timezone.utc)
+    connection.check_constraints()
+
+    partitions.expire_partitions(2, drop=True, now=later, batch_size=1)
+
+    conversation = Conversation.objects.get(id=partitioned.conversation_id)
+    assert conversation.message_count == 1
+    assert conversation.last_message_id == recent.id
+    assert conversation.last_message_timestamp == recent.timestamp
+    conversation = Conversation.objects.get(id=alone.conversation_id)
+    assert conversation.message_count == 0
+    assert conversation.last_message_id is None
+    assert conversation.last_message_preview is None
+
+
+@pytest.mark.django_db
+def test_convert_requires_partitioned_setting(settings):
+    settings.MESSAGING_PARTITIONED_MESSAGES = False
+    with pytest.raises(CommandError):
+        call_command("message_partitions", "convert")
+
+
+@pytest.mark.django_db
+def test_maintain_requires_partitioned_table():
+    with pytest.raises(CommandError):
+        call_command("message_partitions", "maintain")
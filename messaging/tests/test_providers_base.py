@@ -1,8 +1,13 @@
+import asyncio
 import pytest
 from unittest.mock import patch, MagicMock
-from messaging.providers.base import MessagingProvider
+from messaging.providers.base import (
+    MessagingProvider,
+    PermanentProviderError,
+    RetryableProviderError,
+    parse_retry_after,
+)
 import httpx
-import tenacity
 
 
 def test_init_sets_timeout_and_client():
@@ -16,7 +21,7 @@ def test_init_sets_timeout_and_client():
 def test_send_request_success(mock_request):
     provider = MessagingProvider()
     mock_response = MagicMock()
-    mock_response.raise_for_status.return_value = None
+    mock_response.is_error = False
     mock_response.json.return_value = {"result": "ok"}
     mock_request.return_value = mock_response
 
@@ -25,18 +30,76 @@ def test_send_request_success(mock_request):
     assert result == {"result": "ok"}
 
 
+def error_response(status_code, headers=None):
+    return httpx.Response(
+        status_code,
+        headers=headers,
+        request=httpx.Request("POST", "http://fail.com"),
+    )
+
+
 @patch("httpx.Client.request")
 def test_send_request_raises_for_status_error(mock_request):
     provider = MessagingProvider()
-    mock_response = MagicMock()
-    mock_response.raise_for_status.side_effect = httpx.HTTPStatusError(
-        "error", request=MagicMock(), response=MagicMock()
-    )
-    mock_request.return_value = mock_response
-    print("mock_response:", mock_response)
-    print("mock_request:", mock_request)
-    with pytest.raises(tenacity.RetryError):
+    mock_request.return_value = error_response(503)
+    with pytest.raises(RetryableProviderError) as excinfo:
         provider.send_request("GET", "http://fail.com")
+    # Failed requests are not retried in-process
+    assert mock_request.call_count == 1
+    assert excinfo.value.status_code == 503
+
+
+@patch("httpx.Client.request")
+def test_send_request_rate_limited_respects_retry_after(mock_request):
+    provider = MessagingProvider()
+    mock_request.return_value = error_response(429, {"Retry-After": "42"})
+    with pytest.raises(RetryableProviderError) as excinfo:
+        provider.send_request("POST", "http://fail.com")
+    assert excinfo.value.retry_after == 42
+
+
+@patch("httpx.Client.request")
+def test_send_request_client_error_is_permanent(mock_request):
+    provider = MessagingProvider()
+    mock_request.return_value = error_response(400)
+    with pytest.raises(PermanentProviderError):
+        provider.send_request("POST", "http://fail.com")
+
+
+@patch("httpx.Client.request")
+def test_send_request_timeout_is_retryable(mock_request):
+    provider = MessagingProvider()
+    mock_request.side_effect = httpx.ReadTimeout("timed out")
+    with pytest.raises(RetryableProviderError):
+        provider.send_request("POST", "http://fail.com")
+
+
+def test_parse_retry_after():
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("10") == 10
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+    assert parse_retry_after("soon") is None
+    for value in ["nan", "inf", "-inf"]:
+        assert parse_retry_after(value) is None
+
+
+def test_asend_request_success():
+    provider = MessagingProvider()
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, json={"result": "ok"})
+
+    async def send():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await provider.asend_request(
+                client, "POST", "http://test.com", data={"foo": "bar"}
+            )
+
+    assert asyncio.run(send()) == {"result": "ok"}
+    assert requests[0].method == "POST"
+    assert requests[0].content == b'{"foo":"bar"}'
 
 
 def test_get_current_timestamp_format():
@@ -0,0 +1,58 @@
+import pytest
+from messaging.providers import clients
+from messaging.providers.clients import close_clients, get_client
+from messaging.providers.email import EmailProvider
+from messaging.providers.text import TextProvider
+
+
+@pytest.fixture(autouse=True)
+def empty_registry():
+    close_clients()
+    yield
+    close_clients()
+
+
+def test_get_client_reuses_client_per_base_url():
+    client = get_client("https://a.example.com", 10)
+    assert get_client("https://a.example.com", 10) is client
+    assert get_client("https://b.example.com", 10) is not client
+    assert get_client("https://a.example.com", 5) is not client
+
+
+def test_get_client_uses_pool_settings(settings):
+    settings.MESSAGING_HTTP_MAX_CONNECTIONS = 7
+    settings.MESSAGING_HTTP_MAX_KEEPALIVE_CONNECTIONS = 3
+    settings.MESSAGING_HTTP_KEEPALIVE_EXPIRY = 12
+    client = get_client("https://a.example.com")
+    pool = client._transport._pool
+    assert pool._max_connections == 7
+    assert pool._max_keepalive_connections == 3
+    assert pool._keepalive_expiry == 12
+
+
+def test_get_client_http2(settings):
+    settings.MESSAGING_HTTP2 = True
+    client = get_client("https://a.example.com")
+    assert client._transport._pool._http2
+
+
+def test_close_clients_closes_and_forgets_clients():
+    client = get_client("https://a.example.com")
+    close_clients()
+    assert client.is_closed
+    assert get_client("https://a.example.com") is not client
+
+
+def test_reset_after_fork_forgets_clients():
+    client = get_client("https://a.example.com")
+    clients._reset_after_fork()
+    assert get_client("https://a.example.com") is not client
+    client.close()
+
+
+def test_providers_share_client():
+    first = EmailProvider("to@x.com", "from@x.com", "body")
+    second = EmailProvider("other@x.com", "from@x.com", "body")
+    text = TextProvider("+11111111111", "+12222222222", "sms", "body")
+    assert first.client is second.client
+    assert text.client is not first.client
@@ -46,3 +46,10 @@ def test_send_message_calls_send_request(
 def test_email_provider_default_attachments():
     provider = EmailProvider("to@x.com", "from@x.com", "body")
     assert provider.attachments == []
+
+
+def test_base_url_from_settings(settings):
+    settings.MESSAGING_EMAIL_PROVIDER_URL = "http://localhost:9000/api/email"
+    provider = EmailProvider(to="a@example.com", _from="b@example.com", body="Hi")
+
+    assert provider.base_url == "http://localhost:9000/api/email"
@@ -70,3 +70,12 @@ def test_send_message_without_attachments(mock_timestamp, mock_send_request):
     }
     mock_send_request.assert_called_once_with("POST", provider.base_url, expected_data)
     assert response == {"status": "ok"}
+
+
+def test_base_url_from_settings(settings):
+    settings.MESSAGING_TEXT_PROVIDER_URL = "http://localhost:9000/api/messages"
+    provider = TextProvider(
+        to="+11111111111", _from="+22222222222", _type="sms", body="Hi"
+    )
+
+    assert provider.base_url == "http://localhost:9000/api/messages"
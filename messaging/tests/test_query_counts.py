@@ -0,0 +1,116 @@
+"""
+Pin the number of queries of each endpoint and task, so an N+1 pattern (a
+query per row of a page, or per related object) fails the suite.
+"""
+
+import pytest
+from unittest.mock import patch
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+
+from messaging.models import Conversation, Message, Participant
+from messaging.tasks import send_message
+from messaging.views import (
+    ConversationDetailView,
+    ConversationListView,
+    ConversationMessagesView,
+    MessageCreateView,
+    MessageDetailView,
+    MessageListView,
+)
+
+
+@pytest.fixture
+def api_factory():
+    return APIRequestFactory()
+
+
+@pytest.fixture
+def conversation(db):
+    participants = [
+        Participant.objects.create(phone=f"+1555000000{i}", email=f"p{i}@example.com")
+        for i in range(2)
+    ]
+    conversation = Conversation.objects.create(
+        participant_1=participants[0], participant_2=participants[1]
+    )
+    for i in range(5):
+        Message.objects.create(
+            conversation=conversation,
+            sender=participants[i % 2],
+            recipient=participants[(i + 1) % 2],
+            message_type="sms",
+            direction="outbound",
+            body=f"Message {i}",
+            status="QUEUED",
+            timestamp=timezone.now(),
+        )
+    return conversation
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "view_class, kwargs, num_queries",
+    [
+        (MessageListView, lambda conversation: {}, 1),
+        (
+            MessageDetailView,
+            lambda conversation: {"id": conversation.message_set.first().id},
+            1,
+        ),
+        (ConversationListView, lambda conversation: {}, 1),
+        (ConversationDetailView, lambda conversation: {"pk": conversation.pk}, 1),
+        (
+            ConversationMessagesView,
+            lambda conversation: {"conversation_id": conversation.pk},
+            1,
+        ),
+    ],
+)
+def test_read_endpoint_queries(
+    api_factory,
+    conversation,
+    django_assert_num_queries,
+    view_class,
+    kwargs,
+    num_queries,
+):
+    view = view_class.as_view()
+    view_kwargs = kwargs(conversation)
+    with django_assert_num_queries(num_queries):
+        response = view(api_factory.get("/"), **view_kwargs)
+        response.render()
+    assert response.status_code == 200
+
+
+@pytest.mark.django_db
+@patch("messaging.views.send_message")
+def test_message_create_queries(
+    mock_send_message, api_factory, conversation, django_assert_num_queries
+):
+    payload = {
+        "sender": "+15550000000",
+        "recipient": "+15550000001",
+        "message_type": "sms",
+        "body": "Hello!",
+    }
+    # sender, recipient, conversation, memberships, then savepoint, message,
+    # conversation summary, release
+    with django_assert_num_queries(8):
+        response = MessageCreateView.as_view()(
+            api_factory.post("/", payload, format="json")
+        )
+    assert response.status_code == 201
+
+
+@pytest.mark.django_db
+@patch("messaging.tasks.TextProvider")
+def test_send_message_queries(
+    mock_text_provider, conversation, django_assert_num_queries
+):
+    message = conversation.message_set.first()
+    # claim, load with sender and recipient, mark as SENT
+    with django_assert_num_queries(3):
+        send_message(message.id)
+    message.refresh_from_db()
+    assert message.status == "SENT"
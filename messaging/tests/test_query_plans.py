@@ -0,0 +1,169 @@
+import importlib
+import re
+from datetime import timedelta
+
+import pytest
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from messaging.models import (
+    Conversation,
+    ConversationParticipant,
+    Message,
+    Participant,
+)
+from messaging.pagination import (
+    ConversationPagination,
+    InboxPagination,
+    KeysetPagination,
+    TimelinePagination,
+)
+from messaging.views import (
+    ConversationListView,
+    ConversationMessagesView,
+    MessageListView,
+    ParticipantInboxView,
+)
+
+
+@pytest.fixture
+def messages(db):
+    """
+    Enough rows for the planner statistics to be meaningful:
+    50 conversations with 200 messages each, 2% of them still queued.
+    """
+    participants = Participant.objects.bulk_create(
+        [Participant(phone=f"+1555000{i:04d}") for i in range(51)]
+    )
+    conversations = Conversation.objects.bulk_create(
+        [
+            Conversation(participant_1=participants[0], participant_2=participant)
+            for participant in participants[1:]
+        ]
+    )
+    start = timezone.now() - timedelta(days=30)
+    Message.objects.bulk_create(
+        [
+            Message(
+                conversation=conversation,
+                sender=conversation.participant_1,
+                recipient=conversation.participant_2,
+                message_type="sms",
+                direction="outbound",
+                body="Hello",
+                status="SENT" if i % 50 else "QUEUED",
+                timestamp=start + timedelta(minutes=i * 50 + n),
+            )
+            # Inserted in time order, conversations interleaved like real traffic
+            for i in range(200)
+            for n, conversation in enumerate(conversations)
+        ]
+    )
+    with connection.cursor() as cursor:
+        for model in [Participant, Conversation, Message]:
+            cursor.execute(f"ANALYZE {model._meta.db_table}")
+    return conversations
+
+
+def explain(queryset, limit=50):
+    """
+    Explain the query for one page of the queryset, as run by the keyset
+    pagination.
+    Sequential scans are always cheaper on a table this small, so they are
+    disabled to show which index the query would use on a large table.
+    """
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        return queryset[:limit].explain()
+
+
+def has_full_sort(plan):
+    # Sort nodes, not Incremental Sort nodes or Sort Key lines
+    return re.search(r"^\s*(->\s+)?Sort\s+\(", plan, re.MULTILINE) is not None
+
+
+def test_conversation_messages_use_timeline_index(messages):
+    view = ConversationMessagesView(
+        request=Request(APIRequestFactory().get("/")),
+        kwargs={"conversation_id": messages[0].id},
+    )
+    queryset = view.get_queryset().order_by(*TimelinePagination.ordering)
+    plan = explain(queryset)
+    assert "message_conv_timestamp_idx" in plan
+    # Only rows with the same timestamp need to be sorted by id
+    assert not has_full_sort(plan)
+
+
+def test_message_list_uses_created_at_index(messages):
+    queryset = MessageListView().get_queryset().order_by(*KeysetPagination.ordering)
+    plan = explain(queryset)
+    assert "message_created_at_idx" in plan
+    assert not has_full_sort(plan)
+
+
+def test_queued_messages_scan_uses_status_index(messages):
+    queryset = Message.objects.filter(status="QUEUED").order_by("created_at")
+    plan = explain(queryset)
+    assert "message_status_created_idx" in plan
+    assert not has_full_sort(plan)
+
+
+@pytest.fixture
+def conversations(db):
+    """
+    5000 conversations with activity spread over the last 30 days, all with
+    the first participant, and their memberships.
+    """
+    participants = Participant.objects.bulk_create(
+        [Participant(phone=f"+1555{i:07d}") for i in range(5001)]
+    )
+    conversations = Conversation.objects.bulk_create(
+        [
+            Conversation(participant_1=participants[0], participant_2=participant)
+            for participant in participants[1:]
+        ]
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "UPDATE messaging_conversation "
+            "SET last_activity = now() - random() * interval '30 days'"
+        )
+        # Bulk created conversations have no memberships yet
+        migration = importlib.import_module(
+            "messaging.migrations.0010_backfill_conversations"
+        )
+        migration.backfill(connection, migration.MEMBERSHIPS_SQL)
+        for model in [Participant, Conversation, ConversationParticipant]:
+            cursor.execute(f"ANALYZE {model._meta.db_table}")
+    return conversations
+
+
+def test_recent_conversations_use_activity_index_backward(conversations):
+    pagination = ConversationPagination()
+    queryset = (
+        ConversationListView()
+        .get_queryset()
+        .order_by(*pagination.ordering)
+        .filter(pagination.after([timezone.now(), conversations[0].id]))
+    )
+    plan = explain(queryset)
+    assert "Index Scan Backward using conversation_activity_idx" in plan
+    assert not has_full_sort(plan)
+
+
+def test_inbox_uses_membership_index_backward(conversations):
+    pagination = InboxPagination()
+    view = ParticipantInboxView(
+        request=Request(APIRequestFactory().get("/", {"phone": "+15550000000"}))
+    )
+    queryset = (
+        view.get_queryset()
+        .order_by(*pagination.ordering)
+        .filter(pagination.after([timezone.now(), conversations[0].id]))
+    )
+    plan = explain(queryset)
+    assert "Index Scan Backward using membership_inbox_idx" in plan
+    assert not has_full_sort(plan)
@@ -0,0 +1,148 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import fakeredis
+import pytest
+import redis
+from django.utils import timezone
+
+from messaging.models import Conversation, Message, Participant
+from messaging.ratelimit import RateLimiter
+from messaging.tasks import send_message
+
+
+@pytest.fixture
+def fake_redis():
+    client = fakeredis.FakeRedis()
+    with patch("messaging.ratelimit.get_redis", return_value=client):
+        yield client
+
+
+@pytest.fixture
+def limits(settings):
+    settings.MESSAGING_TEXT_RATE_LIMIT = 10
+    settings.MESSAGING_TEXT_RATE_BURST = 1
+    settings.MESSAGING_EMAIL_RATE_LIMIT = None
+    settings.MESSAGING_SENDER_RATE_LIMIT = None
+    settings.MESSAGING_RATE_LIMIT_MAX_DELAY = 60
+    return settings
+
+
+def text(sender="+15550000000"):
+    return SimpleNamespace(message_type="sms", sender=SimpleNamespace(phone=sender))
+
+
+def email(sender="a@example.com"):
+    return SimpleNamespace(message_type="email", sender=SimpleNamespace(email=sender))
+
+
+def delays(results):
+    return [round(delay, 2) for delay, _ in results]
+
+
+def test_sends_are_paced_at_the_rate(fake_redis, limits):
+    results = RateLimiter().reserve_many([text() for _ in range(5)])
+
+    assert all(reserved for _, reserved in results)
+    assert delays(results) == [0, 0.1, 0.2, 0.3, 0.4]
+
+
+def test_burst(fake_redis, limits):
+    limits.MESSAGING_TEXT_RATE_BURST = 3
+
+    results = RateLimiter().reserve_many([text() for _ in range(5)])
+
+    assert delays(results) == [0, 0, 0, 0.1, 0.2]
+
+
+def test_reservations_are_shared(fake_redis, limits):
+    RateLimiter().reserve_many([text() for _ in range(3)])
+
+    # Another worker gets the next slot
+    assert round(RateLimiter().reserve(text())[0], 2) == 0.3
+
+
+def test_providers_are_limited_separately(fake_redis, limits):
+    limits.MESSAGING_EMAIL_RATE_LIMIT = 1
+
+    results = RateLimiter().reserve_many([text(), email(), text(), email()])
+
+    assert delays(results) == [0, 0, 0.1, 1]
+
+
+def test_unlimited_provider_does_not_use_redis(limits):
+    with patch("messaging.ratelimit.get_redis") as mock_get_redis:
+        assert RateLimiter().reserve(email()) == (0.0, True)
+    assert not mock_get_redis.called
+
+
+def test_sender_limit(fake_redis, limits):
+    limits.MESSAGING_SENDER_RATE_LIMIT = 1
+
+    results = RateLimiter().reserve_many([text("+1"), text("+2"), text("+1")])
+
+    # The provider allows 10 per second, each sender only 1
+    assert delays(results) == [0, 0.1, 1]
+
+
+def test_slots_are_reserved_up_to_max_delay(fake_redis, limits):
+    limits.MESSAGING_TEXT_RATE_LIMIT = 1
+    limits.MESSAGING_RATE_LIMIT_MAX_DELAY = 2
+
+    results = RateLimiter().reserve_many([text() for _ in range(5)])
+
+    assert [reserved for _, reserved in results] == [True, True, True, False, False]
+    # Not reserved: asked again once the slot could be within max_delay
+    assert delays(results) == [0, 1, 2, 1, 1]
+
+
+def test_redis_unavailable_does_not_limit(limits):
+    client = MagicMock()
+    client.pipeline.return_value.execute.side_effect = redis.ConnectionError()
+    with patch("messaging.ratelimit.get_redis", return_value=client):
+        assert RateLimiter().reserve(text()) == (0.0, True)
+
+
+@pytest.fixture
+def message(db):
+    sender = Participant.objects.create(phone="+15550000000")
+    recipient = Participant.objects.create(phone="+15550000001")
+    return Message.objects.create(
+        conversation=Conversation.objects.create(
+            participant_1=sender, participant_2=recipient
+        ),
+        sender=sender,
+        recipient=recipient,
+        message_type="sms",
+        direction="outbound",
+        body="Hello",
+        status="QUEUED",
+        timestamp=timezone.now(),
+    )
+
+
+@pytest.mark.django_db
+@patch("messaging.tasks.TextProvider")
+def test_send_message_deferred_to_its_slot(mock_text_provider, message):
+    with patch("messaging.tasks.rate_limiter.reserve", return_value=(0.5, True)):
+        with patch.object(send_message, "apply_async") as mock_apply_async:
+            send_message.apply(args=[str(message.id)])
+
+    mock_apply_async.assert_called_once_with(
+        (str(message.id),), {"reserved": True}, countdown=0.5, retries=0
+    )
+    assert not mock_text_provider.return_value.send_message.called
+    message.refresh_from_db()
+    assert message.status == "QUEUED"
+
+
+@pytest.mark.django_db
+@patch("messaging.tasks.TextProvider")
+def test_send_message_with_reserved_slot(mock_text_provider, message):
+    with patch("messaging.tasks.rate_limiter.reserve") as mock_reserve:
+        send_message.apply(args=[str(message.id)], kwargs={"reserved": True})
+
+    assert not mock_reserve.called
+    mock_text_provider.return_value.send_message.assert_called_once()
+    message.refresh_from_db()
+    assert message.status == "SENT"
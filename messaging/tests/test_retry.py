@@ -0,0 +1,39 @@
+import httpx
+import pytest
+from messaging.providers.base import PermanentProviderError, RetryableProviderError
+from messaging.retry import RetryPolicy
+
+
+@pytest.fixture
+def policy():
+    return RetryPolicy(max_retries=3, base_delay=2, max_delay=10)
+
+
+def test_is_retryable(policy):
+    assert policy.is_retryable(RetryableProviderError("503"))
+    assert policy.is_retryable(httpx.ConnectTimeout("timeout"))
+    assert not policy.is_retryable(PermanentProviderError("400"))
+    assert not policy.is_retryable(ValueError("Unsupported message type"))
+
+
+def test_should_retry_stops_after_max_retries(policy):
+    exc = RetryableProviderError("503")
+    assert policy.should_retry(exc, 2)
+    assert not policy.should_retry(exc, 3)
+
+
+def test_countdown_is_jittered_exponential_backoff(policy):
+    for retries, delay in [(0, 2), (1, 4), (2, 8), (5, 10)]:
+        countdowns = {policy.countdown(retries) for _ in range(20)}
+        assert all(delay / 2 <= countdown <= delay for countdown in countdowns)
+        assert len(countdowns) > 1
+
+
+def test_countdown_respects_retry_after(policy):
+    exc = RetryableProviderError("429", status_code=429, retry_after=120)
+    assert policy.countdown(0, exc) == 120
+
+
+def test_defaults_come_from_settings(settings):
+    settings.MESSAGING_RETRY_MAX_RETRIES = 7
+    assert RetryPolicy().max_retries == 7
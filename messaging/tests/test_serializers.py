@@ -7,6 +7,7 @@ from messaging.serializers import (
     MessageSerializer,
     ConversationSerializer,
     MessageCreateSerializer,
+    MessageBulkCreateSerializer,
 )
 
 
@@ -38,9 +39,17 @@ class TestConversationSerializer:
     def test_fields_and_readonly(self):
         serializer = ConversationSerializer()
         fields = set(serializer.fields.keys())
-        expected_fields = {"id", "participant_1", "participant_2", "last_activity"}
+        summary_fields = {
+            "last_activity",
+            "last_message_id",
+            "last_message_preview",
+            "last_message_direction",
+            "last_message_timestamp",
+            "message_count",
+        }
+        expected_fields = {"id", "participant_1", "participant_2"} | summary_fields
         assert fields == expected_fields
-        assert set(serializer.Meta.read_only_fields) == {"id", "last_activity"}
+        assert set(serializer.Meta.read_only_fields) == {"id"} | summary_fields
 
 
 @pytest.mark.django_db
@@ -48,8 +57,13 @@ class TestMessageCreateSerializer:
     @patch("messaging.serializers.resolve_participant")
     @patch("messaging.serializers.resolve_conversation")
     @patch("messaging.serializers.Message")
+    @patch("messaging.serializers.summaries")
     def test_create_sms_message(
-        self, mock_message, mock_resolve_conversation, mock_resolve_participant
+        self,
+        mock_summaries,
+        mock_message,
+        mock_resolve_conversation,
+        mock_resolve_participant,
     ):
         sender_contact = MagicMock()
         recipient_contact = MagicMock()
@@ -76,13 +90,19 @@ class TestMessageCreateSerializer:
             sender_contact, recipient_contact
         )
         mock_message.objects.create.assert_called_once()
+        mock_summaries.add_messages.assert_called_once_with([mock_obj])
         assert message == mock_obj
 
     @patch("messaging.serializers.resolve_participant")
     @patch("messaging.serializers.resolve_conversation")
     @patch("messaging.serializers.Message")
+    @patch("messaging.serializers.summaries")
     def test_create_email_message(
-        self, mock_message, mock_resolve_conversation, mock_resolve_participant
+        self,
+        mock_summaries,
+        mock_message,
+        mock_resolve_conversation,
+        mock_resolve_participant,
     ):
         sender_contact = MagicMock()
         recipient_contact = MagicMock()
@@ -108,6 +128,7 @@ class TestMessageCreateSerializer:
             sender_contact, recipient_contact
         )
         mock_message.objects.create.assert_called_once()
+        mock_summaries.add_messages.assert_called_once_with([mock_obj])
         assert message == mock_obj
 
     def test_invalid_message_type(self):
@@ -126,3 +147,110 @@ class TestMessageCreateSerializer:
         assert not serializer.is_valid()
         for field in ["sender", "recipient", "message_type", "body"]:
             assert field in serializer.errors
+
+
+@pytest.mark.django_db
+class TestMessageBulkCreateSerializer:
+    def test_fan_out_to_recipients(self):
+        serializer = MessageBulkCreateSerializer(
+            data={
+                "sender": "+10000000000",
+                "recipients": ["+10000000001", "+10000000002", "+10000000003"],
+                "message_type": "sms",
+                "body": "Hello!",
+            }
+        )
+        assert serializer.is_valid(), serializer.errors
+        messages = serializer.save()
+        assert len(messages) == 3
+        assert len({message.batch_id for message in messages}) == 1
+        assert {message.recipient.phone for message in messages} == {
+            "+10000000001",
+            "+10000000002",
+            "+10000000003",
+        }
+        assert len({message.sender_id for message in messages}) == 1
+        assert len({message.conversation_id for message in messages}) == 3
+        assert (
+            Message.objects.filter(
+                batch_id=messages[0].batch_id, status="QUEUED", direction="outbound"
+            ).count()
+            == 3
+        )
+
+    def test_list_of_messages(self):
+        serializer = MessageBulkCreateSerializer(
+            data={
+                "messages": [
+                    {
+                        "sender": "a@example.com",
+                        "recipient": "b@example.com",
+                        "message_type": "email",
+                        "body": "Hi B",
+                    },
+                    {
+                        "sender": "+10000000000",
+                        "recipient": "+10000000001",
+                        "message_type": "mms",
+                        "body": "Hi",
+                        "attachments": [{"url": "https://example.com/a.png"}],
+                    },
+                ]
+            }
+        )
+        assert serializer.is_valid(), serializer.errors
+        email, mms = serializer.save()
+        assert email.sender.email == "a@example.com"
+        assert mms.recipient.phone == "+10000000001"
+        assert mms.attachments == [{"url": "https://example.com/a.png"}]
+
+    def test_constant_number_of_queries(self, django_assert_num_queries):
+        data = {
+            "sender": "+10000000000",
+            "recipients": [f"+1{i:010d}" for i in range(1, 101)],
+            "message_type": "sms",
+            "body": "Hello!",
+        }
+        serializer = MessageBulkCreateSerializer(data=data)
+        assert serializer.is_valid(), serializer.errors
+        # Participants, conversations, memberships, messages and locks and
+        # updates of the conversation summaries, whatever the batch size, in
+        # the savepoint of the chunk
+        with django_assert_num_queries(8):
+            serializer.save()
+
+    def test_rejects_mixed_formats(self):
+        serializer = MessageBulkCreateSerializer(
+            data={
+                "sender": "+10000000000",
+                "messages": [
+                    {
+                        "sender": "+10000000000",
+                        "recipient": "+10000000001",
+                        "message_type": "sms",
+                        "body": "Hi",
+                    }
+                ],
+            }
+        )
+        assert not serializer.is_valid()
+
+    def test_missing_fan_out_fields(self):
+        serializer = MessageBulkCreateSerializer(
+            data={"sender": "+10000000000", "body": "Hi"}
+        )
+        assert not serializer.is_valid()
+        assert "recipients" in serializer.errors
+        assert "message_type" in serializer.errors
+
+    def test_too_many_messages(self, settings):
+        settings.MESSAGING_BULK_SEND_MAX_SIZE = 1
+        serializer = MessageBulkCreateSerializer(
+            data={
+                "sender": "+10000000000",
+                "recipients": ["+10000000001", "+10000000002"],
+                "message_type": "sms",
+                "body": "Hi",
+            }
+        )
+        assert not serializer.is_valid()
@@ -0,0 +1,182 @@
+import importlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import pytest
+from django.db import connection
+from rest_framework.test import APIRequestFactory
+
+from messaging import summaries
+from messaging.archive import archive_messages, restore_messages
+from messaging.models import Conversation, Message, Participant
+from messaging.serializers import MessageCreateSerializer
+from messaging.utils import resolve_conversation
+from messaging.views import MessageDeleteView
+
+NOW = datetime(2026, 10, 18, 12, 0, tzinfo=dt_timezone.utc)
+
+
+@pytest.fixture
+def conversation(participant_1, participant_2):
+    return resolve_conversation(participant_1, participant_2)
+
+
+def build_message(conversation, timestamp, body="Hello", direction="outbound"):
+    return Message(
+        conversation=conversation,
+        sender=conversation.participant_1,
+        recipient=conversation.participant_2,
+        message_type="sms",
+        direction=direction,
+        body=body,
+        status="SENT",
+        timestamp=timestamp,
+    )
+
+
+def store(*messages):
+    Message.objects.bulk_create(messages)
+    summaries.add_messages(messages)
+    return messages
+
+
+@pytest.mark.django_db
+def test_add_messages(conversation):
+    first, last = store(
+        build_message(conversation, NOW, "Last", direction="inbound"),
+        build_message(conversation, NOW - timedelta(hours=1), "First"),
+    )
+
+    conversation.refresh_from_db()
+    assert conversation.message_count == 2
+    assert conversation.last_message_id == first.id
+    assert conversation.last_message_preview == "Last"
+    assert conversation.last_message_direction == "inbound"
+    assert conversation.last_message_timestamp == NOW
+    assert conversation.last_activity == NOW
+
+
+@pytest.mark.django_db
+def test_add_older_message_keeps_last_message(conversation):
+    (last,) = store(build_message(conversation, NOW))
+    store(build_message(conversation, NOW - timedelta(days=1), "Late delivery"))
+
+    conversation.refresh_from_db()
+    assert conversation.message_count == 2
+    assert conversation.last_message_id == last.id
+    assert conversation.last_activity == NOW
+
+
+@pytest.mark.django_db
+def test_preview_is_truncated(conversation):
+    store(build_message(conversation, NOW, "x" * 500))
+
+    conversation.refresh_from_db()
+    assert conversation.last_message_preview == "x" * summaries.PREVIEW_LENGTH
+
+
+@pytest.mark.django_db
+def test_add_messages_of_many_conversations(conversation, participant_1):
+    other = resolve_conversation(
+        participant_1, Participant.objects.create(phone="+15550000000")
+    )
+    store(
+        build_message(conversation, NOW),
+        build_message(other, NOW),
+        build_message(other, NOW + timedelta(seconds=1)),
+    )
+
+    counts = dict(Conversation.objects.values_list("id", "message_count"))
+    assert counts == {conversation.id: 1, other.id: 2}
+
+
+@pytest.mark.django_db
+def test_remove_messages(conversation):
+    first, last = store(
+        build_message(conversation, NOW - timedelta(hours=1), "First"),
+        build_message(conversation, NOW, "Last"),
+    )
+
+    Message.objects.filter(id=last.id).delete()
+    summaries.remove_messages([(conversation.id, last.id)])
+    conversation.refresh_from_db()
+    assert conversation.message_count == 1
+    assert conversation.last_message_id == first.id
+    assert conversation.last_message_preview == "First"
+
+    Message.objects.filter(id=first.id).delete()
+    summaries.remove_messages([(conversation.id, first.id)])
+    conversation.refresh_from_db()
+    assert conversation.message_count == 0
+    assert conversation.last_message_id is None
+    assert conversation.last_message_timestamp is None
+
+
+@pytest.mark.django_db
+def test_create_message_updates_summary(participant_1, participant_2):
+    serializer = MessageCreateSerializer(
+        data={
+            "sender": participant_1.phone,
+            "recipient": participant_2.phone,
+            "message_type": "sms",
+            "body": "Hi there",
+        }
+    )
+    assert serializer.is_valid(), serializer.errors
+    message = serializer.save()
+
+    conversation = Conversation.objects.get(id=message.conversation_id)
+    assert conversation.message_count == 1
+    assert conversation.last_message_id == message.id
+    assert conversation.last_message_preview == "Hi there"
+
+
+@pytest.mark.django_db
+def test_delete_view_updates_summary(conversation):
+    (message,) = store(build_message(conversation, NOW))
+
+    response = MessageDeleteView.as_view()(
+        APIRequestFactory().delete("/"), id=message.id
+    )
+
+    assert response.status_code == 204
+    conversation.refresh_from_db()
+    assert conversation.message_count == 0
+    assert conversation.last_message_id is None
+
+
+@pytest.mark.django_db
+def test_archive_and_restore_update_summaries(conversation, tmp_path):
+    old, recent = store(
+        build_message(conversation, NOW - timedelta(days=400)),
+        build_message(conversation, NOW),
+    )
+
+    path = archive_messages(NOW - timedelta(days=365), tmp_path)["path"]
+    conversation.refresh_from_db()
+    assert conversation.message_count == 1
+    assert conversation.last_message_id == recent.id
+
+    restore_messages(path)
+    conversation.refresh_from_db()
+    assert conversation.message_count == 2
+    assert conversation.last_message_id == recent.id
+
+
+@pytest.mark.django_db
+def test_migration_backfills_summaries(conversation):
+    first, last = (
+        build_message(conversation, NOW - timedelta(hours=1)),
+        build_message(conversation, NOW, "Last"),
+    )
+    Message.objects.bulk_create([first, last])
+    migration = importlib.import_module(
+        "messaging.migrations.0010_backfill_conversations"
+    )
+
+    migration.backfill(connection, migration.SUMMARIES_SQL, batch_size=1)
+
+    conversation.refresh_from_db()
+    assert conversation.message_count == 2
+    assert conversation.last_message_id == last.id
+    assert conversation.last_message_preview == "Last"
+    assert conversation.last_activity == NOW
@@ -1,6 +1,8 @@
 import pytest
-from unittest.mock import patch, MagicMock
-from messaging.tasks import send_message
+from unittest.mock import call, patch, MagicMock
+from celery.exceptions import Retry
+from messaging.providers.base import PermanentProviderError, RetryableProviderError
+from messaging.tasks import enqueue_messages, send_message, send_message_batch
 
 
 @pytest.fixture
@@ -31,7 +33,9 @@ def test_send_message_email_success(
     mock_message.message_type = "email"
     mock_message.recipient.email = "to@example.com"
     mock_message.sender.email = "from@example.com"
-    mock_message_model.objects.get.return_value = mock_message
+    mock_message_model.objects.select_related.return_value.get.return_value = (
+        mock_message
+    )
     provider_instance = MagicMock()
     mock_email_provider.return_value = provider_instance
 
@@ -39,13 +43,15 @@ def test_send_message_email_success(
     send_message(mock_message.id)
 
     # Assert
-    mock_message_model.objects.get.assert_called_once_with(id=mock_message.id)
+    mock_message_model.objects.select_related.return_value.get.assert_called_once_with(
+        id=mock_message.id
+    )
     mock_email_provider.assert_called_once_with(
         to="to@example.com", _from="from@example.com", body="Hello", attachments=[]
     )
     provider_instance.send_message.assert_called_once()
     assert mock_message.status == "SENT"
-    assert mock_message.save.call_count == 2  # Once before send, once after
+    assert mock_message.save.call_count == 1  # SENDING is set by the claim
 
 
 @patch("messaging.tasks.Message")
@@ -57,7 +63,9 @@ def test_send_message_sms_success(
     mock_message.message_type = "sms"
     mock_message.recipient.phone = "+11234567890"
     mock_message.sender.phone = "+18765432100"
-    mock_message_model.objects.get.return_value = mock_message
+    mock_message_model.objects.select_related.return_value.get.return_value = (
+        mock_message
+    )
     provider_instance = MagicMock()
     mock_text_provider.return_value = provider_instance
 
@@ -65,7 +73,9 @@ def test_send_message_sms_success(
     send_message(mock_message.id)
 
     # Assert
-    mock_message_model.objects.get.assert_called_once_with(id=mock_message.id)
+    mock_message_model.objects.select_related.return_value.get.assert_called_once_with(
+        id=mock_message.id
+    )
     mock_text_provider.assert_called_once_with(
         to="+11234567890",
         _from="+18765432100",
@@ -75,21 +85,23 @@ def test_send_message_sms_success(
     )
     provider_instance.send_message.assert_called_once()
     assert mock_message.status == "SENT"
-    assert mock_message.save.call_count == 2
+    assert mock_message.save.call_count == 1
 
 
 @patch("messaging.tasks.Message")
 def test_send_message_unsupported_type(mock_message_model, mock_message, mock_self):
     # Setup
     mock_message.message_type = "fax"
-    mock_message_model.objects.get.return_value = mock_message
+    mock_message_model.objects.select_related.return_value.get.return_value = (
+        mock_message
+    )
 
     # Act & Assert
     with pytest.raises(Exception):  # retry will raise Exception due to side_effect
         send_message(mock_message.id)
     assert mock_message.status == "FAILED"
     assert "Unsupported message type" in mock_message.last_error
-    assert mock_message.save.call_count == 3
+    assert mock_message.save.call_count == 2
 
 
 @patch("messaging.tasks.Message")
@@ -101,7 +113,9 @@ def test_send_message_provider_exception(
     mock_message.message_type = "email"
     mock_message.recipient.email = "to@example.com"
     mock_message.sender.email = "from@example.com"
-    mock_message_model.objects.get.return_value = mock_message
+    mock_message_model.objects.select_related.return_value.get.return_value = (
+        mock_message
+    )
     provider_instance = MagicMock()
     provider_instance.send_message.side_effect = Exception("provider failed")
     mock_email_provider.return_value = provider_instance
@@ -113,7 +127,7 @@ def test_send_message_provider_exception(
     print(vars(mock_message))
     assert mock_message.status == "FAILED"
     assert "provider failed" in mock_message.last_error
-    assert mock_message.save.call_count == 2
+    assert mock_message.save.call_count == 1
 
     @pytest.fixture
     def mock_message():
@@ -142,19 +156,23 @@ def test_send_message_provider_exception(
         mock_email_provider, mock_message_model, mock_message
     ):
         mock_message.message_type = "email"
-        mock_message_model.objects.get.return_value = mock_message
+        mock_message_model.objects.select_related.return_value.get.return_value = (
+            mock_message
+        )
         provider_instance = MagicMock()
         mock_email_provider.return_value = provider_instance
 
         send_message(mock_message.id)
 
-        mock_message_model.objects.get.assert_called_once_with(id=mock_message.id)
+        mock_message_model.objects.select_related.return_value.get.assert_called_once_with(
+            id=mock_message.id
+        )
         mock_email_provider.assert_called_once_with(
             to="to@example.com", _from="from@example.com", body="Hello", attachments=[]
         )
         provider_instance.send_message.assert_called_once()
         assert mock_message.status == "SENT"
-        assert mock_message.save.call_count == 2
+        assert mock_message.save.call_count == 1
 
     @patch("messaging.tasks.Message")
     @patch("messaging.tasks.TextProvider")
@@ -164,13 +182,17 @@ def test_send_message_provider_exception(
         mock_message.message_type = "sms"
         mock_message.recipient.phone = "+123456789"
         mock_message.sender.phone = "+987654321"
-        mock_message_model.objects.get.return_value = mock_message
+        mock_message_model.objects.select_related.return_value.get.return_value = (
+            mock_message
+        )
         provider_instance = MagicMock()
         mock_text_provider.return_value = provider_instance
 
         send_message(mock_message.id)
 
-        mock_message_model.objects.get.assert_called_once_with(id=mock_message.id)
+        mock_message_model.objects.select_related.return_value.get.assert_called_once_with(
+            id=mock_message.id
+        )
         mock_text_provider.assert_called_once_with(
             to="+123456789",
             _from="+987654321",
@@ -180,7 +202,7 @@ def test_send_message_provider_exception(
         )
         provider_instance.send_message.assert_called_once()
         assert mock_message.status == "SENT"
-        assert mock_message.save.call_count == 2
+        assert mock_message.save.call_count == 1
 
     @patch("messaging.tasks.Message")
     @patch("messaging.tasks.TextProvider")
@@ -191,13 +213,17 @@ def test_send_message_provider_exception(
         mock_message.recipient.phone = "+123456789"
         mock_message.sender.phone = "+987654321"
         mock_message.attachments = ["file1.jpg"]
-        mock_message_model.objects.get.return_value = mock_message
+        mock_message_model.objects.select_related.return_value.get.return_value = (
+            mock_message
+        )
         provider_instance = MagicMock()
         mock_text_provider.return_value = provider_instance
 
         send_message(mock_message.id)
 
-        mock_message_model.objects.get.assert_called_once_with(id=mock_message.id)
+        mock_message_model.objects.select_related.return_value.get.assert_called_once_with(
+            id=mock_message.id
+        )
         mock_text_provider.assert_called_once_with(
             to="+123456789",
             _from="+987654321",
@@ -207,18 +233,20 @@ def test_send_message_provider_exception(
         )
         provider_instance.send_message.assert_called_once()
         assert mock_message.status == "SENT"
-        assert mock_message.save.call_count == 2
+        assert mock_message.save.call_count == 1
 
     @patch("messaging.tasks.Message")
     def test_send_message_unsupported_type(mock_message_model, mock_message):
         mock_message.message_type = "fax"
-        mock_message_model.objects.get.return_value = mock_message
+        mock_message_model.objects.select_related.return_value.get.return_value = (
+            mock_message
+        )
 
         with pytest.raises(Exception):
             send_message(mock_message.id)
         assert mock_message.status == "FAILED"
         assert "Unsupported message type" in mock_message.last_error
-        assert mock_message.save.call_count == 3
+        assert mock_message.save.call_count == 2
 
     @patch("messaging.tasks.Message")
     @patch("messaging.tasks.EmailProvider")
@@ -228,7 +256,9 @@ def test_send_message_provider_exception(
         mock_message.message_type = "email"
         mock_message.recipient.email = "to@example.com"
         mock_message.sender.email = "from@example.com"
-        mock_message_model.objects.get.return_value = mock_message
+        mock_message_model.objects.select_related.return_value.get.return_value = (
+            mock_message
+        )
         provider_instance = MagicMock()
         provider_instance.send_message.side_effect = Exception("provider failed")
         mock_email_provider.return_value = provider_instance
@@ -237,7 +267,7 @@ def test_send_message_provider_exception(
             send_message(mock_message.id)
         assert mock_message.status == "FAILED"
         assert "provider failed" in mock_message.last_error
-        assert mock_message.save.call_count == 2
+        assert mock_message.save.call_count == 1
 
         @pytest.fixture
         def mock_message():
@@ -266,13 +296,17 @@ def test_send_message_provider_exception(
             mock_email_provider, mock_message_model, mock_message
         ):
             mock_message.message_type = "email"
-            mock_message_model.objects.get.return_value = mock_message
+            mock_message_model.objects.select_related.return_value.get.return_value = (
+                mock_message
+            )
             provider_instance = MagicMock()
             mock_email_provider.return_value = provider_instance
 
             send_message(mock_message.id)
 
-            mock_message_model.objects.get.assert_called_once_with(id=mock_message.id)
+            mock_message_model.objects.select_related.return_value.get.assert_called_once_with(
+                id=mock_message.id
+            )
             mock_email_provider.assert_called_once_with(
                 to="to@example.com",
                 _from="from@example.com",
@@ -281,7 +315,7 @@ def test_send_message_provider_exception(
             )
             provider_instance.send_message.assert_called_once()
             assert mock_message.status == "SENT"
-            assert mock_message.save.call_count == 2
+            assert mock_message.save.call_count == 1
 
         @patch("messaging.tasks.Message")
         @patch("messaging.tasks.TextProvider")
@@ -291,13 +325,17 @@ def test_send_message_provider_exception(
             mock_message.message_type = "sms"
             mock_message.recipient.phone = "+123456789"
             mock_message.sender.phone = "+987654321"
-            mock_message_model.objects.get.return_value = mock_message
+            mock_message_model.objects.select_related.return_value.get.return_value = (
+                mock_message
+            )
             provider_instance = MagicMock()
             mock_text_provider.return_value = provider_instance
 
             send_message(mock_message.id)
 
-            mock_message_model.objects.get.assert_called_once_with(id=mock_message.id)
+            mock_message_model.objects.select_related.return_value.get.assert_called_once_with(
+                id=mock_message.id
+            )
             mock_text_provider.assert_called_once_with(
                 to="+123456789",
                 _from="+987654321",
@@ -307,7 +345,7 @@ def test_send_message_provider_exception(
             )
             provider_instance.send_message.assert_called_once()
             assert mock_message.status == "SENT"
-            assert mock_message.save.call_count == 2
+            assert mock_message.save.call_count == 1
 
         @patch("messaging.tasks.Message")
         @patch("messaging.tasks.TextProvider")
@@ -318,13 +356,17 @@ def test_send_message_provider_exception(
             mock_message.recipient.phone = "+123456789"
             mock_message.sender.phone = "+987654321"
             mock_message.attachments = ["file1.jpg"]
-            mock_message_model.objects.get.return_value = mock_message
+            mock_message_model.objects.select_related.return_value.get.return_value = (
+                mock_message
+            )
             provider_instance = MagicMock()
             mock_text_provider.return_value = provider_instance
 
             send_message(mock_message.id)
 
-            mock_message_model.objects.get.assert_called_once_with(id=mock_message.id)
+            mock_message_model.objects.select_related.return_value.get.assert_called_once_with(
+                id=mock_message.id
+            )
             mock_text_provider.assert_called_once_with(
                 to="+123456789",
                 _from="+987654321",
@@ -334,18 +376,20 @@ def test_send_message_provider_exception(
             )
             provider_instance.send_message.assert_called_once()
             assert mock_message.status == "SENT"
-            assert mock_message.save.call_count == 2
+            assert mock_message.save.call_count == 1
 
         @patch("messaging.tasks.Message")
         def test_send_message_unsupported_type(mock_message_model, mock_message):
             mock_message.message_type = "fax"
-            mock_message_model.objects.get.return_value = mock_message
+            mock_message_model.objects.select_related.return_value.get.return_value = (
+                mock_message
+            )
 
             with pytest.raises(Exception):
                 send_message(mock_message.id)
             assert mock_message.status == "FAILED"
             assert "Unsupported message type" in mock_message.last_error
-            assert mock_message.save.call_count == 3
+            assert mock_message.save.call_count == 2
 
         @patch("messaging.tasks.Message")
         @patch("messaging.tasks.EmailProvider")
@@ -355,7 +399,9 @@ def test_send_message_provider_exception(
             mock_message.message_type = "email"
             mock_message.recipient.email = "to@example.com"
             mock_message.sender.email = "from@example.com"
-            mock_message_model.objects.get.return_value = mock_message
+            mock_message_model.objects.select_related.return_value.get.return_value = (
+                mock_message
+            )
             provider_instance = MagicMock()
             provider_instance.send_message.side_effect = Exception("provider failed")
             mock_email_provider.return_value = provider_instance
@@ -364,4 +410,131 @@ def test_send_message_provider_exception(
                 send_message(mock_message.id)
             assert mock_message.status == "FAILED"
             assert "provider failed" in mock_message.last_error
-            assert mock_message.save.call_count == 2
+            assert mock_message.save.call_count == 1
+
+
+@patch("messaging.tasks.Message")
+@patch("messaging.tasks.EmailProvider")
+def test_send_message_retryable_error_is_rescheduled(
+    mock_email_provider, mock_message_model, mock_message
+):
+    mock_message.message_type = "email"
+    mock_message_model.objects.select_related.return_value.get.return_value = (
+        mock_message
+    )
+    mock_email_provider.return_value.send_message.side_effect = RetryableProviderError(
+        "503 error", status_code=503, retry_after=30
+    )
+
+    with patch.object(send_message, "retry", side_effect=Retry()) as mock_retry:
+        with pytest.raises(Retry):
+            send_message(mock_message.id)
+    assert mock_message.status == "RETRYING"
+    assert mock_retry.call_args.kwargs["countdown"] == 30
+
+
+@patch("messaging.tasks.Message")
+@patch("messaging.tasks.EmailProvider")
+def test_send_message_permanent_error_is_not_retried(
+    mock_email_provider, mock_message_model, mock_message
+):
+    mock_message.message_type = "email"
+    mock_message_model.objects.select_related.return_value.get.return_value = (
+        mock_message
+    )
+    mock_email_provider.return_value.send_message.side_effect = PermanentProviderError(
+        "400 error", status_code=400
+    )
+
+    with patch.object(send_message, "retry") as mock_retry:
+        with pytest.raises(PermanentProviderError):
+            send_message(mock_message.id)
+    assert mock_message.status == "FAILED"
+    assert not mock_retry.called
+
+
+@patch("messaging.tasks.send_message_batch.apply_async")
+@patch("messaging.tasks.get_engine")
+def test_send_message_batch_uses_engine(mock_get_engine, mock_apply_async):
+    mock_get_engine.return_value.deliver.return_value = {
+        "sent": 2,
+        "failed": 0,
+        "retry": [],
+        "countdown": None,
+        "deferred": [],
+        "deferred_countdown": None,
+        "reserved": [],
+    }
+    assert send_message_batch(["1", "2"]) == {
+        "sent": 2,
+        "failed": 0,
+        "retrying": 0,
+        "deferred": 0,
+    }
+    mock_get_engine.return_value.deliver.assert_called_once_with(["1", "2"], 0)
+    assert not mock_apply_async.called
+
+
+@patch("messaging.tasks.send_message_batch.apply_async")
+@patch("messaging.tasks.get_engine")
+def test_send_message_batch_reschedules_retries(mock_get_engine, mock_apply_async):
+    mock_get_engine.return_value.deliver.return_value = {
+        "sent": 1,
+        "failed": 0,
+        "retry": ["2"],
+        "countdown": 12,
+        "deferred": [],
+        "deferred_countdown": None,
+        "reserved": [],
+    }
+    assert send_message_batch(["1", "2"], 1)["retrying"] == 1
+    mock_apply_async.assert_called_once_with((["2"], 2), countdown=12)
+
+
+@patch("messaging.tasks.send_message.apply_async")
+@patch("messaging.tasks.get_engine")
+def test_send_message_batch_sends_reserved_slots_later(
+    mock_get_engine, mock_apply_async
+):
+    mock_get_engine.return_value.deliver.return_value = {
+        "sent": 1,
+        "failed": 0,
+        "retry": [],
+        "countdown": None,
+        "deferred": [],
+        "deferred_countdown": None,
+        "reserved": [("2", 5.0), ("3", 6.0)],
+    }
+    assert send_message_batch(["1", "2", "3"], 1)["deferred"] == 2
+    assert mock_apply_async.call_args_list == [
+        call(("2",), {"reserved": True}, countdown=5.0, retries=1),
+        call(("3",), {"reserved": True}, countdown=6.0, retries=1),
+    ]
+
+
+def test_enqueue_messages_chunks_batches(settings):
+    settings.MESSAGING_DELIVERY_BATCH_SIZE = 2
+    with patch("messaging.tasks.group") as mock_group:
+        enqueue_messages([1, 2, 3, 4, 5])
+    signatures = list(mock_group.call_args.args[0])
+    assert [signature.args for signature in signatures] == [
+        (["1", "2"],),
+        (["3", "4"],),
+        (["5"],),
+    ]
+    mock_group.return_value.apply_async.assert_called_once_with()
+
+
+@patch("messaging.tasks.Message")
+@patch("messaging.tasks.EmailProvider")
+def test_send_message_skips_claimed_message(
+    mock_email_provider, mock_message_model, mock_message
+):
+    # Already sent, or being sent by a dispatcher
+    mock_message_model.objects.filter.return_value.update.return_value = 0
+    send_message(mock_message.id)
+    mock_message_model.objects.filter.assert_called_once_with(
+        id=mock_message.id, status__in=["QUEUED", "RETRYING"]
+    )
+    assert not mock_message_model.objects.select_related.return_value.get.called
+    assert not mock_email_provider.called
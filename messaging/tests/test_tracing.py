@@ -0,0 +1,200 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from celery.contrib.testing.worker import start_worker
+from django.test import Client
+from opentelemetry import trace
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+    InMemorySpanExporter,
+)
+
+from hatch_messaging.celery import app
+from messaging import tracing
+from messaging.models import Message
+
+
+class ProviderHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        body = json.dumps({"id": "provider-1", "status": "queued"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def spans():
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    tracing.instrument(provider)
+    yield exporter
+    tracing.uninstrument()
+
+
+@pytest.fixture
+def client(settings):
+    # Requests go through the whole middleware stack, the default storage of
+    # the messages framework signs cookies with the (unset) SECRET_KEY
+    settings.MESSAGE_STORAGE = "django.contrib.messages.storage.session.SessionStorage"
+    return Client()
+
+
+@pytest.fixture
+def provider_url(settings):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ProviderHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    settings.MESSAGING_TEXT_PROVIDER_URL = (
+        f"http://127.0.0.1:{server.server_port}/api/messages"
+    )
+    yield settings.MESSAGING_TEXT_PROVIDER_URL
+    server.shutdown()
+
+
+@pytest.fixture
+def worker(settings):
+    """
+    A worker thread consuming from an in-memory broker.
+    """
+    settings.CELERY_BROKER_URL = "memory://"
+    with start_worker(app, pool="solo", perform_ping_check=False):
+        yield
+    # Drop the connections to the in-memory broker
+    app.close()
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.05)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_trace_follows_message_to_provider(client, spans, provider_url, worker):
+    response = client.post(
+        "/messaging/messages/create/",
+        {
+            "sender": "+15550000000",
+            "recipient": "+15550000001",
+            "message_type": "sms",
+            "body": "Hello!",
+        },
+        content_type="application/json",
+    )
+    assert response.status_code == 201
+    message = Message.objects.get()
+    wait_for(lambda: Message.objects.get(id=message.id).status == "SENT")
+    wait_for(
+        lambda: any(
+            s.name == "run/messaging.tasks.send_message"
+            for s in spans.get_finished_spans()
+        )
+    )
+
+    (request,) = [
+        span
+        for span in spans.get_finished_spans()
+        if span.name == "POST messaging/messages/create/"
+    ]
+    # One trace from the request to the provider, the queries of the test
+    # start their own traces
+    finished = [
+        span
+        for span in spans.get_finished_spans()
+        if span.context.trace_id == request.context.trace_id
+    ]
+    by_name = {span.name: span for span in finished}
+    publish = by_name["apply_async/messaging.tasks.send_message"]
+    run = by_name["run/messaging.tasks.send_message"]
+    assert request.parent is None
+    assert request.attributes["messaging.message_id"] == str(message.id)
+    assert publish.parent.span_id == request.context.span_id
+    assert run.parent.span_id == publish.context.span_id
+    assert run.attributes["messaging.message_id"] == str(message.id)
+
+    children = [
+        span
+        for span in finished
+        if span.parent and span.parent.span_id == run.context.span_id
+    ]
+    queries = [
+        span for span in children if span.attributes.get("db.system") == "postgresql"
+    ]
+    assert any("UPDATE" in span.attributes["db.statement"] for span in queries)
+    (provider_request,) = [
+        span
+        for span in children
+        if span.kind == trace.SpanKind.CLIENT and "db.system" not in span.attributes
+    ]
+    assert provider_request.name == "POST"
+    assert provider_request.attributes["http.status_code"] == 200
+
+
+@pytest.mark.django_db
+def test_unsampled_requests_record_nothing(client, spans):
+    exporter = InMemorySpanExporter()
+    provider = tracing.build_tracer_provider(exporter, sample_rate=0)
+    tracing.uninstrument()
+    tracing.instrument(provider)
+
+    response = client.get("/messaging/messages/", HTTP_ACCEPT="application/json")
+
+    assert response.status_code == 200
+    provider.force_flush()
+    assert exporter.get_finished_spans() == ()
+
+
+def test_sampling_follows_the_parent():
+    exporter = InMemorySpanExporter()
+    provider = tracing.build_tracer_provider(exporter, sample_rate=0)
+    sampled = trace.SpanContext(
+        trace_id=1,
+        span_id=2,
+        is_remote=True,
+        trace_flags=trace.TraceFlags(trace.TraceFlags.SAMPLED),
+    )
+    parent = trace.set_span_in_context(trace.NonRecordingSpan(sampled))
+
+    with provider.get_tracer(__name__).start_as_current_span("child", context=parent):
+        pass
+    provider.force_flush()
+
+    assert [span.name for span in exporter.get_finished_spans()] == ["child"]
+
+
+def test_file_exporter_appends_json_lines(tmp_path):
+    path = tmp_path / "traces" / "spans.jsonl"
+    provider = tracing.build_tracer_provider(tracing.build_exporter("file", path))
+    tracer = provider.get_tracer(__name__)
+
+    with tracer.start_as_current_span("parent"):
+        with tracer.start_as_current_span("child"):
+            pass
+    provider.shutdown()
+
+    spans = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [span["name"] for span in spans] == ["child", "parent"]
+    assert spans[0]["parent_id"] == spans[1]["context"]["span_id"]
+
+
+def test_unknown_exporter():
+    with pytest.raises(ValueError):
+        tracing.build_exporter("jaeger")
+
+
+def test_disabled_by_default(settings):
+    settings.MESSAGING_TRACING_EXPORTER = ""
+
+    assert tracing.configure_tracing() is None
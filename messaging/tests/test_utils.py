@@ -1,5 +1,19 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
-from messaging.utils import resolve_conversation, resolve_participant
+from django.db import connection
+from django.utils import timezone
+from messaging.models import Conversation, Message, Participant
+from messaging.utils import (
+    _db_slots,
+    ingest_inbound_messages,
+    resolve_conversation,
+    resolve_conversations,
+    resolve_participant,
+    resolve_participants,
+)
 
 
 # test resolve_participant function
@@ -61,3 +75,106 @@ def test_resolve_conversation_symmetry(participant_1, participant_2):
 def test_resolve_conversation_with_self(participant_1):
     conv = resolve_conversation(participant_1, participant_1)
     assert conv is not None
+
+
+# Tests for the batch helpers
+@pytest.mark.django_db
+def test_resolve_participants_creates_missing(participant_1):
+    participants = resolve_participants("phone", ["1234567890", "5555555555"])
+    assert participants["1234567890"] == participant_1
+    assert participants["5555555555"].phone == "5555555555"
+    assert Participant.objects.count() == 2
+
+
+def test_resolve_participants_invalid_field():
+    with pytest.raises(ValueError):
+        resolve_participants("name", ["foo"])
+
+
+@pytest.mark.django_db
+def test_resolve_conversations_matches_resolve_conversation(
+    participant_1, participant_2
+):
+    existing = resolve_conversation(participant_1, participant_2)
+    other = Participant.objects.create(email="other@example.com")
+    conversations = resolve_conversations(
+        [(participant_2.id, participant_1.id), (participant_1.id, other.id)]
+    )
+    assert conversations[tuple(sorted([participant_1.id, participant_2.id]))] == (
+        existing
+    )
+    assert Conversation.objects.count() == 2
+
+
+def _entry(provider_message_id, sender="+11111111111", recipient="+12222222222"):
+    return {
+        "to": recipient,
+        "from": sender,
+        "type": "sms",
+        "body": "Hello!",
+        "provider_message_id": provider_message_id,
+        "attachments": None,
+        "timestamp": timezone.now(),
+    }
+
+
+@pytest.mark.django_db
+def test_ingest_inbound_messages(django_assert_num_queries):
+    ingest_inbound_messages([_entry("msg-1")], "phone")
+    entries = [
+        _entry("msg-1"),
+        _entry("msg-2"),
+        _entry("msg-2"),
+        _entry("msg-3", sender="+13333333333"),
+    ]
+    # Participants, conversations, memberships and messages: one statement
+    # each, then locks and updates of the conversation summaries, in a
+    # savepoint
+    with django_assert_num_queries(8):
+        results = ingest_inbound_messages(entries, "phone")
+    assert results == ["duplicate", "created", "duplicate", "created"]
+    assert Message.objects.count() == 3
+    assert Conversation.objects.count() == 2
+    counts = Conversation.objects.values_list("message_count", flat=True)
+    assert sorted(counts) == [1, 2]
+    message = Message.objects.get(provider_message_id="msg-3")
+    assert message.sender.phone == "+13333333333"
+    assert message.recipient.phone == "+12222222222"
+    assert message.direction == "inbound"
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_ingestion_of_the_same_message():
+    """
+    Concurrent deliveries of the same message create it exactly once, without
+    raising an IntegrityError for the others.
+    """
+    barrier = threading.Barrier(8)
+
+    def ingest(_):
+        barrier.wait()
+        try:
+            return ingest_inbound_messages([_entry("msg-race")], "phone")[0]
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(ingest, range(8)))
+
+    assert sorted(results) == ["created"] + ["duplicate"] * 7
+    assert Message.objects.count() == 1
+    assert Participant.objects.count() == 2
+    assert Conversation.objects.count() == 1
+
+
+def test_async_ingestion_is_bounded_per_event_loop(settings):
+    settings.MESSAGING_ASYNC_DB_CONCURRENCY = 2
+
+    async def slots():
+        return _db_slots(), _db_slots()
+
+    first, again = asyncio.run(slots())
+    assert first is again
+    assert first._value == 2
+    other, _ = asyncio.run(slots())
+    assert other is not first
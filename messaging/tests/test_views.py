@@ -1,10 +1,26 @@
+import uuid
+
+import json
+
 import pytest
+import redis
+from asgiref.sync import async_to_sync
+from django.test import AsyncRequestFactory
+from django.urls import reverse
+from django.utils import timezone
 from unittest.mock import patch, MagicMock
 from rest_framework.test import APIRequestFactory
 from rest_framework import status
+from messaging.models import Conversation, Message
 from messaging.views import TextInboundWebhook
 from messaging.views import EmailInboundWebhook
 from messaging.views import MessageCreateView
+from messaging.views import TextInboundBatchWebhook
+from messaging.views import EmailInboundBatchWebhook
+from messaging.views import MessageBulkCreateView
+from messaging.views import MessageBatchDetailView
+from messaging.views import AsyncTextInboundWebhook
+from messaging.views import AsyncEmailInboundWebhook
 
 
 @pytest.fixture
@@ -25,29 +41,23 @@ def valid_payload():
     }
 
 
-@patch("messaging.views.Message")
-@patch("messaging.views.resolve_participant")
-@patch("messaging.views.resolve_conversation")
-def test_post_success(
-    mock_resolve_conversation,
-    mock_resolve_participant,
-    mock_message,
-    api_factory,
-    valid_payload,
-):
-    mock_message.objects.filter.return_value.exists.return_value = False
-    mock_resolve_participant.side_effect = [MagicMock(), MagicMock()]
-    mock_resolve_conversation.return_value = (MagicMock(), True)
+@patch("messaging.views.ingest_inbound_messages")
+def test_post_success(mock_ingest, api_factory, valid_payload):
+    mock_ingest.return_value = ["created"]
     request = api_factory.post("/", valid_payload, format="json")
     view = TextInboundWebhook.as_view()
     response = view(request)
     assert response.status_code == status.HTTP_201_CREATED
     assert response.data["detail"] == "Message received successfully"
-    assert mock_message.objects.create.called
+    (entry,), field = mock_ingest.call_args.args
+    assert field == "phone"
+    assert entry["to"] == "+1234567890"
+    assert entry["from"] == "+0987654321"
+    assert entry["provider_message_id"] == "msg-123"
 
 
-@patch("messaging.views.Message")
-def test_post_missing_fields(mock_message, api_factory):
+@patch("messaging.views.ingest_inbound_messages")
+def test_post_missing_fields(mock_ingest, api_factory):
     payload = {
         "to": "+1234567890",
         "from": "+1987654321",
@@ -58,14 +68,12 @@ def test_post_missing_fields(mock_message, api_factory):
     response = view(request)
     assert response.status_code == status.HTTP_400_BAD_REQUEST
     assert "error" in response.data
+    assert not mock_ingest.called
 
 
-@patch("messaging.views.Message")
-@patch("messaging.views.resolve_participant")
-def test_post_duplicate_message(
-    mock_resolve_participant, mock_message, api_factory, valid_payload
-):
-    mock_message.objects.filter.return_value.exists.return_value = True
+@patch("messaging.views.ingest_inbound_messages")
+def test_post_duplicate_message(mock_ingest, api_factory, valid_payload):
+    mock_ingest.return_value = ["duplicate"]
     request = api_factory.post("/", valid_payload, format="json")
     view = TextInboundWebhook.as_view()
     response = view(request)
@@ -73,45 +81,29 @@ def test_post_duplicate_message(
     assert response.data["detail"] == "Duplicate message"
 
 
-@patch("messaging.views.Message")
-@patch("messaging.views.resolve_participant")
-def test_post_participant_resolution_error(
-    mock_resolve_participant, mock_message, api_factory, valid_payload
-):
-    mock_message.objects.filter.return_value.exists.return_value = False
-    mock_resolve_participant.side_effect = ValueError("Invalid phone")
+@patch("messaging.views.ingest_inbound_messages")
+def test_post_invalid_timestamp(mock_ingest, api_factory, valid_payload):
+    valid_payload["timestamp"] = "yesterday"
     request = api_factory.post("/", valid_payload, format="json")
     view = TextInboundWebhook.as_view()
     response = view(request)
     assert response.status_code == status.HTTP_400_BAD_REQUEST
-    assert "error" in response.data
+    assert response.data["error"] == "Invalid timestamp"
 
 
-@patch("messaging.views.Message")
-@patch("messaging.views.resolve_participant")
-@patch("messaging.views.resolve_conversation")
-@patch("messaging.views.Participant")
-def test_post_creates_participants_if_not_found(
-    mock_participant,
-    mock_resolve_conversation,
-    mock_resolve_participant,
-    mock_message,
-    api_factory,
-    valid_payload,
-):
-    mock_message.objects.filter.return_value.exists.return_value = False
-    # First call returns None, second call returns None (simulate not found)
-    mock_resolve_participant.side_effect = [None, None]
-    mock_participant.objects.create.side_effect = [
-        ("receiver_obj", True),
-        ("sender_obj", True),
-    ]
-    mock_resolve_conversation.return_value = (MagicMock(), True)
-    request = api_factory.post("/", valid_payload, format="json")
+@pytest.mark.django_db
+def test_post_stores_message(api_factory, valid_payload, django_assert_num_queries):
     view = TextInboundWebhook.as_view()
-    response = view(request)
+    # Participants, conversation, memberships and message: one statement
+    # each, and the update of the conversation summary, in a savepoint
+    with django_assert_num_queries(7):
+        response = view(api_factory.post("/", valid_payload, format="json"))
     assert response.status_code == status.HTTP_201_CREATED
-    assert mock_participant.objects.create.call_count == 2
+    response = view(api_factory.post("/", valid_payload, format="json"))
+    assert response.status_code == status.HTTP_200_OK
+    message = Message.objects.get(provider_message_id="msg-123")
+    assert message.sender.phone == "+0987654321"
+    assert message.recipient.phone == "+1234567890"
 
 
 @pytest.fixture
@@ -126,29 +118,22 @@ def valid_email_payload():
     }
 
 
-@patch("messaging.views.Message")
-@patch("messaging.views.resolve_participant")
-@patch("messaging.views.resolve_conversation")
-def test_email_post_success(
-    mock_resolve_conversation,
-    mock_resolve_participant,
-    mock_message,
-    api_factory,
-    valid_email_payload,
-):
-    mock_message.objects.filter.return_value.exists.return_value = False
-    mock_resolve_participant.side_effect = [MagicMock(), MagicMock()]
-    mock_resolve_conversation.return_value = (MagicMock(), True)
+@patch("messaging.views.ingest_inbound_messages")
+def test_email_post_success(mock_ingest, api_factory, valid_email_payload):
+    mock_ingest.return_value = ["created"]
     request = api_factory.post("/", valid_email_payload, format="json")
     view = EmailInboundWebhook.as_view()
     response = view(request)
     assert response.status_code == status.HTTP_201_CREATED
     assert response.data["detail"] == "Message received successfully"
-    assert mock_message.objects.create.called
+    (entry,), field = mock_ingest.call_args.args
+    assert field == "email"
+    assert entry["type"] == "email"
+    assert entry["provider_message_id"] == "email-123"
 
 
-@patch("messaging.views.Message")
-def test_email_post_missing_fields(mock_message, api_factory):
+@patch("messaging.views.ingest_inbound_messages")
+def test_email_post_missing_fields(mock_ingest, api_factory):
     payload = {
         "to": "receiver@example.com",
         "from": "sender@example.com",
@@ -159,14 +144,12 @@ def test_email_post_missing_fields(mock_message, api_factory):
     response = view(request)
     assert response.status_code == status.HTTP_400_BAD_REQUEST
     assert "error" in response.data
+    assert not mock_ingest.called
 
 
-@patch("messaging.views.Message")
-@patch("messaging.views.resolve_participant")
-def test_email_post_duplicate_message(
-    mock_resolve_participant, mock_message, api_factory, valid_email_payload
-):
-    mock_message.objects.filter.return_value.exists.return_value = True
+@patch("messaging.views.ingest_inbound_messages")
+def test_email_post_duplicate_message(mock_ingest, api_factory, valid_email_payload):
+    mock_ingest.return_value = ["duplicate"]
     request = api_factory.post("/", valid_email_payload, format="json")
     view = EmailInboundWebhook.as_view()
     response = view(request)
@@ -174,46 +157,6 @@ def test_email_post_duplicate_message(
     assert response.data["detail"] == "Duplicate message"
 
 
-@patch("messaging.views.Message")
-@patch("messaging.views.resolve_participant")
-def test_email_post_participant_resolution_error(
-    mock_resolve_participant, mock_message, api_factory, valid_email_payload
-):
-    mock_message.objects.filter.return_value.exists.return_value = False
-    mock_resolve_participant.side_effect = ValueError("Invalid email")
-    request = api_factory.post("/", valid_email_payload, format="json")
-    view = EmailInboundWebhook.as_view()
-    response = view(request)
-    assert response.status_code == status.HTTP_400_BAD_REQUEST
-    assert "error" in response.data
-
-
-@patch("messaging.views.Message")
-@patch("messaging.views.resolve_participant")
-@patch("messaging.views.resolve_conversation")
-@patch("messaging.views.Participant")
-def test_email_post_creates_participants_if_not_found(
-    mock_participant,
-    mock_resolve_conversation,
-    mock_resolve_participant,
-    mock_message,
-    api_factory,
-    valid_email_payload,
-):
-    mock_message.objects.filter.return_value.exists.return_value = False
-    mock_resolve_participant.side_effect = [None, None]
-    mock_participant.objects.create.side_effect = [
-        ("receiver_obj", True),
-        ("sender_obj", True),
-    ]
-    mock_resolve_conversation.return_value = (MagicMock(), True)
-    request = api_factory.post("/", valid_email_payload, format="json")
-    view = EmailInboundWebhook.as_view()
-    response = view(request)
-    assert response.status_code == status.HTTP_201_CREATED
-    assert mock_participant.objects.create.call_count == 2
-
-
 @pytest.fixture
 def valid_message_create_payload():
     return {
@@ -263,3 +206,350 @@ def test_message_create_view_invalid_data(
     view = MessageCreateView.as_view()
     with pytest.raises(Exception):
         view(request)
+
+
+@patch("messaging.views.ingest_inbound_messages")
+def test_text_batch_post_success(mock_ingest, api_factory, valid_payload):
+    duplicate = dict(valid_payload, messaging_provider_id="msg-124")
+    mock_ingest.return_value = ["created", "duplicate"]
+    request = api_factory.post("/", [valid_payload, duplicate], format="json")
+    view = TextInboundBatchWebhook.as_view()
+    response = view(request)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["created"] == 1
+    assert response.data["duplicates"] == 1
+    assert response.data["errors"] == 0
+    assert [r["provider_message_id"] for r in response.data["results"]] == [
+        "msg-123",
+        "msg-124",
+    ]
+    entries, field = mock_ingest.call_args.args
+    assert field == "phone"
+    assert [e["provider_message_id"] for e in entries] == ["msg-123", "msg-124"]
+
+
+@patch("messaging.views.ingest_inbound_messages")
+def test_text_batch_post_reports_invalid_items(mock_ingest, api_factory, valid_payload):
+    invalid = {"to": "+1234567890", "from": "+0987654321"}
+    bad_timestamp = dict(
+        valid_payload, messaging_provider_id="msg-124", timestamp="not-a-date"
+    )
+    mock_ingest.return_value = ["created"]
+    request = api_factory.post(
+        "/", [invalid, valid_payload, bad_timestamp], format="json"
+    )
+    view = TextInboundBatchWebhook.as_view()
+    response = view(request)
+    assert response.status_code == status.HTTP_200_OK
+    results = response.data["results"]
+    assert results[0]["status"] == "error"
+    assert results[0]["error"] == "Missing required fields"
+    assert results[1]["status"] == "created"
+    assert results[2]["error"] == "Invalid timestamp"
+    assert len(mock_ingest.call_args.args[0]) == 1
+
+
+@pytest.mark.django_db
+def test_text_batch_post_reports_too_long_items(api_factory, valid_payload):
+    too_long = [
+        dict(valid_payload, messaging_provider_id="msg-124", to="+1" + "5" * 30),
+        dict(valid_payload, messaging_provider_id="msg-125", type="t" * 11),
+        dict(valid_payload, messaging_provider_id="m" * 101),
+    ]
+    request = api_factory.post("/", [valid_payload] + too_long, format="json")
+    response = TextInboundBatchWebhook.as_view()(request)
+    assert response.status_code == status.HTTP_200_OK
+    results = response.data["results"]
+    assert results[0]["status"] == "created"
+    assert [result["error"] for result in results[1:]] == [
+        "Fields too long: to",
+        "Fields too long: type",
+        "Fields too long: provider_message_id",
+    ]
+    assert Message.objects.get().provider_message_id == "msg-123"
+
+
+@pytest.mark.django_db
+def test_post_stores_non_string_body(api_factory, valid_payload):
+    response = TextInboundWebhook.as_view()(
+        api_factory.post("/", dict(valid_payload, body=123), format="json")
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    message = Message.objects.get()
+    message.refresh_from_db()
+    assert message.body == "123"
+    assert message.conversation.last_message_preview == "123"
+
+
+@pytest.mark.django_db
+def test_text_batch_post_stores_non_string_body(api_factory, valid_payload):
+    payload = [
+        valid_payload,
+        dict(valid_payload, messaging_provider_id="msg-124", body=123),
+    ]
+    request = api_factory.post("/", payload, format="json")
+    response = TextInboundBatchWebhook.as_view()(request)
+    assert response.status_code == status.HTTP_200_OK
+    assert [result["status"] for result in response.data["results"]] == [
+        "created",
+        "created",
+    ]
+    assert Message.objects.get(provider_message_id="msg-124").body == "123"
+
+
+def test_text_batch_post_requires_list(api_factory, valid_payload):
+    request = api_factory.post("/", valid_payload, format="json")
+    view = TextInboundBatchWebhook.as_view()
+    response = view(request)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert "error" in response.data
+
+
+def test_text_batch_post_too_large(api_factory, valid_payload, settings):
+    settings.MESSAGING_INBOUND_BATCH_MAX_SIZE = 1
+    request = api_factory.post("/", [valid_payload, valid_payload], format="json")
+    view = TextInboundBatchWebhook.as_view()
+    response = view(request)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@patch("messaging.views.ingest_inbound_messages")
+def test_email_batch_post_success(mock_ingest, api_factory, valid_email_payload):
+    mock_ingest.return_value = ["created"]
+    request = api_factory.post("/", [valid_email_payload], format="json")
+    view = EmailInboundBatchWebhook.as_view()
+    response = view(request)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["created"] == 1
+    entries, field = mock_ingest.call_args.args
+    assert field == "email"
+    assert entries[0]["type"] == "email"
+    assert entries[0]["provider_message_id"] == "email-123"
+
+
+@pytest.mark.django_db
+@patch("messaging.views.enqueue_messages")
+def test_message_bulk_create_view(
+    mock_enqueue, api_factory, django_capture_on_commit_callbacks
+):
+    payload = {
+        "sender": "+10000000000",
+        "recipients": ["+10000000001", "+10000000002"],
+        "message_type": "sms",
+        "body": "Hello!",
+    }
+    request = api_factory.post("/", payload, format="json")
+    view = MessageBulkCreateView.as_view()
+    with django_capture_on_commit_callbacks(execute=True):
+        response = view(request)
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    assert response.data["count"] == 2
+    batch_id = response.data["batch_id"]
+    assert response.data["status_url"] == reverse(
+        "message_batch_detail", kwargs={"batch_id": batch_id}
+    )
+    (message_ids,) = mock_enqueue.call_args.args
+    assert set(message_ids) == set(
+        Message.objects.filter(batch_id=batch_id).values_list("id", flat=True)
+    )
+
+
+@pytest.mark.django_db
+@patch("messaging.views.enqueue_messages")
+def test_message_bulk_create_view_enqueues_chunks(
+    mock_enqueue, api_factory, django_capture_on_commit_callbacks, settings
+):
+    settings.MESSAGING_BULK_SEND_CHUNK_SIZE = 2
+    payload = {
+        "sender": "+10000000000",
+        "recipients": ["+10000000001", "+10000000002", "+10000000003"],
+        "message_type": "sms",
+        "body": "Hello!",
+    }
+    request = api_factory.post("/", payload, format="json")
+    with django_capture_on_commit_callbacks(execute=True):
+        response = MessageBulkCreateView.as_view()(request)
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    chunks = [call.args[0] for call in mock_enqueue.call_args_list]
+    assert [len(chunk) for chunk in chunks] == [2, 1]
+    assert set(chunks[0] + chunks[1]) == set(
+        Message.objects.filter(batch_id=response.data["batch_id"]).values_list(
+            "id", flat=True
+        )
+    )
+
+
+@pytest.mark.django_db
+@patch("messaging.views.enqueue_messages")
+def test_message_bulk_create_view_invalid_data(mock_enqueue, api_factory):
+    request = api_factory.post("/", {"sender": "+10000000000"}, format="json")
+    view = MessageBulkCreateView.as_view()
+    response = view(request)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert not mock_enqueue.called
+
+
+@pytest.mark.django_db
+@patch("messaging.views.enqueue_messages")
+def test_message_bulk_create_view_invalid_recipients(
+    mock_enqueue, api_factory, settings
+):
+    settings.MESSAGING_BULK_SEND_CHUNK_SIZE = 1
+    payload = {
+        "sender": "+15550001111",
+        "recipients": ["+15550002222", "+1" + "5" * 30, "not a number"],
+        "message_type": "sms",
+        "body": "Hello!",
+    }
+    request = api_factory.post("/", payload, format="json")
+    response = MessageBulkCreateView.as_view()(request)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert set(response.data["recipients"]) == {1, 2}
+    assert not Message.objects.exists()
+    assert not mock_enqueue.called
+
+
+@pytest.mark.django_db
+@patch("messaging.views.send_message")
+def test_message_create_view_address_too_long(mock_send_message, api_factory):
+    payload = {
+        "sender": "sender@example.com",
+        "recipient": "recipient@example.com" + "m" * 250,
+        "message_type": "email",
+        "body": "Hello!",
+    }
+    request = api_factory.post("/", payload, format="json")
+    response = MessageCreateView.as_view()(request)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert "recipient" in response.data
+    assert not mock_send_message.delay.called
+
+
+@pytest.mark.django_db
+def test_message_batch_detail_view(api_factory, participant_1, participant_2):
+    conversation = Conversation.objects.create(
+        participant_1=participant_1, participant_2=participant_2
+    )
+    batch_id = uuid.uuid4()
+    for message_status in ["SENT", "SENT", "FAILED"]:
+        Message.objects.create(
+            conversation=conversation,
+            sender=participant_1,
+            recipient=participant_2,
+            message_type="sms",
+            direction="outbound",
+            body="Hi",
+            status=message_status,
+            timestamp=timezone.now(),
+            batch_id=batch_id,
+        )
+    request = api_factory.get("/")
+    view = MessageBatchDetailView.as_view()
+    response = view(request, batch_id=batch_id)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["total"] == 3
+    assert response.data["statuses"] == {"SENT": 2, "FAILED": 1}
+
+
+@pytest.mark.django_db
+def test_message_batch_detail_view_not_found(api_factory):
+    request = api_factory.get("/")
+    view = MessageBatchDetailView.as_view()
+    response = view(request, batch_id=uuid.uuid4())
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def post_async(view_class, payload):
+    request = AsyncRequestFactory().post(
+        "/", json.dumps(payload), content_type="application/json"
+    )
+    return async_to_sync(view_class.as_view())(request)
+
+
+@pytest.mark.django_db
+def test_async_text_webhook_stores_message(valid_payload):
+    response = post_async(AsyncTextInboundWebhook, valid_payload)
+    assert response.status_code == status.HTTP_201_CREATED
+    assert json.loads(response.content) == {"detail": "Message received successfully"}
+    message = Message.objects.get(provider_message_id="msg-123")
+    assert message.sender.phone == "+0987654321"
+    assert message.direction == "inbound"
+
+    response = post_async(AsyncTextInboundWebhook, valid_payload)
+    assert response.status_code == status.HTTP_200_OK
+    assert json.loads(response.content) == {"detail": "Duplicate message"}
+
+
+@pytest.mark.django_db
+def test_async_email_webhook_stores_message(valid_email_payload):
+    response = post_async(AsyncEmailInboundWebhook, valid_email_payload)
+    assert response.status_code == status.HTTP_201_CREATED
+    message = Message.objects.get(provider_message_id="email-123")
+    assert message.message_type == "email"
+
+
+@patch("messaging.views.aingest_inbound_messages")
+def test_async_webhook_missing_fields(mock_ingest):
+    response = post_async(AsyncTextInboundWebhook, {"to": "+1234567890"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert json.loads(response.content) == {"error": "Missing required fields"}
+    assert not mock_ingest.called
+
+
+def test_async_webhook_invalid_json():
+    request = AsyncRequestFactory().post(
+        "/", "not json", content_type="application/json"
+    )
+    response = async_to_sync(AsyncTextInboundWebhook.as_view())(request)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@patch("messaging.views.ingest_inbound_messages")
+@patch("messaging.views.inbound_buffer")
+def test_post_buffers_message(
+    mock_buffer, mock_ingest, api_factory, valid_payload, settings
+):
+    settings.MESSAGING_INBOUND_BUFFER = True
+    request = api_factory.post("/", valid_payload, format="json")
+    response = TextInboundWebhook.as_view()(request)
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    field, (entry,) = mock_buffer.append.call_args.args
+    assert field == "phone"
+    assert entry["provider_message_id"] == "msg-123"
+    assert not mock_ingest.called
+
+
+@patch("messaging.views.ingest_inbound_messages")
+@patch("messaging.views.inbound_buffer")
+def test_post_stores_message_when_buffer_is_unavailable(
+    mock_buffer, mock_ingest, api_factory, valid_payload, settings
+):
+    settings.MESSAGING_INBOUND_BUFFER = True
+    mock_buffer.append.side_effect = redis.ConnectionError()
+    mock_ingest.return_value = ["created"]
+    request = api_factory.post("/", valid_payload, format="json")
+    response = TextInboundWebhook.as_view()(request)
+    assert response.status_code == status.HTTP_201_CREATED
+    assert mock_ingest.called
+
+
+@patch("messaging.views.inbound_buffer")
+def test_batch_post_buffers_valid_messages(
+    mock_buffer, api_factory, valid_payload, settings
+):
+    settings.MESSAGING_INBOUND_BUFFER = True
+    request = api_factory.post("/", [valid_payload, {"to": "x"}], format="json")
+    response = TextInboundBatchWebhook.as_view()(request)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["accepted"] == 1
+    assert response.data["errors"] == 1
+    _, entries = mock_buffer.append.call_args.args
+    assert len(entries) == 1
+
+
+@patch("messaging.views.inbound_buffer")
+def test_async_webhook_buffers_message(mock_buffer, valid_payload, settings):
+    settings.MESSAGING_INBOUND_BUFFER = True
+    response = post_async(AsyncTextInboundWebhook, valid_payload)
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    assert mock_buffer.append.called
@@ -0,0 +1,124 @@
+"""
+Distributed tracing with OpenTelemetry.
+
+When MESSAGING_TRACING_EXPORTER is set, every process (web, Celery workers,
+commands) instruments Django, Celery, psycopg2 and httpx when the app is
+loaded:
+
+- a request to the API starts a trace, e.g. at MessageCreateView.post,
+- send_message.delay publishes the trace context in the headers of the
+  Celery message, and the worker continues the trace when it runs the task,
+- the worker's spans cover every query of the task and the request to the
+  provider.
+
+The time a message waits in the broker is the gap between the
+"apply_async/send_message" span and the "run/send_message" span.
+
+Sampling is decided at the root of each trace with
+MESSAGING_TRACING_SAMPLE_RATE, and the other services follow the decision
+carried by the trace context, so traces are kept or dropped as a whole.
+Dropped spans are not recorded, which bounds the overhead in production.
+When tracing is disabled nothing is instrumented.
+"""
+
+import logging
+import os
+import sys
+
+from django.conf import settings
+from opentelemetry import trace
+from opentelemetry.instrumentation.celery import CeleryInstrumentor
+from opentelemetry.instrumentation.django import DjangoInstrumentor
+from opentelemetry.instrumentation.httpx import HTTPXClientInstrumentor
+from opentelemetry.instrumentation.psycopg2 import Psycopg2Instrumentor
+from opentelemetry.sdk.resources import SERVICE_NAME, Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+logger = logging.getLogger(__name__)
+
+EXPORTERS = {"console", "file"}
+INSTRUMENTORS = [
+    DjangoInstrumentor,
+    CeleryInstrumentor,
+    Psycopg2Instrumentor,
+    HTTPXClientInstrumentor,
+]
+
+
+def build_exporter(name, path=None):
+    """
+    :param name: "console" to write the spans to the standard output, or
+        "file" to append them to `path`, one JSON object per line.
+    :return: A SpanExporter.
+    :raises ValueError: If the exporter is unknown.
+    """
+    if name not in EXPORTERS:
+        raise ValueError(f"Unknown tracing exporter {name!r}")
+    if name == "console":
+        return ConsoleSpanExporter(out=sys.stdout)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # Line buffered, so the processes sharing the file append whole lines
+    return ConsoleSpanExporter(
+        out=open(path, "a", buffering=1),
+        formatter=lambda span: span.to_json(indent=None) + "\n",
+    )
+
+
+def build_tracer_provider(exporter, sample_rate=1.0, service_name="hatch-messaging"):
+    """
+    :param exporter: The SpanExporter the sampled spans are sent to, in
+        batches from a background thread.
+    :param sample_rate: Share of the traces started here that are sampled,
+        between 0 and 1. Spans with a parent follow the parent's decision.
+    :param service_name: The service.name of the spans.
+    :return: A TracerProvider.
+    """
+    provider = TracerProvider(
+        resource=Resource.create({SERVICE_NAME: service_name}),
+        sampler=ParentBased(TraceIdRatioBased(sample_rate)),
+    )
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    return provider
+
+
+def instrument(tracer_provider):
+    """
+    Instrument Django, Celery, psycopg2 and httpx to create their spans with
+    tracer_provider. Django must be instrumented before its middleware is
+    loaded, and httpx before the provider clients are created.
+    """
+    for instrumentor in INSTRUMENTORS:
+        instrumentor().instrument(tracer_provider=tracer_provider)
+
+
+def uninstrument():
+    for instrumentor in INSTRUMENTORS:
+        instrumentor().uninstrument()
+
+
+def configure_tracing():
+    """
+    Set up tracing as configured by the MESSAGING_TRACING_* settings. Does
+    nothing when MESSAGING_TRACING_EXPORTER is empty.
+
+    :return: The TracerProvider, or None when tracing is disabled.
+    """
+    if not settings.MESSAGING_TRACING_EXPORTER:
+        return None
+    provider = build_tracer_provider(
+        build_exporter(
+            settings.MESSAGING_TRACING_EXPORTER, settings.MESSAGING_TRACING_FILE
+        ),
+        sample_rate=settings.MESSAGING_TRACING_SAMPLE_RATE,
+        service_name=settings.MESSAGING_TRACING_SERVICE_NAME,
+    )
+    trace.set_tracer_provider(provider)
+    instrument(provider)
+    logger.info(
+        "Tracing to %s, sampling %s of the traces",
+        settings.MESSAGING_TRACING_EXPORTER,
+        settings.MESSAGING_TRACING_SAMPLE_RATE,
+    )
+    return provider
@@ -2,14 +2,22 @@ from django.urls import path
 from messaging.views import (
     TextInboundWebhook,
     EmailInboundWebhook,
+    TextInboundBatchWebhook,
+    EmailInboundBatchWebhook,
+    AsyncTextInboundWebhook,
+    AsyncEmailInboundWebhook,
     MessageListView,
     MessageDetailView,
     MessageDeleteView,
     MessageCreateView,
+    MessageBulkCreateView,
+    MessageBatchDetailView,
+    MessageExportView,
     ConversationListView,
     ConversationDetailView,
     ConversationDeleteView,
     ConversationMessagesView,
+    ParticipantInboxView,
 )
 
 urlpatterns = [
@@ -24,6 +32,26 @@ urlpatterns = [
         EmailInboundWebhook.as_view(),
         name="email_inbound_webhook",
     ),
+    path(
+        "webhook/text/inbound/batch/",
+        TextInboundBatchWebhook.as_view(),
+        name="text_inbound_batch_webhook",
+    ),
+    path(
+        "webhook/email/inbound/batch/",
+        EmailInboundBatchWebhook.as_view(),
+        name="email_inbound_batch_webhook",
+    ),
+    path(
+        "webhook/text/inbound/async/",
+        AsyncTextInboundWebhook.as_view(),
+        name="text_inbound_async_webhook",
+    ),
+    path(
+        "webhook/email/inbound/async/",
+        AsyncEmailInboundWebhook.as_view(),
+        name="email_inbound_async_webhook",
+    ),
     # Message management views
     path("messages/", MessageListView.as_view(), name="message_list"),
     path("messages/<uuid:id>/", MessageDetailView.as_view(), name="message_detail"),
@@ -31,6 +59,13 @@ urlpatterns = [
         "messages/<uuid:id>/delete/", MessageDeleteView.as_view(), name="message_delete"
     ),
     path("messages/create/", MessageCreateView.as_view(), name="message_create"),
+    path("messages/bulk/", MessageBulkCreateView.as_view(), name="message_bulk_create"),
+    path(
+        "messages/batches/<uuid:batch_id>/",
+        MessageBatchDetailView.as_view(),
+        name="message_batch_detail",
+    ),
+    path("messages/export/", MessageExportView.as_view(), name="message_export"),
     # Conversation management views
     path("conversations/", ConversationListView.as_view(), name="conversation-list"),
     path(
@@ -48,4 +83,9 @@ urlpatterns = [
         ConversationMessagesView.as_view(),
         name="conversation-messages",
     ),
+    path(
+        "participants/conversations/",
+        ParticipantInboxView.as_view(),
+        name="participant-inbox",
+    ),
 ]
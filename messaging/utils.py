@@ -1,20 +1,162 @@
-from messaging.models import Participant, Conversation
+import asyncio
+import uuid
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+
+from messaging import summaries
+from messaging.cache import resolution_cache
+from messaging.models import (
+    Participant,
+    Conversation,
+    ConversationParticipant,
+    Message,
+    ProviderMessageKey,
+)
+
+# How many times a lookup is repeated when a concurrent transaction inserted the
+# row between the start of the statement and the conflict check.
+UPSERT_ATTEMPTS = 3
+
+
+def _insert_sql(objs, conflict_fields, raw=False):
+    """
+    Build an `INSERT ... ON CONFLICT (...) DO NOTHING` statement for objs.
+    Field values are prepared the same way as by Model.save, including
+    Python-side defaults and auto_now_add.
+
+    :param objs: Unsaved instances of the same model.
+    :param conflict_fields: Names of the fields of the unique constraint, or
+        None to skip the rows conflicting on any unique constraint.
+    :param raw: Insert the values of objs as they are, without auto_now_add,
+        e.g. to restore archived rows.
+    :return: A tuple of (sql, params).
+    """
+    meta = objs[0]._meta
+    fields = meta.concrete_fields
+    quote = connection.ops.quote_name
+    columns = ", ".join(quote(field.column) for field in fields)
+    row = "(" + ", ".join(["%s"] * len(fields)) + ")"
+    params = [
+        field.get_db_prep_save(
+            getattr(obj, field.attname) if raw else field.pre_save(obj, add=True),
+            connection,
+        )
+        for obj in objs
+        for field in fields
+    ]
+    conflict = ", ".join(
+        quote(meta.get_field(name).column) for name in conflict_fields or []
+    )
+    target = f"({conflict}) " if conflict else ""
+    sql = (
+        f"INSERT INTO {quote(meta.db_table)} ({columns}) "
+        f"VALUES {', '.join([row] * len(objs))} "
+        f"ON CONFLICT {target}DO NOTHING"
+    )
+    return sql, params
+
+
+def _key(obj, conflict_fields):
+    return tuple(
+        getattr(obj, obj._meta.get_field(name).attname) for name in conflict_fields
+    )
+
+
+def upsert(objs, conflict_fields):
+    """
+    Insert objs, or get the existing rows when they conflict on conflict_fields.
+
+    The insert and the lookup of the existing rows are one statement:
+
+        WITH inserted AS (INSERT ... ON CONFLICT DO NOTHING RETURNING ...)
+        SELECT ... FROM inserted
+        UNION ALL SELECT ... FROM table WHERE (conflict fields) IN (...)
+
+    so there is no window between a check and an insert where a concurrent
+    request can create the same row. A row inserted by a transaction that
+    commits while the statement runs is not visible to it; such rows are
+    looked up again with a new statement.
+
+    :param objs: Unsaved instances of the same model, unique on conflict_fields.
+    :param conflict_fields: Names of the fields of a unique constraint.
+    :return: Dict mapping the conflict_fields values of each obj to its row.
+    :raises IntegrityError: If a row can't be found after UPSERT_ATTEMPTS.
+    """
+    model = objs[0]._meta.model
+    meta = model._meta
+    quote = connection.ops.quote_name
+    columns = ", ".join(quote(field.column) for field in meta.concrete_fields)
+    conflict_columns = ", ".join(
+        quote(meta.get_field(name).column) for name in conflict_fields
+    )
+    conflict_row = "(" + ", ".join(["%s"] * len(conflict_fields)) + ")"
+
+    rows = {}
+    pending = list({_key(obj, conflict_fields): obj for obj in objs}.values())
+    for _ in range(UPSERT_ATTEMPTS):
+        insert_sql, params = _insert_sql(pending, conflict_fields)
+        keys = [_key(obj, conflict_fields) for obj in pending]
+        sql = (
+            f"WITH inserted AS ({insert_sql} RETURNING {columns}) "
+            f"SELECT {columns} FROM inserted "
+            f"UNION ALL SELECT {columns} FROM {quote(meta.db_table)} "
+            f"WHERE ({conflict_columns}) IN ({', '.join([conflict_row] * len(keys))})"
+        )
+        params += [
+            field.get_db_prep_value(value, connection)
+            for key in keys
+            for field, value in zip(
+                [meta.get_field(name) for name in conflict_fields], key
+            )
+        ]
+        for row in model.objects.raw(sql, params):
+            rows[_key(row, conflict_fields)] = row
+        pending = [obj for obj in pending if _key(obj, conflict_fields) not in rows]
+        if not pending:
+            return rows
+    raise IntegrityError(
+        f"Could not insert or find {len(pending)} {meta.model_name} rows"
+    )
+
+
+def insert_ignore_conflicts(objs, conflict_fields, raw=False):
+    """
+    Insert objs in one statement, skipping the ones that conflict on conflict_fields.
+
+    :param objs: Unsaved instances of the same model.
+    :param conflict_fields: Names of the fields of a unique constraint, or
+        None for any unique constraint.
+    :param raw: Insert the values of objs as they are, see _insert_sql.
+    :return: Set of the primary keys of the inserted rows.
+    """
+    if not objs:
+        return set()
+    meta = objs[0]._meta
+    insert_sql, params = _insert_sql(objs, conflict_fields, raw)
+    pk_column = connection.ops.quote_name(meta.pk.column)
+    with connection.cursor() as cursor:
+        cursor.execute(f"{insert_sql} RETURNING {pk_column}", params)
+        return {meta.pk.to_python(row[0]) for row in cursor.fetchall()}
 
 
 def resolve_participant(phone=None, email=None):
     """
     Resolve a participant by phone or email.
-    If both phone and email are provided, it will return the first match found.
+    If both phone and email are provided, it will resolve the participant by phone.
     If neither is provided, it raises a ValueError.
+    The participant is created if it doesn't exist yet, see upsert.
     :param phone: Phone number of the participant.
     :param email: Email address of the participant.
-    :return: Participant object if found, otherwise None.
+    :return: Participant object.
     :raises ValueError: If neither phone nor email is provided.
     """
     if phone:
-        return Participant.objects.get_or_create(phone=phone)[0]
+        return resolve_participants("phone", [phone])[phone]
     if email:
-        return Participant.objects.get_or_create(email=email)[0]
+        return resolve_participants("email", [email])[email]
     raise ValueError("Either phone or email must be provided to resolve a participant.")
 
 
@@ -27,13 +169,261 @@ def resolve_conversation(participant_1, participant_2):
         participant_2: An object representing the second participant, expected to have an 'id' attribute.
 
     Returns:
-        A tuple of (Conversation instance, created), where 'created' is a boolean indicating whether a new Conversation was created.
+        The Conversation instance.
 
     Raises:
-        Conversation.MultipleObjectsReturned: If multiple Conversation objects are found for the given participants.
-        Conversation.DoesNotExist: If no Conversation object exists and creation fails.
+        IntegrityError: If the Conversation can neither be created nor found, see upsert.
+    """
+    pair = tuple(sorted([participant_1.id, participant_2.id]))
+    return resolve_conversations([pair])[pair]
+
+
+def cache_resolved(mapping):
+    """
+    Store resolved ids in the resolution cache once they are committed.
+    Inside a transaction the rows may still be rolled back, and a cached id
+    of a missing row would break every later message to that address, so the
+    cache is only written when the transaction commits.
+
+    :param mapping: Dict of cache keys to ids.
+    """
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: resolution_cache.set_many(mapping))
+    else:
+        resolution_cache.set_many(mapping)
+
+
+def resolve_participants(field, values):
+    """
+    Resolve many participants at once by phone or email.
+    Participants are looked up in the resolution cache first. Missing
+    participants are created and existing ones are fetched in a single
+    statement, see upsert. Participants from the cache only have their id and
+    the resolved field loaded, other fields are fetched on access.
+    :param field: Either "phone" or "email".
+    :param values: Iterable of phone numbers or email addresses.
+    :return: Dict mapping each value to its Participant object.
+    :raises ValueError: If field is not "phone" or "email".
+    """
+    if field not in ("phone", "email"):
+        raise ValueError("Participants can only be resolved by phone or email.")
+    values = {value for value in values if value}
+    if not values:
+        return {}
+
+    keys = {resolution_cache.participant_key(field, value): value for value in values}
+    participants = {
+        keys[key]: Participant.from_db(
+            connection.alias, ["id", field], [uuid.UUID(participant_id), keys[key]]
+        )
+        for key, participant_id in resolution_cache.get_many(keys).items()
+    }
+    missing = values - participants.keys()
+    if missing:
+        rows = upsert([Participant(**{field: value}) for value in missing], [field])
+        cache_resolved(
+            {
+                resolution_cache.participant_key(field, key[0]): str(participant.id)
+                for key, participant in rows.items()
+            }
+        )
+        participants.update({key[0]: participant for key, participant in rows.items()})
+    return participants
+
+
+def resolve_conversations(pairs):
+    """
+    Retrieves or creates Conversation instances for many pairs of participant IDs.
+
+    Each pair is sorted the same way as in resolve_conversation, so the order of
+    the participants within a pair does not matter. Conversations are looked up
+    in the resolution cache first. Missing conversations are created and
+    existing ones are fetched in a single statement, see upsert, then their
+    ConversationParticipant rows are inserted in another one.
+
+    Args:
+        pairs: Iterable of (participant_id, participant_id) tuples.
+
+    Returns:
+        A dict mapping each sorted (participant_1_id, participant_2_id) tuple to its Conversation.
+    """
+    pairs = {tuple(sorted(pair)) for pair in pairs}
+    if not pairs:
+        return {}
+
+    keys = {resolution_cache.conversation_key(*pair): pair for pair in pairs}
+    conversations = {
+        keys[key]: Conversation.from_db(
+            connection.alias,
+            ["id", "participant_1_id", "participant_2_id"],
+            [uuid.UUID(conversation_id), *keys[key]],
+        )
+        for key, conversation_id in resolution_cache.get_many(keys).items()
+    }
+    missing = pairs - conversations.keys()
+    if missing:
+        rows = upsert(
+            [
+                Conversation(participant_1_id=first, participant_2_id=second)
+                for first, second in missing
+            ],
+            ["participant_1", "participant_2"],
+        )
+        insert_ignore_conflicts(
+            [
+                ConversationParticipant(
+                    conversation=conversation,
+                    participant_id=participant_id,
+                    last_activity=conversation.last_activity,
+                )
+                for conversation in rows.values()
+                for participant_id in {
+                    conversation.participant_1_id,
+                    conversation.participant_2_id,
+                }
+            ],
+            ["participant", "conversation"],
+        )
+        cache_resolved(
+            {
+                resolution_cache.conversation_key(*pair): str(conversation.id)
+                for pair, conversation in rows.items()
+            }
+        )
+        conversations.update(rows)
+    return conversations
+
+
+def ingest_inbound_messages(entries, field):
+    """
+    Store a batch of inbound messages with a fixed number of statements.
+
+    Participants and conversations for the whole batch are resolved with
+    resolve_participants and resolve_conversations, then all messages are
+    inserted with a single `INSERT ... ON CONFLICT (provider_message_id) DO
+    NOTHING RETURNING id`, so duplicates are skipped without a check-then-act
+    race between concurrent deliveries of the same message. The summaries of
+    their conversations are updated in the same transaction, see
+    messaging.summaries.
+
+    :param entries: List of dicts with the keys "to", "from", "type", "body",
+        "provider_message_id", "attachments" and "timestamp".
+    :param field: Participant field the addresses refer to, "phone" or "email".
+    :return: List with one status per entry, in order: "created" or "duplicate".
+    """
+    if not entries:
+        return []
+
+    participants = resolve_participants(
+        field,
+        [entry["to"] for entry in entries] + [entry["from"] for entry in entries],
+    )
+    conversations = resolve_conversations(
+        (participants[entry["to"]].id, participants[entry["from"]].id)
+        for entry in entries
+    )
+
+    messages = []
+    results = []
+    seen = set()
+    for entry in entries:
+        # The same provider message can appear twice in one batch
+        if entry["provider_message_id"] in seen:
+            results.append(None)
+            continue
+        seen.add(entry["provider_message_id"])
+
+        reciever_participant = participants[entry["to"]]
+        sender_participant = participants[entry["from"]]
+        pair = tuple(sorted([reciever_participant.id, sender_participant.id]))
+        message = Message(
+            conversation=conversations[pair],
+            sender=sender_participant,
+            recipient=reciever_participant,
+            message_type=entry["type"],
+            direction="inbound",
+            body=entry["body"],
+            provider_message_id=entry["provider_message_id"],
+            attachments=entry["attachments"],
+            status="RECIEVED",
+            timestamp=entry["timestamp"],
+        )
+        messages.append(message)
+        results.append(message)
+
+    with transaction.atomic():
+        if settings.MESSAGING_PARTITIONED_MESSAGES:
+            inserted = insert_with_provider_keys(messages)
+        else:
+            inserted = insert_ignore_conflicts(messages, ["provider_message_id"])
+        summaries.add_messages(
+            [message for message in messages if message.id in inserted]
+        )
+    return [
+        "created" if message is not None and message.id in inserted else "duplicate"
+        for message in results
+    ]
+
+
+def insert_with_provider_keys(messages):
+    """
+    Insert inbound messages, skipping those whose provider_message_id is
+    already known, for a partitioned message table (see messaging.partitions).
+
+    The keys are inserted in ProviderMessageKey with `ON CONFLICT DO NOTHING`,
+    then only the messages whose key was inserted, in one transaction. A
+    concurrent insert of the same key waits for this transaction, so the
+    message is stored once, and not at all if this transaction rolls back.
+
+    :param messages: Unsaved Message instances with a provider_message_id.
+    :return: Set of the ids of the inserted messages.
+    """
+    if not messages:
+        return set()
+    with transaction.atomic():
+        keys = insert_ignore_conflicts(
+            [
+                ProviderMessageKey(
+                    provider_message_id=message.provider_message_id,
+                    message_id=message.id,
+                )
+                for message in messages
+            ],
+            ["provider_message_id"],
+        )
+        inserted = [
+            message for message in messages if message.provider_message_id in keys
+        ]
+        Message.objects.bulk_create(inserted)
+    return {message.id for message in inserted}
+
+
+async def aingest_inbound_messages(entries, field):
+    """
+    Async version of ingest_inbound_messages, for async views.
+
+    The upserts run in a worker thread the same way as the async methods of
+    the Django ORM (acreate, aget_or_create...), which are not used here as
+    they would bring back the check-then-act race the upserts avoid. Every
+    such thread opens its own database connection, so at most
+    MESSAGING_ASYNC_DB_CONCURRENCY ingestions run at once per event loop, the
+    others wait on the loop without holding a thread or a connection.
+    """
+    async with _db_slots():
+        return await sync_to_async(ingest_inbound_messages)(entries, field)
+
+
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def _db_slots():
+    """
+    :return: The semaphore bounding the database work of the running event loop.
     """
-    conversations = sorted([participant_1.id, participant_2.id])
-    return Conversation.objects.get_or_create(
-        participant_1_id=conversations[0], participant_2_id=conversations[1]
-    )[0]
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _semaphores[loop] = asyncio.Semaphore(
+            settings.MESSAGING_ASYNC_DB_CONCURRENCY
+        )
+    return semaphore
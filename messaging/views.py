@@ -1,22 +1,143 @@
+import json
+import logging
+import time
+
+import redis
+from asgiref.sync import sync_to_async
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import generics, status
+from rest_framework.exceptions import ValidationError
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import Count, Q, Subquery
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
 from django.utils.dateparse import parse_datetime
 from django.utils import timezone
-
-from .utils import resolve_participant, resolve_conversation
-from .models import Conversation, Message, Participant
+from django.views import View
+from opentelemetry import trace
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from . import metrics, summaries
+from .buffer import inbound_buffer
+from .export import CONTENT_TYPES, aiterate, export_messages
+from .utils import aingest_inbound_messages, ingest_inbound_messages
+from .models import Conversation, ConversationParticipant, Message, Participant
+from .pagination import (
+    ConversationPagination,
+    InboxPagination,
+    TimelinePagination,
+)
 from .serializers import (
     MessageSerializer,
     MessageCreateSerializer,
+    MessageBulkCreateSerializer,
+    MessageExportSerializer,
     ConversationSerializer,
 )
-from .tasks import send_message
+from .tasks import enqueue_messages, send_message
+
+logger = logging.getLogger(__name__)
+
+
+class InboundWebhook(APIView):
+    """
+    Base APIView for the inbound message webhooks.
+    Subclasses set `field` to the Participant field the addresses refer to and
+    implement `parse_entry(data)`, which turns a provider payload into a
+    message entry for ingest_inbound_messages, or raises ValueError with the
+    error to report.
+    The duration of the requests and the outcome of every message are
+    recorded in the metrics, under the `metrics_name` of the webhook.
+    """
+
+    field = None
+    metrics_name = None
+
+    def check_lengths(self, entry):
+        """
+        Check that the values of an entry fit their columns, so one entry
+        can't fail the insert of a whole batch.
+
+        :raises ValueError: If a value is too long.
+        """
+        limits = {
+            "to": Participant._meta.get_field(self.field).max_length,
+            "from": Participant._meta.get_field(self.field).max_length,
+            "type": Message._meta.get_field("message_type").max_length,
+            "provider_message_id": Message._meta.get_field(
+                "provider_message_id"
+            ).max_length,
+        }
+        too_long = [
+            key for key, limit in limits.items() if len(str(entry[key])) > limit
+        ]
+        if too_long:
+            raise ValueError(f"Fields too long: {', '.join(too_long)}")
+
+    def dispatch(self, request, *args, **kwargs):
+        start = time.perf_counter()
+        response = super().dispatch(request, *args, **kwargs)
+        metrics.WEBHOOK_DURATION.labels(
+            self.metrics_name, response.status_code
+        ).observe(time.perf_counter() - start)
+        return response
+
+    def buffer(self, entries):
+        """
+        Append entries to the inbound buffer when MESSAGING_INBOUND_BUFFER is
+        enabled, so they are stored later by a consumer.
+
+        :return: True if the entries were buffered, False if they must be
+            stored now, because buffering is disabled or Redis is unavailable.
+        """
+        if not settings.MESSAGING_INBOUND_BUFFER:
+            return False
+        try:
+            inbound_buffer.append(self.field, entries)
+        except redis.RedisError:
+            logger.exception("Inbound buffer unavailable, storing messages directly")
+            return False
+        return True
+
+    def post(self, request):
+        try:
+            entry = self.parse_entry(request.data)
+        except ValueError as e:
+            metrics.count_inbound([(None, "error")])
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if self.buffer([entry]):
+            metrics.count_inbound([(entry["type"], "accepted")])
+            return Response(
+                {"detail": "Message accepted"}, status=status.HTTP_202_ACCEPTED
+            )
+
+        # Participants, conversation and message are each resolved with a
+        # single upsert, duplicates are skipped by the message insert itself.
+        outcome = ingest_inbound_messages([entry], self.field)[0]
+        metrics.count_inbound([(entry["type"], outcome)])
+        if outcome == "duplicate":
+            return Response({"detail": "Duplicate message"}, status=status.HTTP_200_OK)
+
+        return Response(
+            {"detail": "Message received successfully"}, status=status.HTTP_201_CREATED
+        )
 
-# Create your views here.
+    @staticmethod
+    def parse_timestamp(timestamp_str):
+        # Timestamp may not always be provided, so default to current time
+        if not timestamp_str:
+            return timezone.now()
+        timestamp = parse_datetime(timestamp_str)
+        if timestamp is None:
+            raise ValueError("Invalid timestamp")
+        return timestamp
 
 
-class TextInboundWebhook(APIView):
+class TextInboundWebhook(InboundWebhook):
     """
     API endpoint to handle inbound text message webhooks.
     POST:
@@ -32,80 +153,47 @@ class TextInboundWebhook(APIView):
         Workflow:
             - Validates required fields.
             - Parses and defaults the timestamp if not provided.
-            - Prevents duplicate messages based on provider_message_id.
             - Resolves or creates Participant objects for sender and receiver.
             - Resolves or creates a Conversation between participants.
-            - Creates a Message record with the provided data.
+            - Inserts the Message unless one with the same provider_message_id
+              exists, in a single statement, so concurrent retries of the same
+              message by the provider can't both create it.
         Responses:
             - 201 Created: Message received and processed successfully.
+            - 202 Accepted: MESSAGING_INBOUND_BUFFER is enabled, the message
+              was buffered and will be stored by a consumer.
             - 200 OK: Duplicate message detected.
-            - 400 Bad Request: Missing required fields or invalid participant data.
+            - 400 Bad Request: Missing required fields or invalid timestamp.
     """
 
-    def post(self, request):
-        data = request.data
-
-        reciever = data.get("to")
-        sender = data.get("from")
-        _type = data.get("type")
-        body = data.get("body")
-        message_id = data.get("messaging_provider_id")
-        # Optional timestamp and attachments, may not always be provided
-        attachments = data.get("attachments")
-        timestamp_str = data.get("timestamp")
-
-        if not all([reciever, sender, _type, body, message_id]):
-            return Response(
-                {"error": "Missing required fields"}, status=status.HTTP_400_BAD_REQUEST
-            )
-
-        # Parse the timestamp
-        # Timestamp may not always be provided, so default to current time
-        timestamp = parse_datetime(timestamp_str) if timestamp_str else timezone.now()
-
-        # Prevent duplicate messages
-        if Message.objects.filter(provider_message_id=message_id).exists():
-            return Response({"detail": "Duplicate message"}, status=status.HTTP_200_OK)
-
-        # Resolve participants by phone
-        try:
-            reciever_participant = resolve_participant(phone=reciever)
-            sender_participant = resolve_participant(phone=sender)
-        except ValueError as e:
-            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
-        if not reciever_participant:
-            reciever_participant = Participant.objects.create(phone=reciever)
-        if not sender_participant:
-            sender_participant = Participant.objects.create(phone=sender)
-
-        # Create or get the conversation
-        conversation, _ = resolve_conversation(reciever_participant, sender_participant)
-
-        # Create the message
-        Message.objects.create(
-            conversation=conversation,
-            sender=sender_participant,
-            recipient=reciever_participant,
-            message_type=_type,
-            direction="inbound",
-            body=body,
-            provider_message_id=message_id,
-            attachments=attachments,
-            status="RECIEVED",
-            timestamp=timestamp,
-        )
-
-        return Response(
-            {"detail": "Message received successfully"}, status=status.HTTP_201_CREATED
-        )
-
-
-class EmailInboundWebhook(APIView):
+    field = "phone"
+    metrics_name = "text"
+
+    def parse_entry(self, data):
+        entry = {
+            "to": data.get("to"),
+            "from": data.get("from"),
+            "type": data.get("type"),
+            "body": data.get("body"),
+            "provider_message_id": data.get("messaging_provider_id"),
+            # Optional attachments, may not always be provided
+            "attachments": data.get("attachments"),
+        }
+        if not all(
+            entry[key] for key in ["to", "from", "type", "body", "provider_message_id"]
+        ):
+            raise ValueError("Missing required fields")
+        self.check_lengths(entry)
+        entry["timestamp"] = self.parse_timestamp(data.get("timestamp"))
+        return entry
+
+
+class EmailInboundWebhook(InboundWebhook):
     """
     APIView to handle inbound email webhooks.
     This view processes POST requests containing inbound email data, validates required fields,
-    prevents duplicate messages, resolves or creates participants, associates messages with conversations,
-    and stores the message in the database.
+    resolves or creates participants, associates messages with conversations,
+    and stores the message in the database unless it is a duplicate.
     Methods:
         post(request):
             Handles incoming POST requests with email data. Expects the following fields in the request data:
@@ -117,75 +205,206 @@ class EmailInboundWebhook(APIView):
                 - timestamp (optional): ISO-formatted timestamp string
             Returns:
                 - 201 Created: If the message is successfully processed and stored.
+                - 202 Accepted: If MESSAGING_INBOUND_BUFFER is enabled and the
+                  message was buffered, to be stored by a consumer.
                 - 200 OK: If a duplicate message is detected.
-                - 400 Bad Request: If required fields are missing or participant resolution fails.
+                - 400 Bad Request: If required fields are missing or the timestamp is invalid.
+    """
+
+    field = "email"
+    metrics_name = "email"
+
+    def parse_entry(self, data):
+        entry = {
+            "to": data.get("to"),
+            "from": data.get("from"),
+            "type": "email",
+            "body": data.get("body"),
+            "provider_message_id": data.get("xillio_id"),
+            # Optional attachments, may not always be provided
+            "attachments": data.get("attachments"),
+        }
+        if not all(entry[key] for key in ["to", "from", "body", "provider_message_id"]):
+            raise ValueError("Missing required fields")
+        self.check_lengths(entry)
+        entry["timestamp"] = self.parse_timestamp(data.get("timestamp"))
+        return entry
+
+
+class InboundBatchWebhook:
+    """
+    Mixin for webhooks that receive a list of inbound messages at once.
+    Combined with an InboundWebhook subclass, it parses every item with that
+    webhook's `parse_entry`. All valid entries are stored together by
+    ingest_inbound_messages, so the number of queries per request does not
+    grow with the size of the batch.
     """
 
     def post(self, request):
-        data = request.data
-
-        reciever = data.get("to")
-        sender = data.get("from")
-        _type = "email"
-        body = data.get("body")
-        message_id = data.get("xillio_id")
-        # Optional timestamp and attachments, may not always be provided
-        attachments = data.get("attachments")
-        timestamp_str = data.get("timestamp")
-
-        if not all([reciever, sender, body, message_id]):
+        payloads = request.data
+        if not isinstance(payloads, list):
+            return Response(
+                {"error": "Expected a list of messages"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(payloads) > settings.MESSAGING_INBOUND_BATCH_MAX_SIZE:
             return Response(
-                {"error": "Missing required fields"}, status=status.HTTP_400_BAD_REQUEST
+                {
+                    "error": "Too many messages, the maximum batch size is "
+                    f"{settings.MESSAGING_INBOUND_BATCH_MAX_SIZE}"
+                },
+                status=status.HTTP_400_BAD_REQUEST,
             )
 
-        # Parse the timestamp
-        # Timestamp may not always be provided, so default to current time
-        timestamp = parse_datetime(timestamp_str) if timestamp_str else timezone.now()
+        results = []
+        entries = []
+        for index, data in enumerate(payloads):
+            result = {"index": index}
+            try:
+                if not isinstance(data, dict):
+                    raise ValueError("Expected a message object")
+                entry = self.parse_entry(data)
+            except ValueError as e:
+                result.update({"status": "error", "error": str(e)})
+            else:
+                result["provider_message_id"] = entry["provider_message_id"]
+                entries.append((result, entry))
+            results.append(result)
+
+        if self.buffer([entry for _, entry in entries]):
+            statuses = ["accepted"] * len(entries)
+        else:
+            statuses = ingest_inbound_messages(
+                [entry for _, entry in entries], self.field
+            )
+        for (result, _), entry_status in zip(entries, statuses):
+            result["status"] = entry_status
+        metrics.count_inbound(
+            [(entry["type"], result["status"]) for result, entry in entries]
+            + [(None, "error")] * (len(results) - len(entries))
+        )
+
+        return Response(
+            {
+                "accepted": sum(r["status"] == "accepted" for r in results),
+                "created": sum(r["status"] == "created" for r in results),
+                "duplicates": sum(r["status"] == "duplicate" for r in results),
+                "errors": sum(r["status"] == "error" for r in results),
+                "results": results,
+            },
+            status=status.HTTP_200_OK,
+        )
 
-        # Prevent duplicate messages
-        if Message.objects.filter(provider_message_id=message_id).exists():
-            return Response({"detail": "Duplicate message"}, status=status.HTTP_200_OK)
 
-        # Resolve participants by phone
+class TextInboundBatchWebhook(InboundBatchWebhook, TextInboundWebhook):
+    """
+    API endpoint to handle batches of inbound text message webhooks.
+    POST:
+        Expects a JSON list where every item has the same fields as the payload
+        of TextInboundWebhook (to, from, type, body, messaging_provider_id and
+        the optional attachments and timestamp).
+        Responses:
+            - 200 OK: The batch was processed. The body contains the number of
+              created, duplicate and invalid messages, and a `results` list with
+              the index, provider_message_id and status ("created", "duplicate"
+              or "error") of every item. With MESSAGING_INBOUND_BUFFER enabled,
+              valid items are "accepted" and stored later.
+            - 400 Bad Request: The body is not a list or the batch is too large.
+    """
+
+    metrics_name = "text_batch"
+
+
+class EmailInboundBatchWebhook(InboundBatchWebhook, EmailInboundWebhook):
+    """
+    API endpoint to handle batches of inbound email webhooks.
+    POST:
+        Expects a JSON list where every item has the same fields as the payload
+        of EmailInboundWebhook (to, from, body, xillio_id and the optional
+        attachments and timestamp).
+        Responses:
+            - 200 OK: The batch was processed, see TextInboundBatchWebhook.
+            - 400 Bad Request: The body is not a list or the batch is too large.
+    """
+
+    metrics_name = "email_batch"
+
+
+class AsyncInboundWebhook(View):
+    """
+    Async variant of an InboundWebhook, served natively by an ASGI server.
+    The request is handled on the event loop, only the database statements of
+    aingest_inbound_messages run in a worker thread, so slow provider
+    connections don't each hold a thread. Payloads and responses are the same
+    as those of `webhook_class`.
+    """
+
+    webhook_class = None
+    http_method_names = ["post"]
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # Like the APIViews, webhooks are not protected by a CSRF token
+        view.csrf_exempt = True
+        return view
+
+    async def post(self, request):
+        start = time.perf_counter()
+        response = await self.handle(request)
+        metrics.WEBHOOK_DURATION.labels(
+            f"{self.webhook_class.metrics_name}_async", response.status_code
+        ).observe(time.perf_counter() - start)
+        return response
+
+    async def handle(self, request):
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            metrics.count_inbound([(None, "error")])
+            return JsonResponse({"error": "Invalid JSON"}, status=400)
         try:
-            reciever_participant = resolve_participant(email=reciever)
-            sender_participant = resolve_participant(email=sender)
+            if not isinstance(data, dict):
+                raise ValueError("Expected a message object")
+            entry = self.webhook_class().parse_entry(data)
         except ValueError as e:
-            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
-        if not reciever_participant:
-            reciever_participant = Participant.objects.create(email=reciever)
-        if not sender_participant:
-            sender_participant = Participant.objects.create(email=sender)
-
-        # Create or get the conversation
-        conversation, _ = resolve_conversation(reciever_participant, sender_participant)
-
-        # Create the message
-        Message.objects.create(
-            conversation=conversation,
-            sender=sender_participant,
-            recipient=reciever_participant,
-            message_type=_type,
-            direction="inbound",
-            body=body,
-            provider_message_id=message_id,
-            attachments=attachments,
-            status="RECIEVED",
-            timestamp=timestamp,
-        )
+            metrics.count_inbound([(None, "error")])
+            return JsonResponse({"error": str(e)}, status=400)
 
-        return Response(
-            {"detail": "Message received successfully"}, status=status.HTTP_201_CREATED
-        )
+        if await sync_to_async(self.webhook_class().buffer)([entry]):
+            metrics.count_inbound([(entry["type"], "accepted")])
+            return JsonResponse({"detail": "Message accepted"}, status=202)
+        statuses = await aingest_inbound_messages([entry], self.webhook_class.field)
+        metrics.count_inbound([(entry["type"], statuses[0])])
+        if statuses[0] == "duplicate":
+            return JsonResponse({"detail": "Duplicate message"}, status=200)
+        return JsonResponse({"detail": "Message received successfully"}, status=201)
+
+
+class AsyncTextInboundWebhook(AsyncInboundWebhook):
+    """
+    Async view of the inbound text message webhook, see TextInboundWebhook.
+    """
+
+    webhook_class = TextInboundWebhook
+
+
+class AsyncEmailInboundWebhook(AsyncInboundWebhook):
+    """
+    Async view of the inbound email webhook, see EmailInboundWebhook.
+    """
+
+    webhook_class = EmailInboundWebhook
 
 
 class MessageListView(generics.ListAPIView):
     """
     APIView to list messages.
-    This view retrieves all messages and returns them in a paginated format.
+    This view retrieves all messages and returns them in a paginated format,
+    ordered by creation time (see KeysetPagination).
     """
 
-    queryset = Message.objects.all()
+    queryset = Message.objects.select_related("sender", "recipient", "conversation")
     serializer_class = MessageSerializer
 
 
@@ -195,7 +414,7 @@ class MessageDetailView(generics.RetrieveAPIView):
     This view returns the details of a specific message.
     """
 
-    queryset = Message.objects.all()
+    queryset = Message.objects.select_related("sender", "recipient", "conversation")
     serializer_class = MessageSerializer
     lookup_field = "id"
 
@@ -210,6 +429,13 @@ class MessageDeleteView(generics.DestroyAPIView):
     serializer_class = MessageSerializer
     lookup_field = "id"
 
+    def perform_destroy(self, instance):
+        # delete() resets the id of the instance
+        message = (instance.conversation_id, instance.id)
+        with transaction.atomic():
+            instance.delete()
+            summaries.remove_messages([message])
+
 
 class MessageCreateView(generics.CreateAPIView):
     """
@@ -221,18 +447,158 @@ class MessageCreateView(generics.CreateAPIView):
         serializer = MessageCreateSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         message = serializer.save()
-        # Trigger the message sending task
+        trace.get_current_span().set_attribute("messaging.message_id", str(message.id))
+        # Trigger the message sending task, the trace continues in the worker
         send_message.delay(message.id)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
+class MessageBulkCreateView(APIView):
+    """
+    APIView to send one message to many recipients, or many messages, at once.
+    POST:
+        Expects either a fan-out payload:
+            - sender (str): The sender's phone number or email.
+            - recipients (list): Phone numbers or emails of the recipients.
+            - message_type (str): 'sms', 'mms' or 'email'.
+            - body (str): The message content.
+            - attachments (optional, list): Attachments sent to every recipient.
+        or a list of messages with the fields of MessageCreateSerializer:
+            - messages (list): The messages to send.
+        Messages are created in chunks of MESSAGING_BULK_SEND_CHUNK_SIZE,
+        each in its own transaction, and the delivery of each chunk is
+        enqueued as send_message_batch tasks once it is committed, so the
+        first messages are sent while the next ones are created.
+        Responses:
+            - 202 Accepted: The messages are queued. The body contains the
+              batch_id, the number of messages and the URL of the batch status.
+            - 400 Bad Request: Invalid payload.
+    """
+
+    def post(self, request):
+        serializer = MessageBulkCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        # Chunks are only sent once their messages are visible to the workers
+        messages = serializer.save(on_commit=enqueue_messages)
+        batch_id = messages[0].batch_id
+        return Response(
+            {
+                "batch_id": batch_id,
+                "count": len(messages),
+                "status_url": reverse(
+                    "message_batch_detail", kwargs={"batch_id": batch_id}
+                ),
+            },
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+
+class MessageBatchDetailView(APIView):
+    """
+    APIView to track the progress of a bulk send.
+    GET:
+        Returns the total number of messages of the batch and the number of
+        messages per status.
+        Responses:
+            - 200 OK: The batch status.
+            - 404 Not Found: No message has this batch_id.
+    """
+
+    def get(self, request, batch_id):
+        statuses = dict(
+            Message.objects.filter(batch_id=batch_id)
+            .order_by()
+            .values_list("status")
+            .annotate(count=Count("id"))
+        )
+        if not statuses:
+            raise Http404
+        return Response(
+            {
+                "batch_id": batch_id,
+                "total": sum(statuses.values()),
+                "statuses": statuses,
+            }
+        )
+
+
+class MessageExportView(View):
+    """
+    View to export messages as a file, streamed while they are read.
+    GET:
+        Optional query parameters:
+            - format (str): 'ndjson' (default) for one JSON object per line,
+              or 'csv'.
+            - conversation (uuid): Only the messages of this conversation.
+            - participant (uuid): Only the messages sent or received by this
+              participant.
+            - message_type (str): 'sms', 'mms' or 'email'.
+            - status (str): Only the messages with this status.
+            - since (str): Only messages sent or received at or after this
+              time (ISO 8601 format).
+            - until (str): Only messages sent or received before this time.
+        Messages of a conversation are ordered by timestamp. Other exports
+        are in no particular order, so they can start without sorting every
+        message first. Memory use doesn't depend on the number of messages,
+        see export_messages.
+        Responses:
+            - 200 OK: The messages, in the requested format.
+            - 400 Bad Request: Invalid parameters.
+    """
+
+    http_method_names = ["get"]
+
+    def get(self, request):
+        serializer = MessageExportSerializer(data=request.GET)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=400)
+        params = serializer.validated_data
+        export_format = params["format"]
+
+        content = export_messages(
+            self.filter_queryset(Message.objects.order_by(), params),
+            export_format,
+            settings.MESSAGING_EXPORT_CHUNK_SIZE,
+        )
+        if isinstance(request, ASGIRequest):
+            content = aiterate(content)
+        response = StreamingHttpResponse(
+            content, content_type=CONTENT_TYPES[export_format]
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="messages.{export_format}"'
+        )
+        return response
+
+    @staticmethod
+    def filter_queryset(queryset, params):
+        if "conversation" in params:
+            queryset = queryset.filter(conversation_id=params["conversation"]).order_by(
+                "timestamp", "id"
+            )
+        if "participant" in params:
+            queryset = queryset.filter(
+                Q(sender_id=params["participant"])
+                | Q(recipient_id=params["participant"])
+            )
+        for name in ("message_type", "status"):
+            if name in params:
+                queryset = queryset.filter(**{name: params[name]})
+        if "since" in params:
+            queryset = queryset.filter(timestamp__gte=params["since"])
+        if "until" in params:
+            queryset = queryset.filter(timestamp__lt=params["until"])
+        return queryset
+
+
 class ConversationListView(generics.ListAPIView):
-    queryset = Conversation.objects.all()
+    queryset = Conversation.objects.select_related("participant_1", "participant_2")
     serializer_class = ConversationSerializer
+    pagination_class = ConversationPagination
 
 
 class ConversationDetailView(generics.RetrieveAPIView):
-    queryset = Conversation.objects.all()
+    queryset = Conversation.objects.select_related("participant_1", "participant_2")
     serializer_class = ConversationSerializer
 
 
@@ -241,11 +607,108 @@ class ConversationDeleteView(generics.DestroyAPIView):
     serializer_class = ConversationSerializer
 
 
+class ParticipantInboxView(generics.ListAPIView):
+    """
+    APIView to list the conversations of a participant, most recent activity
+    first.
+    GET:
+        Query parameters, one of:
+            - phone (str): The phone number of the participant.
+            - email (str): The email address of the participant.
+        Conversations are read from the ConversationParticipant rows of the
+        participant, so a page is one query whichever side of the
+        conversations the participant is on.
+        Responses:
+            - 200 OK: A page of conversations, see InboxPagination. Empty for
+              an unknown participant.
+            - 400 Bad Request: Neither phone nor email given.
+    """
+
+    serializer_class = ConversationSerializer
+    pagination_class = InboxPagination
+
+    def get_queryset(self):
+        for field in ["phone", "email"]:
+            value = self.request.query_params.get(field)
+            if value:
+                # A subquery rather than a join, so the memberships are
+                # filtered on participant_id and read in index order
+                participant = Participant.objects.filter(**{field: value})
+                return ConversationParticipant.objects.select_related(
+                    "conversation"
+                ).filter(participant_id=Subquery(participant.values("id")))
+        raise ValidationError({"detail": "A phone or email is required"})
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(
+            [membership.conversation for membership in page], many=True
+        )
+        return self.get_paginated_response(serializer.data)
+
+
 class ConversationMessagesView(generics.ListAPIView):
+    """
+    APIView to list the messages of a conversation, ordered by timestamp.
+    GET:
+        Optional query parameters:
+            - since (str): Only messages sent or received at or after this
+              time (ISO 8601 format).
+            - until (str): Only messages sent or received before this time.
+        With a partitioned message table, the bounds restrict the query to
+        the partitions of that period.
+        Responses:
+            - 200 OK: A page of messages, see TimelinePagination.
+            - 400 Bad Request: Invalid since or until.
+    """
+
     serializer_class = MessageSerializer
+    pagination_class = TimelinePagination
 
     def get_queryset(self):
         conversation_id = self.kwargs["conversation_id"]
-        return Message.objects.filter(conversation_id=conversation_id).order_by(
-            "timestamp"
+        queryset = (
+            Message.objects.select_related("sender", "recipient", "conversation")
+            .filter(conversation_id=conversation_id)
+            .order_by("timestamp")
+        )
+        since = self.parse_bound("since")
+        if since is not None:
+            queryset = queryset.filter(timestamp__gte=since)
+        until = self.parse_bound("until")
+        if until is not None:
+            queryset = queryset.filter(timestamp__lt=until)
+        return queryset
+
+    def parse_bound(self, name):
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+        try:
+            # None when malformed, ValueError when out of range (e.g. month 13)
+            bound = parse_datetime(value)
+        except ValueError:
+            bound = None
+        if bound is None:
+            raise ValidationError({name: "Invalid timestamp"})
+        if timezone.is_naive(bound):
+            bound = timezone.make_aware(bound)
+        return bound
+
+
+class MetricsView(View):
+    """
+    View exposing the metrics in the Prometheus text format, see
+    messaging.metrics, with the depth of the queues read on every scrape.
+    GET:
+        Responses:
+            - 200 OK: The metrics.
+    """
+
+    http_method_names = ["get"]
+
+    def get(self, request):
+        return HttpResponse(
+            generate_latest(metrics.build_registry(queues=True)),
+            content_type=CONTENT_TYPE_LATEST,
         )